@@ -1,12 +1,63 @@
 import xml.etree.ElementTree as ET
 from os import makedirs
+from os.path import join, split, relpath
 
 import CppHeaderParser
 
 multiThreadArchicture=True
+# set USE_MESSAGE_RESERVE=true in the client or server config to serialize
+# directly into the buffer returned by message_reserve instead of calling
+# message_push_byte for every byte
+clientMessageReserve = False
+serverMessageReserve = False
+messageReserve = False
+# set GENERATE_ASYNC_FUNCTIONS=true in the client config to generate a
+# non-blocking foo_async variant of every function with an answer, requires
+# #pragma RPC pending_calls in the server header
+asyncFunctions = False
+# set POLL_ANSWERS=true in a client config with USE_SINGLE_TASK_ARCH=true to
+# let the functions wait for their answers by calling {prefix}poll_receive in a
+# loop instead of locking the answer mutexes
+pollAnswers = False
+# set STATIC_MESSAGE_BUFFERS=true in the client or server config to generate
+# the message_* functions with buffers of the maximum message sizes, then only
+# {prefix}send needs to be implemented
+clientStaticBuffers = False
+serverStaticBuffers = False
+# set DISPATCH_TABLE=true in the server config to generate a static handler
+# function per request and dispatch requests through a const table of them
+# instead of one switch
+dispatchTable = False
+# set REENTRANT_PARSER=true in the server config to pass an RPC_CONTEXT through
+# {prefix}parse_request to the {prefix}message_* functions so several threads
+# can parse requests at the same time
+serverReentrant = False
+# the context passed first to the {prefix}message_* functions, "context" while
+# generating the reentrant server parser
+messageContext = ""
+# set PARSE_CACHE_DIR in the server config to keep the parsed headers in that
+# directory, keyed by the hashes of the header and of the generator, so
+# unchanged headers are not parsed again, the code generated for each function
+# is kept there as well, see cachedFragment
+parseCacheDir = None
+# the settings the code generated for a function depends on besides the
+# function itself, part of the keys of the cached fragments
+fragmentSettings = ("multiThreadArchicture", "messageReserve", "asyncFunctions",
+                    "pollAnswers", "clientStaticBuffers", "serverStaticBuffers",
+                    "dispatchTable", "serverReentrant", "messageContext",
+                    "defines", "prefix", "projectname", "start_command_id",
+                    "version_number", "pendingCalls", "batchRequestID",
+                    "statisticsRequestID", "encoding", "functionEncodings",
+                    "functionZerocopyList", "maxPointerElements",
+                    "functionIgnoreList", "functionNoAnswerList")
+# the files generated by this run, see writeFile
+generatedFiles = []
 
 datatypes = {}
 datatypeDeclarations = []
+# integers whose memory layout on little endian machines equals the wire format
+fixedWidthIntegers = ("int16_t", "int32_t", "int64_t",
+                      "uint16_t", "uint32_t", "uint64_t")
 defines = {}
 currentFile = ""
 prefix = "RPC_"  # change prefix inside the header with #pragma RPC prefix EXAMPLE_
@@ -18,6 +69,34 @@ projectname = "RPC"
 start_command_id = 1
 # change version_number in the server header with #pragma RPC version_number 42
 version_number = 0
+# allow 8 calls waiting for their answers at the same time with #pragma RPC
+# pending_calls 8 in the server header. Requests and answers then carry a
+# correlation byte after the ID. A call fails if all pending calls are in use.
+pendingCalls = 0
+# send the requests of functions without answer in batches with the request ID
+# 254 with #pragma RPC batch_id 254 in the server header
+batchRequestID = 0
+# keep statistics of the calls of every function on both sides and read the
+# statistics of the server with the request ID 252 with #pragma RPC
+# statistics_id 252 in the server header, requires {prefix}clock
+statisticsRequestID = 0
+# send integers of at least 2 bytes as LEB128 varints with #pragma RPC encoding
+# varint in the server header, signed integers are zigzag encoded first. Append
+# a function name to only set the encoding of that function, for example
+# #pragma RPC encoding fixed foo keeps sending the integers of foo at full width.
+# #pragma RPC encoding packed lets consecutive integers and enums of less than
+# 8 bits, such as uint3_t, share bytes instead
+encoding = "fixed"
+functionEncodings = {}
+# #pragma RPC zerocopy foo lets the server pass input arrays and pointers of
+# foo that point to bytes or packed structs directly into the received message
+# instead of copying them, they must be declared const
+functionZerocopyList = []
+# allow pointers to hold at most 64 elements with #pragma RPC
+# max_pointer_elements 64, required by functions with pointer parameters since
+# the received elements are stored in arrays of that size, the server drops
+# requests with more elements and the client refuses to send them
+maxPointerElements = None
 
 functionIgnoreList = []
 functionNoAnswerList = []
@@ -25,7 +104,7 @@ functionPredefinedIDs = {}
 
 def evaluatePragmas(pragmas):
     for p in pragmas:
-        program, command = p.split(" ", 1)
+        program, _, command = p.partition(" ")  # such as pack(pop)
         if program == "RPC":
             try:
                 command, target = command.split(" ", 1)
@@ -39,6 +118,13 @@ def evaluatePragmas(pragmas):
                 functionIgnoreList.append(target)
             elif command == "noanswer":
                 functionNoAnswerList.append(target)
+            elif command == "zerocopy":
+                functionZerocopyList.append(target)
+            elif command == "max_pointer_elements":
+                global maxPointerElements
+                target = int(target)
+                assert target >= 0, "max_pointer_elements must not be negative"
+                maxPointerElements = target
             elif command == "prefix":
                 global prefix
                 prefix = target
@@ -71,9 +157,39 @@ where [functionname] is the name of a function in the header and [number] an eve
                 target = int(target)
                 assert target < 65536 and target >= 0, "version_number must be positive and less than 65536"
                 version_number = target
+            elif command == "pending_calls":
+                global pendingCalls
+                target = int(target)
+                assert target > 0 and target < 256, "pending_calls must be positive and less than 256"
+                pendingCalls = target
+            elif command == "batch_id":
+                global batchRequestID
+                target = int(target)
+                assert target >= 2, "batch_id must be at least 2"
+                assert target < 256, "batch_id must be less than 256"
+                assert target % 2 == 0, "batch_id must be even"
+                batchRequestID = target
+            elif command == "statistics_id":
+                global statisticsRequestID
+                target = int(target)
+                assert target >= 2, "statistics_id must be at least 2"
+                assert target < 256, "statistics_id must be less than 256"
+                assert target % 2 == 0, "statistics_id must be even"
+                statisticsRequestID = target
+            elif command == "encoding":
+                global encoding
+                target = target.split(" ")
+                assert len(target) <= 2 and target[0] in ("varint", "packed", "fixed"), \
+                    "Encoding pragma must have the form '#pragma RPC encoding varint|packed|fixed [functionname]'"
+                if len(target) == 2:
+                    functionEncodings[target[1]] = target[0]
+                else:
+                    encoding = target[0]
             else:
                 assert False, "Unknown preprocessor command #pragma RPC {} in {}".format(
                     command, currentFile)
+    assert not batchRequestID or batchRequestID != statisticsRequestID, \
+        "batch_id and statistics_id must differ"
 
 
 def calculateHash(filenames):
@@ -91,42 +207,195 @@ def calculateHash(filenames):
     return result, rh
 
 
-def getFilePaths():
+def writeFile(filename, content):
+    # writes content to the file unless it already has exactly that content,
+    # so build systems do not compile files that include unchanged files again
+    generatedFiles.append(filename)
+    mode = "b" if isinstance(content, bytes) else ""
+    try:
+        with open(filename, "r" + mode) as f:
+            if f.read() == content:
+                return
+    except (OSError, UnicodeDecodeError):
+        pass
+    with open(filename, "w" + mode) as f:
+        f.write(content)
+
+
+def getXmlContent(root, functions):
+    # returns the document of the root element with the already serialized
+    # functions spliced in as its children
+    rpc = ET.tostring(root, encoding="unicode", short_empty_elements=False)
+    return "<?xml version='1.0' encoding='UTF-8'?>\n{}{}</RPC>".format(
+        rpc[:-len("</RPC>")], "".join(functions)).encode("UTF-8")
+
+
+def getStampHash(inputs):
+    from hashlib import md5
+    hash = md5()
+    for fn in inputs:
+        hash.update(fn.encode("UTF-8"))
+        with open(fn, "rb") as f:
+            hash.update(f.read())
+    return hash.hexdigest()
+
+
+def isStampCurrent(stampfile, configs):
+    # returns whether the run that wrote the stamp file used the configs and
+    # the same contents of all its inputs and whether its outputs still exist
+    from os.path import isfile
+    try:
+        with open(stampfile, "r") as f:
+            lines = f.read().splitlines()
+        inputs = [l[len("input "):] for l in lines if l.startswith("input ")]
+        outputs = [l[len("output "):] for l in lines if l.startswith("output ")]
+        return (all(c in inputs for c in configs) and all(isfile(o) for o in outputs) and
+                "hash " + getStampHash(inputs) in lines)
+    except OSError:  # a missing stamp file or input
+        return False
+
+
+def writeStamp(stampfile, inputs, outputs):
+    writeFile(stampfile, "".join((
+        "# written by the RPC generator, delete this file to generate the outputs again\n",
+        "hash {}\n".format(getStampHash(inputs)),
+        "".join("input {}\n".format(fn) for fn in inputs),
+        "".join("output {}\n".format(fn) for fn in outputs))))
+
+
+class ParsedHeader(object):
+    # the parts of a CppHeaderParser.CppHeader the generator uses, stored in
+    # the parse cache
+    members = ("functions", "enums", "structs", "classes", "defines",
+               "includes", "pragmas")
+
+    def __init__(self, ast):
+        for member in self.members:
+            setattr(self, member, getattr(ast, member))
+
+
+def parseHeader(path):
+    # returns the parsed header at path, loaded from PARSE_CACHE_DIR if this
+    # version of the generator has parsed the same header before
+    if parseCacheDir is None:
+        return CppHeaderParser.CppHeader(path)
+    import pickle
+    from hashlib import md5
+    from os import replace, getpid
+    from os.path import join
+    key = md5()
+    for fn in (__file__, CppHeaderParser.__file__, path):
+        with open(fn, "rb") as f:
+            key.update(f.read())
+    cachefile = join(parseCacheDir, key.hexdigest() + ".pickle")
+    try:
+        with open(cachefile, "rb") as f:
+            return pickle.load(f)
+    except Exception:  # a missing or broken cache entry is parsed again
+        pass
+    ast = ParsedHeader(CppHeaderParser.CppHeader(path))
+    # write to a temporary file first so parallel runs never read a partial entry
+    tempfile = "{}.{}".format(cachefile, getpid())
+    with open(tempfile, "wb") as f:
+        pickle.dump(ast, f, pickle.HIGHEST_PROTOCOL)
+    replace(tempfile, cachefile)
+    return ast
+
+
+def getDescription(value):
+    # describes the value and everything it references, unlike a pickle the
+    # description does not depend on which of its parts are the same object
+    if isinstance(value, str):  # also the TagStr of CppHeaderParser
+        return repr(str(value))
+    if isinstance(value, dict):
+        return "{" + ", ".join(getDescription(k) + ": " + getDescription(v)
+                               for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(getDescription(v) for v in value) + "]"
+    if hasattr(value, "__dict__"):
+        return type(value).__name__ + getDescription(vars(value))
+    return repr(value)
+
+
+def loadFragments(function):
+    # loads the fragments an earlier run generated for the resolved function
+    # from PARSE_CACHE_DIR, the cache entry is named after the hashes of the
+    # generator and of everything the function has been resolved to, such as
+    # its ID, encoding, parameters and their types
+    import pickle
+    from hashlib import md5
+    from os.path import join
+    if not hasattr(loadFragments, "generator"):
+        with open(__file__, "rb") as f:
+            loadFragments.generator = md5(f.read()).digest()
+    key = md5(loadFragments.generator)
+    key.update(getDescription(function).encode("UTF-8"))
+    function.fragmentFile = join(parseCacheDir, key.hexdigest() + ".fragments")
+    function.fragmentsChanged = False
+    try:
+        with open(function.fragmentFile, "rb") as f:
+            function.fragments = pickle.load(f)
+    except Exception:  # a missing or broken cache entry is generated again
+        function.fragments = {}
+
+
+def saveFragments(functions):
+    # writes the cache entries of the functions that generated new fragments
+    import pickle
+    from os import replace, getpid
+    for function in functions:
+        if not getattr(function, "fragmentsChanged", False):
+            continue
+        tempfile = "{}.{}".format(function.fragmentFile, getpid())
+        with open(tempfile, "wb") as f:
+            pickle.dump(function.fragments, f, pickle.HIGHEST_PROTOCOL)
+        replace(tempfile, function.fragmentFile)
+
+
+def cachedFragment(method):
+    # decorates the methods of Function that generate code, with
+    # PARSE_CACHE_DIR they return the code generated for the same resolved
+    # function, arguments and settings in an earlier run, so after editing the
+    # header only the changed functions are generated again
+    def getFragment(self, *args):
+        if parseCacheDir is None or self.generated:
+            return method(self, *args)
+        if not hasattr(self, "fragments"):
+            loadFragments(self)
+        key = (method.__name__, args, repr(
+            tuple(globals()[setting] for setting in fragmentSettings)))
+        if key not in self.fragments:
+            self.fragments[key] = method(self, *args)
+            self.fragmentsChanged = True
+        return self.fragments[key]
+    return getFragment
+
+
+def getFilePaths(clientConfig=None, serverConfig=None):
+    # the first call gets the config files of the protocol to generate, later
+    # calls return the same result
     try:
         return getFilePaths.retval
     except AttributeError:
         pass
     # get paths for various files that need to be created. all created files start with prefix
-    # parse input
-    from argparse import ArgumentParser
-    parser = ArgumentParser()
-    parser.add_argument(
-        "ClientConfig",
-        help="Configuration file for the client",
-        type=str)
-    parser.add_argument(
-        "ServerConfig",
-        help="Configuration file for the server",
-        type=str)
-    args = parser.parse_args()
-
     # check if input is valid
     from os.path import isfile, abspath, split
     from os import chdir, makedirs
-    assert isfile(args.ClientConfig), "Error: Config file " + \
-        args.ClientConfig + " does not exist."
-    assert isfile(args.ServerConfig), "Error: Config file " + \
-        args.ServerConfig + " does not exist."
+    assert isfile(clientConfig), "Error: Config file " + \
+        clientConfig + " does not exist."
+    assert isfile(serverConfig), "Error: Config file " + \
+        serverConfig + " does not exist."
     from configparser import ConfigParser
 
-    clientconfigpath = abspath(args.ClientConfig)
-    serverconfigpath = abspath(args.ServerConfig)
+    clientconfigpath = abspath(clientConfig)
+    serverconfigpath = abspath(serverConfig)
 
     retval = {}
 
     # check client config for validity
     clientconfig = ConfigParser()
-    clientconfig.read(args.ClientConfig)
+    clientconfig.read(clientConfig)
 
     chdir(split(clientconfigpath)[0])
     retval["CLIENT_CONFIG_PATH"] = split(clientconfigpath)[0]
@@ -137,7 +406,23 @@ def getFilePaths():
             print("using single thread in client")
             global multiThreadArchicture
             multiThreadArchicture=False
-            
+    if "USE_MESSAGE_RESERVE" in clientconfig["configuration"]:
+        if clientconfig["configuration"]["USE_MESSAGE_RESERVE"].lower() == "true":
+            global clientMessageReserve
+            clientMessageReserve = True
+    if "STATIC_MESSAGE_BUFFERS" in clientconfig["configuration"]:
+        if clientconfig["configuration"]["STATIC_MESSAGE_BUFFERS"].lower() == "true":
+            global clientStaticBuffers
+            clientStaticBuffers = True
+    if "GENERATE_ASYNC_FUNCTIONS" in clientconfig["configuration"]:
+        if clientconfig["configuration"]["GENERATE_ASYNC_FUNCTIONS"].lower() == "true":
+            global asyncFunctions
+            asyncFunctions = True
+    if "POLL_ANSWERS" in clientconfig["configuration"]:
+        if clientconfig["configuration"]["POLL_ANSWERS"].lower() == "true":
+            global pollAnswers
+            pollAnswers = True
+
     if "DOCDIR" in clientconfig["configuration"]:
         makedirs(clientconfig["configuration"]['DOCDIR'], exist_ok=True)
         retval[
@@ -194,6 +479,34 @@ def getFilePaths():
             serverconfigpath + "\": No " + d + " specified. Abort."
         makedirs(serverconfig["configuration"][d], exist_ok=True)
         retval["SERVER_" + d] = abspath(serverconfig["configuration"][d])
+    if "USE_MESSAGE_RESERVE" in serverconfig["configuration"]:
+        if serverconfig["configuration"]["USE_MESSAGE_RESERVE"].lower() == "true":
+            global serverMessageReserve
+            serverMessageReserve = True
+    if "STATIC_MESSAGE_BUFFERS" in serverconfig["configuration"]:
+        if serverconfig["configuration"]["STATIC_MESSAGE_BUFFERS"].lower() == "true":
+            global serverStaticBuffers
+            serverStaticBuffers = True
+    if "DISPATCH_TABLE" in serverconfig["configuration"]:
+        if serverconfig["configuration"]["DISPATCH_TABLE"].lower() == "true":
+            global dispatchTable
+            dispatchTable = True
+    if "REENTRANT_PARSER" in serverconfig["configuration"]:
+        if serverconfig["configuration"]["REENTRANT_PARSER"].lower() == "true":
+            global serverReentrant
+            serverReentrant = True
+    if "STAMP_FILE" in serverconfig["configuration"]:
+        # the hash of the inputs of a run is recorded in STAMP_FILE, the next
+        # run with unchanged inputs then exits immediately
+        retval["STAMP_FILE"] = abspath(serverconfig["configuration"]["STAMP_FILE"])
+        retval["Unchanged"] = isStampCurrent(retval["STAMP_FILE"], (clientconfigpath, serverconfigpath))
+        if retval["Unchanged"]:
+            getFilePaths.retval = retval
+            return retval
+    if "PARSE_CACHE_DIR" in serverconfig["configuration"]:
+        global parseCacheDir
+        parseCacheDir = abspath(serverconfig["configuration"]["PARSE_CACHE_DIR"])
+        makedirs(parseCacheDir, exist_ok=True)
 
     global hashstring
     global rawhash
@@ -204,9 +517,18 @@ def getFilePaths():
          serverconfigpath,
          retval["ServerHeader"]))
 
-    ast = CppHeaderParser.CppHeader(
-        abspath(serverconfig["configuration"]["SOURCEHEADER"]))
-    evaluatePragmas(ast.pragmas)
+    # the pragmas need to be known before generating, the same parse result
+    # is used by generateCode for the types and functions
+    retval["ServerAST"] = parseHeader(retval["ServerHeader"])
+    evaluatePragmas(retval["ServerAST"].pragmas)
+    retval["Inputs"] = [abspath(__file__), CppHeaderParser.__file__, clientconfigpath,
+                        serverconfigpath, retval["ServerHeader"]] + [
+        abspath(getIncludeFilePath(i)) for i in retval["ServerAST"].includes
+        if isfile(getIncludeFilePath(i))]
+    assert not (multiThreadArchicture and pollAnswers), "Error in \"" + clientconfigpath + \
+        "\": POLL_ANSWERS requires USE_SINGLE_TASK_ARCH=true. Abort."
+    assert pendingCalls or not asyncFunctions, "Error in \"" + clientconfigpath + \
+        "\": GENERATE_ASYNC_FUNCTIONS requires #pragma RPC pending_calls in the server header. Abort."
     getFilePaths.retval = retval
     return getFilePaths.retval
 
@@ -215,10 +537,17 @@ def getDatatype(signature, file="???", line="???"):
     # print(10*"+")
     # print(signature)
     signatureList = signature.split(" ")
+    if signature not in datatypes and signature in defines and defines[
+            signature] in datatypes:
+        signature = defines[signature]
     if signature in datatypes:
-        return datatypes[signature]
-    if signature in defines and defines[signature] in datatypes:
-        return datatypes[defines[signature]]
+        datatype = datatypes[signature]
+        # integers of less than 8 bits are not standard, so the client needs
+        # their typedef
+        if isinstance(datatype, IntegralDatatype) and 0 < datatype.bits < 8 and \
+                datatype.getTypeDeclaration() not in datatypeDeclarations:
+            datatypeDeclarations.append(datatype.getTypeDeclaration())
+        return datatype
     if len(signatureList) == 2 and (signatureList[
             0] == "struct" or signatureList[0] == "enum"):
         assert signature in datatypes, 'Unknown type "{signature}" in {file}:{line}'.format(
@@ -247,6 +576,68 @@ def isVoidDatatype(datatype):
     except AttributeError:
         return False
 
+
+def getCursorDeclaration(indention):
+    # returns the declaration of the write cursor required by getMessageStart
+    # and getPushByte if the message is written through message_reserve
+    if not messageReserve:
+        return ""
+    return "{indention}unsigned char *{prefix}cursor;\n".format(
+        indention=indention * '\t',
+        prefix=prefix,
+    )
+
+
+def isVarintEncodingUsed():
+    # returns True if any function sends varints
+    return encoding == "varint" or "varint" in functionEncodings.values()
+
+
+def getHeaderSize():
+    # returns the number of bytes in front of the parameters of every message
+    return 2 if pendingCalls else 1
+
+
+def getMessageCall(function, argument=""):
+    # returns a call of {prefix}message_{function}, the reentrant server parser
+    # passes the context of the request first
+    return "{prefix}message_{function}({arguments})".format(
+        prefix=prefix,
+        function=function,
+        arguments=", ".join(a for a in (messageContext, argument) if a),
+    )
+
+
+def getMessageStart(messagesize, ID, indention, correlation="0"):
+    # returns code that starts a message of messagesize bytes and writes its ID
+    # and, if pending calls are enabled, the correlation byte
+    if messageReserve:
+        result = """{indention}{start};
+{indention}{prefix}cursor = {reserve};
+{indention}*{prefix}cursor++ = {ID}; /* save ID */"""
+    else:
+        result = """{indention}{start};
+{indention}{push}; /* save ID */"""
+    if pendingCalls:
+        result += "\n{indention}" + getPushByte(correlation) + " /* save correlation byte */"
+    return result.format(
+        indention=indention * '\t',
+        prefix=prefix,
+        ID=ID,
+        start=getMessageCall("start", str(messagesize)),
+        reserve=getMessageCall("reserve", str(messagesize)),
+        push=getMessageCall("push_byte", str(ID)),
+    )
+
+
+def getPushByte(expression):
+    # returns a statement that appends the byte expression to the current message
+    if messageReserve:
+        return "*{prefix}cursor++ = (unsigned char)({expression});".format(
+            prefix=prefix, expression=expression)
+    return getMessageCall("push_byte", "(unsigned char)({expression})".format(
+        expression=expression)) + ";"
+
 # Metatype describing what all datatypes must be capable of
 
 
@@ -262,6 +653,10 @@ class Datatype:
         # "i" -> "int i" or "ia" -> "int ia[32][47]"
         raise NotImplemented
 
+    def getParameterDeclaration(self, identifier):
+        # like declaration, but for a parameter of the generated functions
+        return self.declaration(identifier)
+
     def stringify(self, identifier, indention):
         # identifier is the name of the identifier we want to stringify, can be an expression
         # indention is the indention level of the code
@@ -275,6 +670,47 @@ class Datatype:
         # returns code that does the unstringifying
         raise NotImplemented
 
+    def stringifyRequest(self, identifier, indention):
+        # like stringify, but for requests which may differ from answers
+        # for example pure output pointers only send their number of elements
+        return self.stringify(identifier, indention)
+
+    def unstringifyRequest(self, source, identifier, indention):
+        # like unstringify, but for requests on the server side
+        return self.unstringify(source, identifier, indention)
+
+    def unstringifyIntoStorage(self, source, identifier, indention, reject="return;"):
+        # like unstringify, but the identifier is a local variable which
+        # has no memory for variable sized data yet, reject is the statement
+        # that drops a message with more elements than that memory holds
+        return self.unstringify(source, identifier, indention)
+
+    def getAddress(self, identifier):
+        # returns the expression that is registered as output location for
+        # the identifier, arrays decay to a pointer by themselves
+        return identifier
+
+    def getRequestSize(self):
+        # returns the number of bytes required to send this datatype in a request
+        return self.getSize()
+
+    def getSkipCode(self, buffer, indention):
+        # returns code that advances returnvalue.size behind the datatype
+        # received in buffer, used for messages of variable size
+        return "{indention}returnvalue.size += {size};".format(
+            indention=indention * '\t',
+            size=self.getSize(),
+        )
+
+    def getSizeDescription(self):
+        # describes the number of bytes of a datatype of variable size
+        return "up to {}".format(int(self.getSize()))
+
+    def hasMessageLayout(self):
+        # returns True if the datatype can have the same layout in memory as in
+        # messages on little endian machines
+        return False
+
     def isInput(self):
         # returns True if this is an input parameter when passed to a function and False otherwise
         # pointers and arrays may be pure output parameters, integers are always input parameters
@@ -297,9 +733,19 @@ class Datatype:
 
 class IntegralDatatype(Datatype):
 
-    def __init__(self, signature, size_bytes):
+    def __init__(self, signature, size_bytes, bits=None):
         self.signature = signature
         self.size_bytes = size_bytes
+        # the number of bits used by values, such as 3 for uint3_t
+        self.bits = size_bytes * 8 if bits is None else bits
+
+    def hasMessageLayout(self):
+        return self.size_bytes == 1 or self.signature in fixedWidthIntegers
+
+    def getTypeDeclaration(self):
+        return "typedef {} {};\n".format(
+            "int8_t" if self.signature.startswith("int") else "uint8_t",
+            self.signature)
 
     def setXml(self, xml):
         xml.set("bits", str(self.size_bytes * 8))
@@ -339,6 +785,19 @@ class IntegralDatatype(Datatype):
         return self.signature + " " + identifier
 
     def stringify(self, identifier, indention):
+        if messageReserve and self.size_bytes in (2, 4, 8):
+            return """
+{indention}/* writing integral type {type} {identifier} of size {size} */
+{indention}RPC_store_le{bits}({prefix}cursor, (uint{bits}_t)({identifier}));
+{indention}{prefix}cursor += {size};
+""".format(
+                indention=indention * '\t',
+                identifier=identifier,
+                type=self.signature,
+                size=self.size_bytes,
+                bits=self.size_bytes * 8,
+                prefix=prefix,
+            )
         return """
 {indention}/* writing integral type {type} {identifier} of size {size} */
 {datapush}""".format(
@@ -349,12 +808,11 @@ class IntegralDatatype(Datatype):
             datapush="".join(
                 indention *
                 '\t' +
-                prefix +
-                "message_push_byte((unsigned char)(" +
-                IntegralDatatype.getByte(
-                    i,
-                    identifier) +
-                "));\n" for i in range(
+                getPushByte(
+                    IntegralDatatype.getByte(
+                        i,
+                        identifier)) +
+                "\n" for i in range(
                     self.size_bytes)),
             # 5
         )
@@ -362,6 +820,19 @@ class IntegralDatatype(Datatype):
     def unstringify(self, source, identifier, indention):
         if self.size_bytes == 0:
             return ""
+        if self.size_bytes in (2, 4, 8):
+            return """
+{indention}/* reading integral type {signature} {identifier} of size {size} */
+{indention}{identifier} = ({signature})RPC_load_le{bits}({source});
+{indention}{source} += {size};
+""".format(
+                indention=indention * '\t',
+                identifier=identifier,
+                source=source,
+                signature=self.signature,
+                size=self.size_bytes,
+                bits=self.size_bytes * 8,
+            )
         return """
 {indention}/* reading integral type {signature} {identifier} of size {size} */
 {indention}{identifier} = *{source}++;
@@ -399,9 +870,11 @@ class IntegralDatatype(Datatype):
 class EnumDatatype(Datatype):
 
     def __init__(self, signature, size_bytes,
-                 transfertype, values, name, typedef):
+                 transfertype, values, name, typedef, bits=None):
         self.signature = signature
         self.size_bytes = size_bytes
+        # the number of bits required for the values in two's complement
+        self.bits = size_bytes * 8 if bits is None else bits
         self.transfertype = transfertype
         self.values = values
         self.typedef = typedef
@@ -483,20 +956,111 @@ class EnumDatatype(Datatype):
         return self.size_bytes
 
 
+class VarintDatatype(Datatype):
+    # an integer or enum of a function with varint encoding, sent as LEB128
+    # varint with 7 bits per byte. Signed values are zigzag encoded so small
+    # negative numbers stay short. Varints are only written through a cursor.
+
+    def __init__(self, datatype):
+        self.datatype = datatype
+        transfertype = datatype.transfertype if isinstance(
+            datatype, EnumDatatype) else datatype.signature
+        self.signed = not transfertype.startswith("u")
+        self.bits = 16 if datatype.size_bytes == 2 else 32 if datatype.size_bytes <= 4 else 64
+
+    def setXml(self, xml):
+        self.datatype.setXml(xml)
+        xml.set("encoding", "zigzag" if self.signed else "varint")
+
+    def declaration(self, identifier):
+        return self.datatype.declaration(identifier)
+
+    def stringify(self, identifier, indention):
+        assert messageReserve, "Internal error: varints must be written through a cursor"
+        return """
+{indention}/* writing {type} {identifier} as varint */
+{indention}{prefix}cursor = RPC_store_varint{bits}({prefix}cursor, {value});
+""".format(
+            indention=indention * '\t',
+            identifier=identifier,
+            type=self.datatype.signature,
+            bits=self.bits,
+            value="RPC_zigzag_encode{bits}({identifier})".format(
+                bits=self.bits, identifier=identifier) if self.signed else "(uint{bits}_t)({identifier})".format(
+                bits=self.bits, identifier=identifier),
+            prefix=prefix,
+        )
+
+    def unstringify(self, source, identifier, indention):
+        value = "RPC_load_varint{bits}(&{source})".format(
+            bits=self.bits, source=source)
+        if self.signed:
+            value = "RPC_zigzag_decode{bits}({value})".format(
+                bits=self.bits, value=value)
+        return """
+{indention}/* reading {type} {identifier} as varint */
+{indention}{identifier} = ({type}){value};
+""".format(
+            indention=indention * '\t',
+            identifier=identifier,
+            type=self.datatype.signature,
+            value=value,
+        )
+
+    def getSkipCode(self, buffer, indention):
+        return "{indention}returnvalue.size = RPC_skip_varint({buffer}, returnvalue.size, size_bytes);".format(
+            indention=indention * '\t',
+            buffer=buffer,
+        )
+
+    def getSizeDescription(self):
+        return "1-{}".format(int(self.getSize()))
+
+    def isInput(self):
+        return True
+
+    def isOutput(self):
+        return False
+
+    def getSize(self):
+        # variable size, at most 7 bits per byte
+        return float((self.bits + 6) // 7)
+
+
+def isZerocopyElement(datatype):
+    # returns True if received elements of the datatype can be used in place,
+    # structs must be packed so they have no alignment requirements
+    return datatype.hasMessageLayout() and (isinstance(
+        datatype, StructDatatype) or datatype.getSize() == 1)
+
+
+def getZerocopyAlternative(element, zerocopy, copy):
+    # bytes can always be used in place, structs only on little endian
+    # machines
+    if not isinstance(element, StructDatatype):
+        return zerocopy
+    return "\n#if RPC_LITTLE_ENDIAN{zerocopy}\n#else{copy}\n#endif".format(
+        zerocopy=zerocopy,
+        copy=copy,
+    )
+
+
 class ArrayDatatype(Datatype):
     # need to be mindful of padding, otherwise it is a fixed size loop
 
     def __init__(self, numberOfElements, datatype,
-                 parametername, In=None, Out=None):
+                 parametername, In=None, Out=None, const=False):
         self.numberOfElements = numberOfElements
         self.datatype = datatype
+        # input arrays declared const in the header
+        self.const = const
         self.In = parametername.endswith("_in") or parametername.endswith(
             "_inout") if In is None else In
         self.Out = parametername.endswith("_out") or parametername.endswith(
             "_inout") if Out is None else Out
 
     def setXml(self, xml):
-        xml.set("bits", str(self.getSize() * 8))
+        xml.set("bits", str(int(self.getSize() * 8)))
         xml.set("ctype", self.declaration(""))
         xml.set("type", "array")
         typ = ET.SubElement(xml, "array")
@@ -507,21 +1071,74 @@ class ArrayDatatype(Datatype):
         return self.datatype.declaration(
             identifier + "[" + str(self.numberOfElements) + "]")
 
+    def getParameterDeclaration(self, identifier):
+        return ("const " if self.const else "") + self.declaration(identifier)
+
     def isInput(self):
         return self.In
 
     def isOutput(self):
         return self.Out
 
+    def getElementDatatype(self):
+        # returns the datatype of the innermost elements of the array
+        element = self.datatype
+        while isinstance(element, ArrayDatatype):
+            element = element.datatype
+        return element
+
+    def isByteArray(self):
+        # returns True if the (possibly multidimensional) array consists of
+        # single byte integers, so memory and wire layout are identical
+        element = self.getElementDatatype()
+        return isinstance(
+            element, IntegralDatatype) and element.size_bytes == 1
+
+    def isLittleEndianArray(self):
+        # returns True if the memory layout of the array is identical to the
+        # wire layout on little endian machines
+        element = self.getElementDatatype()
+        return isinstance(
+            element, IntegralDatatype) and element.signature in fixedWidthIntegers
+
+    def getCopyStringification(self, identifier, indention, description):
+        return """
+{indention}/* writing {description} {name} of {size} bytes */
+{indention}memcpy({prefix}cursor, {name}, {size});
+{indention}{prefix}cursor += {size};""".format(
+            name=identifier,
+            description=description,
+            indention=indention * '\t',
+            size=self.getSizeExpression(),
+            prefix=prefix,
+        )
+
+    def getCopyUnstringification(
+            self, source, identifier, indention, description):
+        return """
+{indention}/* reading {description} {identifier} of {size} bytes */
+{indention}memcpy({identifier}, {source}, {size});
+{indention}{source} += {size};""".format(
+            identifier=identifier,
+            description=description,
+            indention=indention * '\t',
+            source=source,
+            size=self.getSizeExpression(),
+        )
+
     def stringify(self, identifier, indention):
         if self.numberOfElements == "1":
             # no loop required for 1 element
             return "{0}{1}".format(
                 indention * '\t', self.datatype.stringify("(*" + identifier + ")", indention))
-        return """
+        if messageReserve and self.isByteArray():
+            # no loop required, the bytes can be copied as they are
+            return self.getCopyStringification(
+                identifier, indention, "byte array")
+        loop = """
 {indention}/* writing array {name} with {numberOfElements} elements */
 {indention}{{
-{indention}	int {prefix}COUNTER_VAR{indentID};
+{indention}	{counterType} {prefix}COUNTER_VAR{indentID};
 {indention}	for ({prefix}COUNTER_VAR{indentID} = 0; {prefix}COUNTER_VAR{indentID} < {numberOfElements}; {prefix}COUNTER_VAR{indentID}++){{
 {serialization}
 {indention}	}}
@@ -539,17 +1156,30 @@ class ArrayDatatype(Datatype):
                 2),
             indentID=indention,
             prefix=prefix,
+            counterType=self.getCounterType(),
         )
+        if messageReserve and self.isLittleEndianArray():
+            # little endian machines can copy the array as it is
+            return "\n#if RPC_LITTLE_ENDIAN{copy}\n#else{loop}\n#endif".format(
+                copy=self.getCopyStringification(
+                    identifier, indention, "little endian array"),
+                loop=loop,
+            )
+        return loop
 
     def unstringify(self, destination, identifier, indention):
         if self.numberOfElements == "1":
             # no loop required for 1 element
             return "{0}{1}".format(
                 indention * '\t', self.datatype.unstringify(destination, "(*" + identifier + ")", indention))
-        return """
+        if self.isByteArray():
+            # no loop required, the bytes can be copied as they are
+            return self.getCopyUnstringification(
+                destination, identifier, indention, "byte array")
+        loop = """
 {indention}/* reading array {identifier} with {noe} elements */
 {indention}{{
-{indention}	int {prefix}COUNTER_VAR{ID};
+{indention}	{counterType} {prefix}COUNTER_VAR{ID};
 {indention}	for ({prefix}COUNTER_VAR{ID} = 0; {prefix}COUNTER_VAR{ID} < {noe}; {prefix}COUNTER_VAR{ID}++){{
 {payload}
 {indention}	}}
@@ -567,152 +1197,635 @@ class ArrayDatatype(Datatype):
                 2),
             ID=indention,
             prefix=prefix,
+            counterType=self.getCounterType(),
         )
+        if self.isLittleEndianArray():
+            # little endian machines can copy the array as it is
+            return "\n#if RPC_LITTLE_ENDIAN{copy}\n#else{loop}\n#endif".format(
+                copy=self.getCopyUnstringification(
+                    destination, identifier, indention, "little endian array"),
+                loop=loop,
+            )
+        return loop
 
     def getSize(self):
         return int(self.numberOfElements) * self.datatype.getSize()
 
+    def getSkipCode(self, buffer, indention):
+        if not isinstance(self.getSize(), float):
+            return Datatype.getSkipCode(self, buffer, indention)
+        if self.numberOfElements == "1":
+            return self.datatype.getSkipCode(buffer, indention)
+        return """{indention}{{
+{indention}	size_t {prefix}COUNTER_VAR{ID};
+{indention}	for ({prefix}COUNTER_VAR{ID} = 0; {prefix}COUNTER_VAR{ID} < {noe}; {prefix}COUNTER_VAR{ID}++){{
+{payload}
+{indention}	}}
+{indention}}}""".format(
+            indention=indention * '\t',
+            noe=self.numberOfElements,
+            payload=self.datatype.getSkipCode(buffer, indention + 2),
+            ID=indention,
+            prefix=prefix,
+        )
+
+    def hasMessageLayout(self):
+        return self.datatype.hasMessageLayout()
+
+    def getZerocopyDeclaration(self, identifier):
+        # the parameter becomes a pointer to the first element, which is
+        # const since it points into the received message
+        return "const " + self.datatype.declaration("(*" + identifier + ")")
+
+    def getZerocopyUnstringification(self, source, identifier, indention):
+        return getZerocopyAlternative(self.getElementDatatype(), """
+{indention}/* {identifier} points to its {size} bytes in the message */
+{indention}{identifier} = ({cast}){source};
+{indention}{source} += {size};""".format(
+            identifier=identifier,
+            indention=indention * '\t',
+            cast="const " + self.datatype.declaration("(*)"),
+            source=source,
+            size=self.getSizeExpression(),
+        ), """
+{indention}{storageDeclaration};{elementDeserialization}
+{indention}{identifier} = {prefix}{identifier}_storage;""".format(
+            identifier=identifier,
+            indention=indention * '\t',
+            storageDeclaration=self.declaration(
+                prefix + identifier + "_storage"),
+            elementDeserialization=self.unstringify(
+                source, prefix + identifier + "_storage", indention),
+            prefix=prefix,
+        ))
+
+    def getCounterType(self):
+        # the number of elements of pointers may exceed an int
+        return "int" if self.numberOfElements.isdigit() else "size_t"
+
+    def getSizeExpression(self):
+        # returns the size in bytes as C expression, the number of elements
+        # of the elements of a pointer is only known at runtime
+        if self.numberOfElements.isdigit():
+            return str(self.getSize())
+        return "{} * {}".format(self.numberOfElements, self.datatype.getSize())
+
 
 class PointerDatatype(Datatype):
-    # need to be mindful of parring, otherwise it is a variable sized loop
+    # a pointer parameter p_in, p_out or p_inout is followed by the parameter
+    # p_in_size with the number of elements. The number of elements is sent in
+    # front of the elements, the requests of p_out only contain the number of
+    # elements the caller's buffer can hold.
     # if the pointer is used for input, output or both depends on the name,
     # for example p_in, p_out or p_inout
 
     def __init__(self, signature, datatype, parametername):
-        assert None, "Code for pointers does not work yet"
+        assert not isinstance(datatype, PointerDatatype) and not isinstance(
+            datatype, ArrayDatatype), 'Pointer parameter "{}" must point to a basic type, enum or struct'.format(parametername)
         self.signature = signature
         self.datatype = datatype
+        self.parametername = parametername
         self.In = parametername.endswith(
             "_in") or parametername.endswith("_inout")
         self.Out = parametername.endswith(
             "_out") or parametername.endswith("_inout")
 
     def setXml(self, xml):
-        xml.set("bits", "???")
+        xml.set("bits", "variable")
         xml.set("ctype", self.signature)
+        xml.set("type", "pointer")
+        typ = ET.SubElement(xml, "pointer")
+        typ.set("size_parameter", self.numberOfElementsIdentifier)
+        typ.set("size_bits", str(self.sizeDatatype.getSize() * 8))
+        self.datatype.setXml(typ)
 
     def declaration(self, identifier):
         return self.signature + " " + identifier
 
-    def setNumberOfElementsIdentifier(self, numberOfElementsIdentifier):
+    def setNumberOfElementsIdentifier(
+            self, numberOfElementsIdentifier, sizeDatatype):
         self.numberOfElementsIdentifier = numberOfElementsIdentifier
+        self.sizeDatatype = sizeDatatype
+
+    def getSizeIdentifier(self, identifier):
+        # the size parameter is accessed the same way as the pointer, for
+        # example (*p_out_size) for (*p_out)
+        return identifier.replace(
+            self.parametername, self.numberOfElementsIdentifier)
+
+    def exceedsMaximum(self):
+        # whether the size parameter can hold more elements than #pragma RPC
+        # max_pointer_elements allows, otherwise the check would always be false
+        return 2 ** (self.sizeDatatype.getSize() * 8) - 1 > maxPointerElements
+
+    def getElements(self, numberOfElements):
+        return ArrayDatatype(numberOfElements, self.datatype, self.parametername)
+
+    def getNumberOfElements(self, source):
+        # returns an expression for the number of elements at source without
+        # advancing source
+        size = self.sizeDatatype.getSize()
+        if size == 1:
+            return "*({})".format(source)
+        return "RPC_load_le{bits}({source})".format(bits=size * 8, source=source)
+
+    def getSizeDescription(self):
+        return "{} + {} * {}".format(
+            self.sizeDatatype.getSize(),
+            self.datatype.getSize(),
+            self.numberOfElementsIdentifier)
 
     def stringify(self, identifier, indention):
         return """
-{indention}/* writing pointer {type}{name} with {index} elements*/
-{indention}{{
-{indention}	int i;
-{indention}	for (i = 0; i < {index}; i++){{
-{serialization}
-{indention}	}}
-{indention}}}""".format(
+{indention}/* writing pointer {name} with {numberOfElements} elements */{numberOfElementsSerialization}{elementSerialization}""".format(
             name=identifier,
-            type=self.signature,
-            index=self.numberOfElementsIdentifier,
+            numberOfElements=self.getSizeIdentifier(identifier),
             indention=indention * '\t',
-            serialization=self.datatype.stringify(
-                identifier + "[i]", indention + 2),
+            numberOfElementsSerialization=self.sizeDatatype.stringify(
+                self.getSizeIdentifier(identifier), indention),
+            elementSerialization=self.getElements(
+                self.getSizeIdentifier(identifier)).stringify(identifier, indention),
         )
 
-    def unstringify(self, destination, identifier, indention):
+    def stringifyRequest(self, identifier, indention):
+        if self.In:
+            return self.stringify(identifier, indention)
         return """
-{indention}/* reading pointer {signature}{identifier} with [{numberOfElementsIdentifier}] elements*/
+{indention}/* writing the number of elements the pointer {name} can hold */{numberOfElementsSerialization}""".format(
+            name=identifier,
+            indention=indention * '\t',
+            numberOfElementsSerialization=self.sizeDatatype.stringify(
+                self.getSizeIdentifier(identifier), indention),
+        )
+
+    def unstringify(self, source, identifier, indention):
+        # the received elements are written to the caller's buffer, elements
+        # that do not fit are skipped
+        if isinstance(self.datatype.getSize(), float):
+            # elements of variable size are skipped by reading them
+            skip = """
+{indention}	while ({prefix}skipped--){{
+{indention}		{elementDeclaration};{skippedElementDeserialization}
+{indention}		(void){prefix}element;
+{indention}	}}"""
+        else:
+            skip = """
+{indention}	{source} += {prefix}skipped * {elementSize};"""
+        return ("""
+{indention}/* reading pointer {identifier} with at most {capacity} elements */
 {indention}{{
-{indention}	int i;
-{indention}	for (i = 0; i < {numberOfElementsIdentifier}; i++){{
-{idDeserializer}
-{indention}	}}
-{indention}}}""".format(
+{indention}	{countDeclaration};
+{indention}	size_t {prefix}skipped = 0;{numberOfElementsDeserialization}
+{indention}	if ({prefix}elements > {capacity}){{ /* the caller's buffer is too small */
+{indention}		{prefix}skipped = {prefix}elements - {capacity};
+{indention}		{prefix}elements = {capacity};
+{indention}	}}{elementDeserialization}""" + skip + """
+{indention}}}""").format(
             identifier=identifier,
-            signature=self.signature,
-            numberOfElementsIdentifier=self.numberOfElementsIdentifier,
+            capacity=self.getSizeIdentifier(identifier),
+            indention=indention * '\t',
+            countDeclaration=self.sizeDatatype.declaration(prefix + "elements"),
+            numberOfElementsDeserialization=self.sizeDatatype.unstringify(
+                source, prefix + "elements", indention + 1),
+            elementSize=self.datatype.getSize(),
+            elementDeserialization=self.getElements(
+                prefix + "elements").unstringify(source, identifier, indention + 1),
+            elementDeclaration=self.datatype.declaration(prefix + "element"),
+            skippedElementDeserialization=self.datatype.unstringify(
+                source, prefix + "element", indention + 2),
+            source=source,
+            prefix=prefix,
+        )
+
+    def getStorageUnstringification(
+            self, source, identifier, indention, readElements, zerocopy=False, reject="return;"):
+        # the elements are stored in an array of #pragma RPC
+        # max_pointer_elements elements declared in the current block,
+        # messages with more elements are dropped by reject
+        storage = """
+{indention}{storageDeclaration};{elementDeserialization}
+{indention}{identifier} = {prefix}{name}_storage;""".format(
+            identifier=identifier,
+            name=self.parametername,
+            indention=indention * '\t',
+            storageDeclaration=self.datatype.declaration(
+                "{prefix}{name}_storage[{maximum}]".format(
+                    prefix=prefix,
+                    name=self.parametername,
+                    maximum=max(maxPointerElements, 1))),
+            elementDeserialization=self.getElements(
+                self.getSizeIdentifier(identifier)).unstringify(
+                source, prefix + self.parametername + "_storage", indention) if readElements else "",
+            prefix=prefix,
+        )
+        if zerocopy:
+            storage = getZerocopyAlternative(self.datatype, """
+{indention}/* {identifier} points to its elements in the message */
+{indention}{identifier} = ({signature}){source};
+{indention}{source} += {size};""".format(
+                identifier=identifier,
+                indention=indention * '\t',
+                signature=self.signature,
+                source=source,
+                size=self.getElements(
+                    self.getSizeIdentifier(identifier)).getSizeExpression(),
+            ), storage)
+        if self.exceedsMaximum():
+            storage = """
+{indention}if ({numberOfElements} > {maximum}) /* more elements than #pragma RPC max_pointer_elements allows */
+{indention}	{reject}""".format(
+                numberOfElements=self.getSizeIdentifier(identifier),
+                indention=indention * '\t',
+                maximum=maxPointerElements,
+                reject=reject,
+            ) + storage
+        return """
+{indention}/* reading pointer {identifier} with {numberOfElements} elements */{numberOfElementsDeserialization}{storage}""".format(
+            identifier=identifier,
+            numberOfElements=self.getSizeIdentifier(identifier),
             indention=indention * '\t',
-            idDeserializer=self.datatype.unstringify(
-                destination, identifier + "[i]", indention + 2),
+            numberOfElementsDeserialization=self.sizeDatatype.unstringify(
+                source, self.getSizeIdentifier(identifier), indention),
+            storage=storage,
         )
 
+    def unstringifyRequest(self, source, identifier, indention):
+        return self.getStorageUnstringification(
+            source, identifier, indention, self.In)
+
+    def unstringifyIntoStorage(self, source, identifier, indention, reject="return;"):
+        return self.getStorageUnstringification(
+            source, identifier, indention, True, reject=reject)
+
+    def hasMessageLayout(self):
+        # the number of elements is only known at runtime
+        return False
+
+    def getZerocopyDeclaration(self, identifier):
+        return self.declaration(identifier)
+
+    def getZerocopyUnstringification(self, source, identifier, indention):
+        return self.getStorageUnstringification(
+            source, identifier, indention, True, True)
+
+    def getAddress(self, identifier):
+        return "&" + identifier
+
     def isInput(self):
-        return self.In
+        # requests always contain the number of elements
+        return True
 
     def isOutput(self):
         return self.Out
 
+    def getRequestSize(self):
+        if self.In:
+            return self.getSize()
+        return self.sizeDatatype.getSize()
+
     def getSize(self):
-        return 0.
+        # variable size, at least the number of elements
+        return float(self.sizeDatatype.getSize())
 
 
-class StructDatatype(Datatype):
-    # just call the functions of all the members in order
+class PointerSizeDatatype(Datatype):
+    # the size parameter following a pointer parameter, it is not sent since
+    # the pointer sends the number of elements itself
 
-    def __init__(self, signature, memberList, file, lineNumber):
-        self.signature = signature
-        self.memberList = memberList
-        self.file = file
-        self.lineNumber = lineNumber
+    def __init__(self, datatype, pointer):
+        assert isinstance(datatype, IntegralDatatype) and datatype.signature in (
+            "unsigned char", "uint8_t", "uint16_t", "uint32_t", "uint64_t"), \
+            'Size parameter "{}" must be an unsigned integer of 1, 2, 4 or 8 bytes'.format(
+                pointer.parametername + "_size")
+        self.datatype = datatype
+        self.pointer = pointer
 
     def setXml(self, xml):
-        xml.set("bits", str(self.getSize()))
-        xml.set("ctype", self.signature)
-        xml.set("type", "struct")
-        memberpos = 1
-        for e in self.memberList:
-            member = ET.SubElement(xml, "parameter")
-            member.set("memberpos", str(memberpos))
-            member.set("name", e["name"])
-            memberpos += 1
-            e["datatype"].setXml(member)
+        self.datatype.setXml(xml)
 
     def declaration(self, identifier):
-        return self.signature + " " + identifier
+        return self.datatype.declaration(identifier)
 
     def stringify(self, identifier, indention):
-        members = ", ".join(m["datatype"].declaration(m["name"])
-                            for m in self.memberList)
-        # print(self.memberList)
-        memberStringification = "".join(
-            m["datatype"].stringify(
-                identifier + "." + m["name"],
-                indention + 1) for m in self.memberList)
-        return "{indention}/*writing {identifier} of type {type} with members {members}*/\n{indention}{{{memberStringification}\n{indention}}}".format(
-            indention=indention * '\t',
-            type=self.signature,
-            members=members,
-            identifier=identifier,
-            memberStringification=memberStringification,
-        )
+        return ""
 
-    def unstringify(self, destination, identifier, indention):
-        memberUnstringification = "".join(
-            m["datatype"].unstringify(
-                destination,
-                identifier + "." + m["name"],
-                indention + 1) for m in self.memberList)
-        return """
-{indention}/* reading {signature}{identifier}*/
-{indention}{{
-{memberdeserialize}
-{indention}}}""".format(
-            identifier=identifier,
-            signature=self.signature,
-            indention=indention * '\t',
-            memberdeserialize=memberUnstringification,
-        )
+    def unstringify(self, source, identifier, indention):
+        return ""
+
+    def getAddress(self, identifier):
+        return "&" + identifier
 
     def isInput(self):
-        # TODO: Go through members and return if for any of them isInput is
-        # true
-        raise NotImplemented
+        return True
 
     def isOutput(self):
-        # TODO: Go through members and return if for any of them isOutput is
-        # true
-        raise NotImplemented
+        # the caller's buffer size is required to read the answer
+        return self.pointer.isOutput()
 
     def getSize(self):
-        # print(self.memberList)
-        return sum(m["datatype"].getSize() for m in self.memberList)
+        return 0
 
-    def getTypeDeclaration(self):
+
+def getPackedValue(datatype, raw):
+    # returns the value of the datatype from the unsigned expression raw
+    # holding its bits, negative values are sign extended
+    signed = not (datatype.transfertype if isinstance(
+        datatype, EnumDatatype) else datatype.signature).startswith("u")
+    if signed:
+        raw = "(int)(({raw}) ^ {sign}) - {sign}".format(
+            raw=raw, sign=hex(1 << (datatype.bits - 1)))
+    return "({signature})({raw})".format(signature=datatype.signature, raw=raw)
+
+
+class BitfieldDatatype(Datatype):
+    # an integer or enum of less than 8 bits in a function with packed encoding.
+    # Consecutive fields form a run and share bytes, least significant bits
+    # first. The first field of a run writes and reads the whole run, the
+    # following fields are not sent on their own.
+
+    def __init__(self, datatype, name, offset, run=None):
+        self.datatype = datatype
+        self.name = name
+        self.offset = offset  # bit offset in the run
+        self.bits = datatype.bits
+        self.run = run  # list of names and datatypes for the first field
+
+    def setXml(self, xml):
+        self.datatype.setXml(xml)
+        xml.set("bits", str(self.bits))
+        xml.set("encoding", "packed")
+
+    def declaration(self, identifier):
+        return self.datatype.declaration(identifier)
+
+    def getIdentifier(self, identifier, name):
+        # the fields of a run are accessed the same way as the first one, for
+        # example s.b for s.a
+        head, _, tail = identifier.rpartition(self.name)
+        return head + name + tail
+
+    def getFields(self, identifier):
+        # returns identifier, datatype and bit offset of the fields of the run
+        fields = []
+        offset = 0
+        for name, datatype in self.run:
+            fields.append((self.getIdentifier(identifier, name), datatype, offset))
+            offset += datatype.bits
+        return fields
+
+    def stringify(self, identifier, indention):
+        if not self.run:
+            return ""
+        fields = self.getFields(identifier)
+        code = ""
+        for byte in range(self.getSize()):
+            terms = []
+            for field, datatype, offset in fields:
+                shift = offset - 8 * byte
+                if shift >= 8 or shift + datatype.bits <= 0:
+                    continue
+                term = "((unsigned int)({field}) & {mask})".format(
+                    field=field, mask=hex((1 << datatype.bits) - 1))
+                if shift > 0:
+                    term += " << {}".format(shift)
+                elif shift < 0:
+                    term += " >> {}".format(-shift)
+                terms.append(term)
+            code += "{indention}{push}\n".format(
+                indention=indention * '\t',
+                push=getPushByte(" | ".join(terms)))
+        return """
+{indention}/* writing packed {names} in {size} bytes */
+{code}""".format(
+            indention=indention * '\t',
+            names=", ".join(field for field, datatype, offset in fields),
+            size=self.getSize(),
+            code=code,
+        )
+
+    def unstringify(self, source, identifier, indention):
+        if not self.run:
+            return ""
+        code = ""
+        for field, datatype, offset in self.getFields(identifier):
+            raw = "(unsigned int){source}[{byte}] >> {shift}".format(
+                source=source, byte=offset // 8, shift=offset % 8)
+            if offset % 8 + datatype.bits > 8:
+                raw += " | (unsigned int){source}[{byte}] << {shift}".format(
+                    source=source, byte=offset // 8 + 1, shift=8 - offset % 8)
+            code += "{indention}{field} = {value};\n".format(
+                indention=indention * '\t',
+                field=field,
+                value=getPackedValue(datatype, "({raw}) & {mask}".format(
+                    raw=raw, mask=hex((1 << datatype.bits) - 1))),
+            )
+        return """
+{indention}/* reading packed {names} from {size} bytes */
+{code}{indention}{source} += {size};
+""".format(
+            indention=indention * '\t',
+            names=", ".join(field for field, datatype,
+                            offset in self.getFields(identifier)),
+            size=self.getSize(),
+            code=code,
+            source=source,
+        )
+
+    def isInput(self):
+        return True
+
+    def isOutput(self):
+        return False
+
+    def getSize(self):
+        if not self.run:
+            return 0
+        return (sum(datatype.bits for name, datatype in self.run) + 7) // 8
+
+
+class BitArrayDatatype(ArrayDatatype):
+    # an array of integers or enums of less than 8 bits in a function with
+    # packed encoding, the elements share bytes least significant bits first
+
+    def setXml(self, xml):
+        ArrayDatatype.setXml(self, xml)
+        xml.set("encoding", "packed")
+        typ = xml.find("array")
+        typ.set("bits", str(self.datatype.bits))
+
+    def stringify(self, identifier, indention):
+        return """
+{indention}/* writing array {name} with {numberOfElements} elements of {bits} bits */
+{indention}{{
+{indention}	unsigned int {prefix}bits = 0;
+{indention}	unsigned char {prefix}bitcount = 0;
+{indention}	{counterType} {prefix}COUNTER_VAR{indentID};
+{indention}	for ({prefix}COUNTER_VAR{indentID} = 0; {prefix}COUNTER_VAR{indentID} < {numberOfElements}; {prefix}COUNTER_VAR{indentID}++){{
+{indention}		{prefix}bits |= ((unsigned int){name}[{prefix}COUNTER_VAR{indentID}] & {mask}) << {prefix}bitcount;
+{indention}		{prefix}bitcount += {bits};
+{indention}		if ({prefix}bitcount >= 8){{
+{indention}			{push}
+{indention}			{prefix}bits >>= 8;
+{indention}			{prefix}bitcount -= 8;
+{indention}		}}
+{indention}	}}
+{indention}	if ({prefix}bitcount > 0)
+{indention}		{push}
+{indention}}}""".format(
+            name=identifier,
+            numberOfElements=self.numberOfElements,
+            bits=self.datatype.bits,
+            mask=hex((1 << self.datatype.bits) - 1),
+            push=getPushByte("{prefix}bits".format(prefix=prefix)),
+            indention=indention * '\t',
+            indentID=indention,
+            counterType=self.getCounterType(),
+            prefix=prefix,
+        )
+
+    def unstringify(self, source, identifier, indention):
+        return """
+{indention}/* reading array {identifier} with {numberOfElements} elements of {bits} bits */
+{indention}{{
+{indention}	unsigned int {prefix}bits = 0;
+{indention}	unsigned char {prefix}bitcount = 0;
+{indention}	{counterType} {prefix}COUNTER_VAR{ID};
+{indention}	for ({prefix}COUNTER_VAR{ID} = 0; {prefix}COUNTER_VAR{ID} < {numberOfElements}; {prefix}COUNTER_VAR{ID}++){{
+{indention}		if ({prefix}bitcount < {bits}){{
+{indention}			{prefix}bits |= (unsigned int)*{source}++ << {prefix}bitcount;
+{indention}			{prefix}bitcount += 8;
+{indention}		}}
+{indention}		{identifier}[{prefix}COUNTER_VAR{ID}] = {value};
+{indention}		{prefix}bits >>= {bits};
+{indention}		{prefix}bitcount -= {bits};
+{indention}	}}
+{indention}}}""".format(
+            identifier=identifier,
+            numberOfElements=self.numberOfElements,
+            bits=self.datatype.bits,
+            value=getPackedValue(self.datatype, "{prefix}bits & {mask}".format(
+                prefix=prefix, mask=hex((1 << self.datatype.bits) - 1))),
+            source=source,
+            indention=indention * '\t',
+            ID=indention,
+            counterType=self.getCounterType(),
+            prefix=prefix,
+        )
+
+    def getSize(self):
+        return (int(self.numberOfElements) * self.datatype.bits + 7) // 8
+
+    def hasMessageLayout(self):
+        return False
+
+
+class StructDatatype(Datatype):
+    # just call the functions of all the members in order
+
+    def __init__(self, signature, memberList, file, lineNumber):
+        self.signature = signature
+        self.memberList = memberList
+        self.file = file
+        self.lineNumber = lineNumber
+
+    def setXml(self, xml):
+        xml.set("bits", str(int(self.getSize())))
+        xml.set("ctype", self.signature)
+        xml.set("type", "struct")
+        memberpos = 1
+        for e in self.memberList:
+            member = ET.SubElement(xml, "parameter")
+            member.set("memberpos", str(memberpos))
+            member.set("name", e["name"])
+            memberpos += 1
+            e["datatype"].setXml(member)
+
+    def declaration(self, identifier):
+        return self.signature + " " + identifier
+
+    def stringify(self, identifier, indention):
+        members = ", ".join(m["datatype"].declaration(m["name"])
+                            for m in self.memberList)
+        # print(self.memberList)
+        memberStringification = "".join(
+            m["datatype"].stringify(
+                identifier + "." + m["name"],
+                indention + 1) for m in self.memberList)
+        return "{indention}/*writing {identifier} of type {type} with members {members}*/\n{indention}{{{memberStringification}\n{indention}}}".format(
+            indention=indention * '\t',
+            type=self.signature,
+            members=members,
+            identifier=identifier,
+            memberStringification=memberStringification,
+        )
+
+    def unstringify(self, destination, identifier, indention):
+        memberUnstringification = "".join(
+            m["datatype"].unstringify(
+                destination,
+                identifier + "." + m["name"],
+                indention + 1) for m in self.memberList)
+        return """
+{indention}/* reading {signature}{identifier}*/
+{indention}{{
+{memberdeserialize}
+{indention}}}""".format(
+            identifier=identifier,
+            signature=self.signature,
+            indention=indention * '\t',
+            memberdeserialize=memberUnstringification,
+        )
+
+    def isInput(self):
+        # TODO: Go through members and return if for any of them isInput is
+        # true
+        raise NotImplemented
+
+    def isOutput(self):
+        # TODO: Go through members and return if for any of them isOutput is
+        # true
+        raise NotImplemented
+
+    def getSize(self):
+        # print(self.memberList)
+        return sum(m["datatype"].getSize() for m in self.memberList)
+
+    def getSkipCode(self, buffer, indention):
+        if not isinstance(self.getSize(), float):
+            return Datatype.getSkipCode(self, buffer, indention)
+        return "\n".join(m["datatype"].getSkipCode(buffer, indention)
+                         for m in self.memberList)
+
+    def hasMessageLayout(self):
+        return all(m["datatype"].hasMessageLayout() for m in self.memberList)
+
+    def getLayoutCheck(self):
+        # returns code that fails to compile if the struct is not packed or
+        # its members are not where they are in messages
+        name = prefix + self.signature.replace(" ", "_")
+        offsets = []
+        offset = 0
+        for m in self.memberList:
+            offsets.append("offsetof({signature}, {member}) == {offset}".format(
+                signature=self.signature, member=m["name"], offset=offset))
+            offset += m["datatype"].getSize()
+        return """typedef struct {{
+	char c;
+	{declaration};
+}} {name}_alignment;
+typedef char {name}_has_message_layout[
+	sizeof({signature}) == {size} &&
+	{offsets} &&
+	offsetof({name}_alignment, s) == 1 ? 1 : -1];
+""".format(
+            name=name,
+            signature=self.signature,
+            declaration=self.declaration("s"),
+            size=self.getSize(),
+            offsets=" &&\n\t".join(offsets),
+        )
+
+    def getTypeDeclaration(self):
         siglist = self.signature.split(" ")
         isTypedefed = len(siglist) == 1
         memberDeclarations = ";\n\t".join(
@@ -725,13 +1838,85 @@ class StructDatatype(Datatype):
         )
 
 
+def getVarintDatatype(datatype):
+    # returns the datatype with all integers of at least 2 bytes replaced by
+    # varints, the datatypes of other functions are not changed
+    from copy import copy
+    if isinstance(datatype, (IntegralDatatype, EnumDatatype)):
+        if datatype.size_bytes < 2:
+            return datatype
+        return VarintDatatype(datatype)
+    if isinstance(datatype, (ArrayDatatype, PointerDatatype)):
+        varint = copy(datatype)
+        varint.datatype = getVarintDatatype(datatype.datatype)
+        return varint
+    if isinstance(datatype, StructDatatype):
+        varint = copy(datatype)
+        varint.memberList = [dict(m, datatype=getVarintDatatype(
+            m["datatype"])) for m in datatype.memberList]
+        return varint
+    return datatype
+
+
+def isSubByteDatatype(datatype):
+    return isinstance(datatype, (IntegralDatatype, EnumDatatype)
+                      ) and 0 < datatype.bits < 8
+
+
+def getPackedDatatype(datatype):
+    # returns the datatype with integers and enums of less than 8 bits packed,
+    # the datatypes of other functions are not changed
+    from copy import copy
+    if isinstance(datatype, ArrayDatatype):
+        if isSubByteDatatype(datatype.datatype):
+            return BitArrayDatatype(datatype.numberOfElements, datatype.datatype,
+                                    "", datatype.In, datatype.Out, datatype.const)
+        packed = copy(datatype)
+        packed.datatype = getPackedDatatype(datatype.datatype)
+        return packed
+    if isinstance(datatype, PointerDatatype):
+        # the elements of pointers stay byte aligned so their size is simple
+        packed = copy(datatype)
+        if not isSubByteDatatype(datatype.datatype):
+            packed.datatype = getPackedDatatype(datatype.datatype)
+        return packed
+    if isinstance(datatype, StructDatatype):
+        packed = copy(datatype)
+        packed.memberList = getPackedFields(
+            datatype.memberList, "name", "datatype")
+        return packed
+    return datatype
+
+
+def getPackedFields(fields, namekey, typekey):
+    # returns a copy of the parameters or struct members fields with packed
+    # datatypes, consecutive fields of less than 8 bits form a run
+    packed = []
+    run = []
+    for field in fields + [None]:
+        if field is not None and isSubByteDatatype(field[typekey]):
+            run.append(field)
+            continue
+        offset = 0
+        for f in run:
+            packed.append(dict(f, **{typekey: BitfieldDatatype(
+                f[typekey], f[namekey], offset,
+                [(r[namekey], r[typekey]) for r in run] if offset == 0 else None)}))
+            offset += f[typekey].bits
+        run = []
+        if field is not None:
+            packed.append(
+                dict(field, **{typekey: getPackedDatatype(field[typekey])}))
+    return packed
+
+
 class Function:
     # stringify turns a function call into a string and sends it to the other side
     # unstringify turns a string into arguments to pass to a function
     # assumes the send function has the signature (void *, size_t);
     # requests have even numbers, answers have odd numbers
 
-    def __init__(self, ID, returntype, name, parameterlist):
+    def __init__(self, ID, returntype, name, parameterlist, generated=False):
         #print("ID:", ID)
         #print("returntype:", returntype)
         #print("name:", name)
@@ -745,20 +1930,78 @@ class Function:
                 0, {"parameter": rt, "parametername": returnValueName})
         self.name = name
         self.parameterlist = parameterlist
+        # generated functions such as get_hash carry the prefix in their name
+        # and are implemented by the generated {name}_impl on the server
+        self.generated = generated
         #print(10*'+' + '\n' + "".join(str(p) for p in parameterlist) + '\n' + 10*'-' + '\n')
         self.ID = ID
+        # get_hash keeps its encoding so clients can always check the protocol
+        functionEncoding = functionEncodings.get(
+            name, encoding) if ID > 0 else "fixed"
+        self.varint = functionEncoding == "varint"
+        if self.varint:
+            for p in parameterlist:
+                p["parameter"] = getVarintDatatype(p["parameter"])
+        if functionEncoding == "packed":
+            self.parameterlist = getPackedFields(
+                parameterlist, "parametername", "parameter")
+        assert name not in functionZerocopyList or self.getZerocopyParameters(), \
+            'Function "{}" has no input array or pointer of bytes or structs for #pragma RPC zerocopy'.format(
+                name)
+
+    def getZerocopyParameters(self):
+        # returns the input arrays and pointers the server does not copy out
+        # of the received message
+        if self.name not in functionZerocopyList:
+            return []
+        zerocopyParameters = []
+        for p in self.parameterlist:
+            parameter = p["parameter"]
+            if isinstance(parameter, PointerDatatype):
+                element = parameter.datatype
+            elif isinstance(parameter, ArrayDatatype) and parameter.hasMessageLayout():
+                element = parameter.getElementDatatype()
+            else:
+                continue
+            if parameter.In and not parameter.Out and isZerocopyElement(element):
+                assert parameter.const if isinstance(parameter, ArrayDatatype) else parameter.signature.startswith("const "), \
+                    'Zerocopy parameter "{}" of function "{}" must be declared const since it points into the received message'.format(
+                        p["parametername"], self.name)
+                zerocopyParameters.append(p)
+        return zerocopyParameters
+
+    def getRequestParameterDeclarations(self):
+        return "".join(
+            "\t\t\t" + (p["parameter"].getZerocopyDeclaration(p["parametername"])
+                        if p in self.getZerocopyParameters() else
+                        p["parameter"].declaration(p["parametername"])) + ";\n"
+            for p in self.parameterlist)
+
+    def getRequestParameterUnstringification(self, buffer):
+        return "".join(
+            p["parameter"].getZerocopyUnstringification(
+                buffer, p["parametername"], 3)
+            if p in self.getZerocopyParameters() else
+            p["parameter"].unstringifyRequest(buffer, p["parametername"], 3)
+            for p in self.parameterlist if p["parameter"].isInput())
 
     def getXml(self, entry):
         if self.name in functionIgnoreList:
             return
         entry.set("name", self.name)
+        if self.varint:
+            entry.set("encoding", "varint")
+        elif any(isinstance(p["parameter"], BitfieldDatatype)
+                 for p in self.parameterlist):
+            entry.set("encoding", "packed")
         declaration = ET.SubElement(entry, "declaration")
         declaration.text = self.getDeclaration()
         request = ET.SubElement(entry, "request")
         request.set("ID", str(self.ID * 2))
         i = 1
         for p in self.parameterlist:
-            if not p["parameter"].isInput():
+            if not p["parameter"].isInput() or isinstance(
+                    p["parameter"], PointerSizeDatatype):
                 continue
             param = ET.SubElement(request, "parameter")
             param.set("position", str(i))
@@ -771,7 +2014,8 @@ class Function:
         reply.set("ID", str(self.ID * 2 + 1))
         i = 1
         for p in self.parameterlist:
-            if not p["parameter"].isOutput():
+            if not p["parameter"].isOutput() or isinstance(
+                    p["parameter"], PointerSizeDatatype):
                 continue
             param = ET.SubElement(reply, "parameter")
             param.set("position", str(i))
@@ -779,6 +2023,12 @@ class Function:
             i += 1
             p["parameter"].setXml(param)
 
+    @cachedFragment
+    def getXmlFragment(self):
+        entry = ET.Element("function")
+        self.getXml(entry)
+        return ET.tostring(entry, encoding="unicode")
+
     def getOriginalDeclaration(self):
         returnvalue = "void " if self.isVoidReturnType else self.parameterlist[
             0]["parameter"].declaration("")
@@ -796,7 +2046,7 @@ class Function:
 
     def getParameterDeclaration(self):
         parameterdeclaration = ", ".join(
-            p["parameter"].declaration(
+            p["parameter"].getParameterDeclaration(
                 p["parametername"]) for p in self.parameterlist)
         if parameterdeclaration == "":
             parameterdeclaration = "void"
@@ -809,10 +2059,11 @@ class Function:
             1:]
         return "{returnvalue}{functionname}({parameterlist});".format(
             returnvalue=returnvalue,
-            functionname=self.name if self.ID > 0 else self.name + "_impl",
+            functionname=self.name + "_impl" if self.generated else self.name,
             parameterlist=", ".join(p["parametername"] for p in parameterlist),
         )
 
+    @cachedFragment
     def getDefinition(self):
         
       #          if (multiThreadArchicture):
@@ -825,17 +2076,13 @@ class Function:
                 result = """
 RPC_RESULT {functionname}({parameterdeclaration}){{
 	RPC_RESULT result;
-	{prefix}mutex_lock(RPC_mutex_caller);
+{statisticsStart}{cursorDeclaration}{pointerCheck}	{prefix}mutex_lock(RPC_mutex_caller);
 	{prefix}mutex_lock(RPC_mutex_in_caller);
 
-	/***Serializing***/
-	{prefix}message_start({messagesize});
-	{prefix}message_push_byte({requestID}); /* save ID */
-{inputParameterSerializationCode}
-	result = {prefix}message_commit();
+{serialization}
 
 	/* This function has been set to receive no answer */
-
+{statisticsCount}
 	{prefix}mutex_unlock(RPC_mutex_in_caller);
 	{prefix}mutex_unlock(RPC_mutex_caller);
 	return result;
@@ -845,129 +2092,468 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
                 result = """
 RPC_RESULT {functionname}({parameterdeclaration}){{
 	RPC_RESULT result;
-
-	/***Serializing***/
-	{prefix}message_start({messagesize});
-	{prefix}message_push_byte({requestID}); /* save ID */
-{inputParameterSerializationCode}
-	result = {prefix}message_commit();
+{statisticsStart}{cursorDeclaration}{pointerCheck}
+{serialization}
 
 	/* This function has been set to receive no answer */
-
+{statisticsCount}
 	return result;
 }}
 """         
+            serialization = """	/***Serializing***/
+{messageStart}
+{inputParameterSerializationCode}
+	result = {prefix}message_commit();""".format(
+                inputParameterSerializationCode=self.getSerialization(
+                    [p for p in self.parameterlist if p["parameter"].isInput()], 1, True),
+                prefix=prefix,
+                messageStart=self.getBatchFlush(1) + self.getMessageStart(self.getRequestSizeExpression(), self.ID * 2, 1),
+            )
+            cursorDeclaration = self.getCursorDeclaration(1)
+            batched = batchRequestID and not isinstance(self.getRequestSize(), float)
+            if batched:
+                serialization = self.getBatchSerialization()
+                cursorDeclaration = "\tunsigned char *{prefix}cursor;\n".format(prefix=prefix)
             result = result.format(
-                requestID=self.ID * 2,
-                inputParameterSerializationCode="".join(
-                    p["parameter"].stringify(
-                        p["parametername"],
-                        1) for p in self.parameterlist if p["parameter"].isInput()),
                 functionname=self.name,
                 parameterdeclaration=self.getParameterDeclaration(),
                 prefix=prefix,
-                messagesize=sum(p["parameter"].getSize() for p in self.parameterlist if p[
-                                "parameter"].isInput()) + 1,
+                cursorDeclaration=cursorDeclaration,
+                pointerCheck=self.getPointerCheck(),
+                serialization=serialization,
+                statisticsStart=self.getStatisticsStart(),
+                statisticsCount=self.getStatisticsCount("", "", batched),
             )
             return result
         
         result = "";
-        if (multiThreadArchicture):
-            result = """
+        outputs = "{prefix}answer_outputs".format(prefix=prefix)
+        if pendingCalls:
+            # the slot of the pending call selects the answer mutex the caller
+            # waits on, RPC_mutex_caller only protects writing the message
+            outputs = "{prefix}pending_calls[slot].outputs".format(prefix=prefix)
+            if (multiThreadArchicture):
+                result = """
 RPC_RESULT {functionname}({parameterdeclaration}){{
+	RPC_RESULT result = RPC_FAILURE;
+{statisticsStart}	RPC_RESULT sent;
+	int slot;
+	unsigned char {prefix}correlation;
+{cursorDeclaration}{pointerCheck}
+	/***Registering output parameters***/
+	{prefix}mutex_lock(RPC_mutex_in_caller);
+	slot = {prefix}reserve_pending_call({answerID});
+	if (slot < 0){{ /* too many calls are waiting for their answers */
+		{prefix}mutex_unlock(RPC_mutex_in_caller);
+		return RPC_FAILURE;
+	}}
+{outputParameterRegistration}
+	{prefix}correlation = {prefix}pending_calls[slot].correlation;
+	{prefix}mutex_unlock(RPC_mutex_in_caller);
+
+	/***Serializing***/
 	{prefix}mutex_lock(RPC_mutex_caller);
+{messageStart}
+{inputParameterSerializationCode}
+	sent = {prefix}message_commit();
+	{prefix}mutex_unlock(RPC_mutex_caller);
+	if (sent == RPC_SUCCESS){{ /* successfully sent request */
+		if ({prefix}mutex_lock_timeout((RPC_mutex_id)(RPC_mutex_answer + slot))){{ /* Wait for answer to arrive */
+			/* {prefix}parse_answer has written the output parameters */
+			result = RPC_SUCCESS;
+		}}
+	}}
+	{prefix}mutex_lock(RPC_mutex_in_caller);
+	if (result != RPC_SUCCESS && {prefix}pending_calls[slot].answered){{ /* The answer arrived after the timeout */
+		{prefix}mutex_lock((RPC_mutex_id)(RPC_mutex_answer + slot));
+		result = RPC_SUCCESS;
+	}}
+	{prefix}pending_calls[slot].expected_answer = -1;
+{statisticsCount}	{prefix}mutex_unlock(RPC_mutex_in_caller);
+	return result;
+}}
+"""
+            else:
+                result = """
+RPC_RESULT {functionname}({parameterdeclaration}){{
+	RPC_RESULT result = RPC_FAILURE;
+{statisticsStart}	int slot;
+	unsigned char {prefix}correlation;
+{cursorDeclaration}{pointerCheck}
+	/***Registering output parameters***/
+	slot = {prefix}reserve_pending_call({answerID});
+	if (slot < 0) /* too many calls are waiting for their answers */
+		return RPC_FAILURE;
+{outputParameterRegistration}
+	{prefix}correlation = {prefix}pending_calls[slot].correlation;
 
-	for (;;){{
-		{prefix}mutex_lock(RPC_mutex_in_caller);
+	/***Serializing***/
+{messageStart}
+{inputParameterSerializationCode}
+	if ({prefix}message_commit() == RPC_SUCCESS){{ /* successfully sent request */
+{answerWait}
+	}}
+	{prefix}pending_calls[slot].expected_answer = -1;
+{statisticsCount}	return result;
+}}
+"""
+        elif (multiThreadArchicture):
+            result = """
+RPC_RESULT {functionname}({parameterdeclaration}){{
+	RPC_RESULT result = RPC_FAILURE;
+{statisticsStart}{cursorDeclaration}{pointerCheck}	{prefix}mutex_lock(RPC_mutex_caller);
 
-		/***Serializing***/
-		{prefix}message_start({messagesize});
-		{prefix}message_push_byte({requestID}); /* save ID */
+	/***Registering output parameters***/
+	{prefix}mutex_lock(RPC_mutex_in_caller);
+{outputParameterRegistration}
+	{prefix}expected_answer = {answerID};
+	{prefix}mutex_unlock(RPC_mutex_in_caller);
+
+	/***Serializing***/
+{messageStart}
 {inputParameterSerializationCode}
-		if ({prefix}message_commit() == RPC_SUCCESS){{ /* successfully sent request */
-			if ({prefix}mutex_lock_timeout(RPC_mutex_answer)){{ /* Wait for answer to arrive */
-				if (*{prefix}buffer++ != {answerID}){{ /* We got an incorrect answer */
-					{prefix}mutex_unlock(RPC_mutex_in_caller);
-					{prefix}mutex_lock(RPC_mutex_parsing_complete);
-					{prefix}mutex_unlock(RPC_mutex_parsing_complete);
-					{prefix}mutex_unlock(RPC_mutex_answer);
-					continue; /* Try if next answer is correct */
-				}}
-				/***Deserializing***/
-{outputParameterDeserialization}
-				{prefix}mutex_unlock(RPC_mutex_in_caller);
-				{prefix}mutex_lock(RPC_mutex_parsing_complete);
-				{prefix}mutex_unlock(RPC_mutex_parsing_complete);
-				{prefix}mutex_unlock(RPC_mutex_answer);
-				{prefix}mutex_unlock(RPC_mutex_caller);
-				return RPC_SUCCESS;
-			}}
-			else {{ /* We failed to get an answer due to timeout */
-				{prefix}mutex_unlock(RPC_mutex_in_caller);
-				{prefix}mutex_unlock(RPC_mutex_caller);
-				return RPC_FAILURE;
-			}}
+	if ({prefix}message_commit() == RPC_SUCCESS){{ /* successfully sent request */
+		if ({prefix}mutex_lock_timeout(RPC_mutex_answer)){{ /* Wait for answer to arrive */
+			/* {prefix}parse_answer has written the output parameters */
+			result = RPC_SUCCESS;
 		}}
-		else {{ /* Sending request failed */
-			{prefix}mutex_unlock(RPC_mutex_in_caller);
-			{prefix}mutex_unlock(RPC_mutex_caller);
-			return RPC_FAILURE;
+	}}
+	if (result != RPC_SUCCESS){{ /* Sending request failed or we failed to get an answer due to timeout */
+		{prefix}mutex_lock(RPC_mutex_in_caller);
+		if ({prefix}expected_answer != {answerID}){{ /* The answer arrived after the timeout */
+			{prefix}mutex_lock(RPC_mutex_answer);
+			result = RPC_SUCCESS;
 		}}
+		{prefix}expected_answer = -1;
+		{prefix}mutex_unlock(RPC_mutex_in_caller);
 	}}
-	/* assert_dead_code; */
+{statisticsCountLocked}	{prefix}mutex_unlock(RPC_mutex_caller);
+	return result;
 }}
 """
         else:
             result = """
 RPC_RESULT {functionname}({parameterdeclaration}){{
+	RPC_RESULT result = RPC_FAILURE;
+{statisticsStart}{cursorDeclaration}{pointerCheck}
+	/***Registering output parameters***/
+{outputParameterRegistration}
+	{prefix}expected_answer = {answerID};
 
-
-	for (;;){{
-
-		/***Serializing***/
-		{prefix}message_start({messagesize});
-		{prefix}message_push_byte({requestID}); /* save ID */
+	/***Serializing***/
+{messageStart}
 {inputParameterSerializationCode}
-		if ({prefix}message_commit() == RPC_SUCCESS){{ /* successfully sent request */
-			if ({prefix}mutex_lock_timeout(RPC_mutex_answer)){{ /* Wait for answer to arrive */
-				if (*{prefix}buffer++ != {answerID}){{ /* We got an incorrect answer */
-					continue; /* Try if next answer is correct */
-				}}
-				/***Deserializing***/
-{outputParameterDeserialization}
-				return RPC_SUCCESS;
-			}}
-			else {{ /* We failed to get an answer due to timeout */
-				return RPC_FAILURE;
-			}}
-		}}
-		else {{ /* Sending request failed */
-			return RPC_FAILURE;
-		}}
+	if ({prefix}message_commit() == RPC_SUCCESS){{ /* successfully sent request */
+{answerWait}
 	}}
-	/* assert_dead_code; */
+	{prefix}expected_answer = -1;
+{statisticsCount}	return result;
 }}
 """
         result = result.format(
-            requestID=self.ID * 2,
             answerID=self.ID * 2 + 1,
+            inputParameterSerializationCode=self.getSerialization(
+                [p for p in self.parameterlist if p["parameter"].isInput()], 1, True),
+            functionname=self.name,
+            parameterdeclaration=self.getParameterDeclaration(),
+            outputParameterRegistration="\n".join(
+                "\t{outputs}[{index}] = {name};".format(
+                    outputs=outputs,
+                    index=index,
+                    name=p["parameter"].getAddress(p["parametername"])) for index, p in enumerate(self.getOutputParameters())),
+            prefix=prefix,
+            cursorDeclaration=self.getCursorDeclaration(1),
+            pointerCheck=self.getPointerCheck(),
+            messageStart=self.getBatchFlush(1) + self.getMessageStart(
+                self.getRequestSizeExpression(), self.ID * 2, 1, prefix + "correlation"),
+            statisticsStart=self.getStatisticsStart(),
+            statisticsCount=self.getStatisticsCount("", ""),
+            statisticsCountLocked=self.getStatisticsCount(
+                "\t{prefix}mutex_lock(RPC_mutex_in_caller);\n".format(prefix=prefix),
+                "\t{prefix}mutex_unlock(RPC_mutex_in_caller);\n".format(prefix=prefix)),
+            answerWait=getAnswerWait(
+                "(RPC_mutex_id)(RPC_mutex_answer + slot)" if pendingCalls else "RPC_mutex_answer",
+                "{prefix}pending_calls[slot].answered".format(prefix=prefix) if pendingCalls else
+                "{prefix}expected_answer != {ID}".format(prefix=prefix, ID=self.ID * 2 + 1)),
+        )
+        return result;
+
+    def getPointerCheck(self):
+        # returns code that fails calls with more pointer elements than
+        # #pragma RPC max_pointer_elements allows since the server drops them
+        return "".join("""	if ({size} > {maximum}) /* more elements than #pragma RPC max_pointer_elements allows */
+		return RPC_FAILURE;
+""".format(size=p["parameter"].getSizeIdentifier(p["parametername"]), maximum=maxPointerElements)
+            for p in self.parameterlist if isinstance(p["parameter"], PointerDatatype) and p["parameter"].exceedsMaximum())
+
+    def getStatisticsStart(self):
+        # returns the declaration of the time a call starts at
+        if not statisticsRequestID:
+            return ""
+        return "\tuint32_t {prefix}start_time = {prefix}clock();\n".format(prefix=prefix)
+
+    def getStatisticsCount(self, lock, unlock, batched=False):
+        # returns code that adds a call with the result in result to the
+        # statistics, RPC_mutex_in_caller is locked by lock if required,
+        # batched requests have a fixed size and no message of their own
+        if not statisticsRequestID:
+            return ""
+        return """{lock}	{prefix}statistics[{index}].bytes_sent += {size};
+	{prefix}count_call({ID}, result, {prefix}start_time);
+{unlock}""".format(
+            lock=lock,
+            unlock=unlock,
+            prefix=prefix,
+            index=self.ID,
+            size=self.getRequestSizeExpression() if batched else
+            self.getSentSizeExpression(self.getRequestSizeExpression()),
+            ID=self.ID * 2,
+        )
+
+    def getSentSizeExpression(self, size):
+        # messages with varints are as long as they have been encoded
+        if self.varint:
+            return "{prefix}cursor - {prefix}message".format(prefix=prefix)
+        return size
+
+    def getCursorDeclaration(self, indention):
+        if self.varint:  # varints are always written through a cursor
+            return "{indention}unsigned char *{prefix}cursor;\n".format(
+                indention=indention * '\t',
+                prefix=prefix,
+            )
+        return getCursorDeclaration(indention)
+
+    def getMessageStart(self, messagesize, ID, indention, correlation="0"):
+        # messages with varints are encoded into a buffer of their maximum size
+        # first since message_start requires the actual size
+        if not self.varint:
+            return getMessageStart(messagesize, ID, indention, correlation)
+        result = """{indention}unsigned char {prefix}message[{messagesize}];
+{indention}{prefix}cursor = {prefix}message;
+{indention}*{prefix}cursor++ = {ID}; /* save ID */"""
+        if pendingCalls:
+            result += "\n{indention}*{prefix}cursor++ = (unsigned char)({correlation}); /* save correlation byte */"
+        return result.format(
+            indention=indention * '\t',
+            prefix=prefix,
+            messagesize=messagesize,
+            ID=ID,
+            correlation=correlation,
+        )
+
+    def getSerialization(self, parameters, indention, isRequest):
+        # returns the code writing the parameters of a message started by
+        # getMessageStart, messages with varints are sent afterwards
+        global messageReserve
+        useMessageReserve = messageReserve
+        messageReserve = messageReserve or self.varint
+        serialization = "".join(
+            p["parameter"].stringifyRequest(p["parametername"], indention) if isRequest else
+            p["parameter"].stringify(p["parametername"], indention) for p in parameters)
+        messageReserve = useMessageReserve
+        if not self.varint:
+            return serialization
+        size = "{prefix}cursor - {prefix}message".format(prefix=prefix)
+        if messageReserve:
+            send = "{indention}memcpy({reserve}, {prefix}message, {prefix}cursor - {prefix}message);"
+        else:
+            send = """{indention}{{
+{indention}	const unsigned char *{prefix}byte;
+{indention}	for ({prefix}byte = {prefix}message; {prefix}byte < {prefix}cursor; {prefix}byte++)
+{indention}		{push};
+{indention}}}"""
+        return serialization + """
+{indention}/* send the message now that its size is known */
+{indention}{start};
+""".format(indention=indention * '\t', start=getMessageCall("start", size)) + send.format(
+            indention=indention * '\t',
+            prefix=prefix,
+            reserve=getMessageCall("reserve", size),
+            push=getMessageCall("push_byte", "*{prefix}byte".format(prefix=prefix)),
+        )
+
+    def getBatchFlush(self, indention):
+        # returns code that sends the open batch before a request that is sent
+        # at once, otherwise the request would overtake the batched ones
+        if not batchRequestID:
+            return ""
+        return "{indention}{prefix}batch_send(); /* keep the order of the requests */\n".format(
+            indention=indention * '\t', prefix=prefix)
+
+    def getBatchSerialization(self):
+        # a request of a function without answer is added to the open batch
+        # through a cursor into the batch buffer, otherwise it is sent at once
+        global messageReserve
+        useMessageReserve = messageReserve
+        messageReserve = True
+        batchSerializationCode = "".join(
+            p["parameter"].stringifyRequest(
+                p["parametername"],
+                2) for p in self.parameterlist if p["parameter"].isInput())
+        messageReserve = useMessageReserve
+        return """	if ({prefix}batch_open && {size} <= {prefix}BATCH_SIZE){{ /* add the request to the open batch */
+		{prefix}cursor = {prefix}batch_reserve({size});
+		*{prefix}cursor++ = {ID}; /* save ID */{correlation}
+{batchSerializationCode}
+		result = RPC_SUCCESS;
+	}}
+	else{{
+		/***Serializing***/
+{messageStart}
+{inputParameterSerializationCode}
+		result = {prefix}message_commit();
+	}}""".format(
+            prefix=prefix,
+            size=self.getRequestSize(),
+            ID=self.ID * 2,
+            correlation="\n\t\t*{prefix}cursor++ = 0; /* save correlation byte */".format(
+                prefix=prefix) if pendingCalls else "",
+            batchSerializationCode=batchSerializationCode,
             inputParameterSerializationCode="".join(
-                p["parameter"].stringify(
+                p["parameter"].stringifyRequest(
                     p["parametername"],
                     2) for p in self.parameterlist if p["parameter"].isInput()),
+            messageStart=self.getBatchFlush(2) + getMessageStart(self.getRequestSizeExpression(), self.ID * 2, 2),
+        )
+
+    def getOutputParameters(self):
+        return [p for p in self.parameterlist if p["parameter"].isOutput()]
+
+    def getAsyncInputParameters(self):
+        # pure output pointers are not passed to asynchronous calls, the
+        # callback receives the elements instead
+        return [p for p in self.parameterlist if p["parameter"].isInput() and not (
+            isinstance(p["parameter"], PointerDatatype) and not p["parameter"].In)]
+
+    @cachedFragment
+    def getAsyncDeclaration(self):
+        if self.name in functionNoAnswerList:
+            return ""
+        return """typedef void (*{functionname}_callback)({callbackparameters});
+RPC_RESULT {functionname}_async({parameterdeclaration});""".format(
             functionname=self.name,
-            parameterdeclaration=self.getParameterDeclaration(),
+            callbackparameters=", ".join(
+                ["RPC_RESULT result", "void *user_ctx"] +
+                [p["parameter"].declaration(p["parametername"]) for p in self.getOutputParameters()]),
+            parameterdeclaration=", ".join(
+                [p["parameter"].getParameterDeclaration(p["parametername"])
+                 for p in self.getAsyncInputParameters()] +
+                [self.name + "_callback callback", "void *user_ctx"]),
+        )
+
+    @cachedFragment
+    def getAsyncDefinition(self):
+        # the answer of an asynchronous call is decoded into local variables
+        # by {name}_async_complete which then passes them to the callback
+        if self.name in functionNoAnswerList:
+            return ""
+        if (multiThreadArchicture):
+            lock = "\t{prefix}mutex_lock(RPC_mutex_in_caller);\n".format(prefix=prefix)
+            unlock = "\t{prefix}mutex_unlock(RPC_mutex_in_caller);\n".format(prefix=prefix)
+            lockCaller = "\t{prefix}mutex_lock(RPC_mutex_caller);\n".format(prefix=prefix)
+            unlockCaller = "\t{prefix}mutex_unlock(RPC_mutex_caller);\n".format(prefix=prefix)
+        else:
+            lock = unlock = lockCaller = unlockCaller = ""
+        failurearguments = ", ".join(
+            ["RPC_FAILURE", "user_ctx"] +
+            ["0" if isinstance(p["parameter"], PointerSizeDatatype) else "NULL"
+             for p in self.getOutputParameters()])
+        return """
+/* Passes the answer of {functionname}_async to the callback. A NULL answer reports a failure. */
+static void {functionname}_async_complete(const unsigned char *current, void (*callback)(void), void *user_ctx){{
+	/***Declarations***/
+{parameterdeclarations}
+	if (current == NULL){{
+		(({functionname}_callback)callback)({failurearguments});
+		return;
+	}}
+
+	/***Read output parameters***/
+{outputParameterDeserialization}
+	(({functionname}_callback)callback)({successarguments});
+}}
+
+RPC_RESULT {functionname}_async({parameterdeclaration}){{
+	RPC_RESULT result;
+	int slot;
+	unsigned char {prefix}correlation;
+{statisticsStart}{cursorDeclaration}{pointerCheck}
+	/***Registering callback***/
+{lock}	slot = {prefix}reserve_pending_call({answerID});
+	if (slot < 0){{ /* too many calls are waiting for their answers */
+{unlockIndented}		return RPC_FAILURE;
+	}}
+	{prefix}pending_calls[slot].complete = {functionname}_async_complete;
+	{prefix}pending_calls[slot].callback = (void (*)(void))callback;
+	{prefix}pending_calls[slot].user_ctx = user_ctx;{startTimeRegistration}
+	{prefix}correlation = {prefix}pending_calls[slot].correlation;
+{unlock}
+	/***Serializing***/
+{lockCaller}{messageStart}
+{inputParameterSerializationCode}
+	result = {prefix}message_commit();
+{unlockCaller}	if (result != RPC_SUCCESS){{ /* the callback is not called for requests that could not be sent */
+{lockIndented}		if ({prefix}pending_calls[slot].expected_answer == {answerID} &&
+			{prefix}pending_calls[slot].correlation == {prefix}correlation)
+			{prefix}pending_calls[slot].expected_answer = -1;
+		else /* the answer has been received anyway */
+			result = RPC_SUCCESS;
+{unlockIndented}	}}
+{statisticsCount}	return result;
+}}
+""".format(
+            functionname=self.name,
+            answerID=self.ID * 2 + 1,
+            parameterdeclarations="".join(
+                "\t" + p["parameter"].declaration(p["parametername"]) + ";\n"
+                for p in self.getOutputParameters()),
+            failurearguments=failurearguments,
+            successarguments=", ".join(
+                ["RPC_SUCCESS", "user_ctx"] + [p["parametername"] for p in self.getOutputParameters()]),
             outputParameterDeserialization="".join(
-                p["parameter"].unstringify(
-                    prefix + "buffer",
+                p["parameter"].unstringifyIntoStorage(
+                    "current",
                     p["parametername"],
-                    4) for p in self.parameterlist if p["parameter"].isOutput()),
+                    1,
+                    "{{ (({name}_callback)callback)({arguments}); return; }}".format(
+                        name=self.name, arguments=failurearguments))
+                for p in self.getOutputParameters()),
+            parameterdeclaration=", ".join(
+                [p["parameter"].getParameterDeclaration(p["parametername"])
+                 for p in self.getAsyncInputParameters()] +
+                [self.name + "_callback callback", "void *user_ctx"]),
+            inputParameterSerializationCode=self.getSerialization(
+                [p for p in self.parameterlist if p["parameter"].isInput()], 1, True),
             prefix=prefix,
-            messagesize=sum(p["parameter"].getSize() for p in self.parameterlist if p[
-                            "parameter"].isInput()) + 1,
+            lock=lock,
+            unlock=unlock,
+            lockIndented=lock.replace("\t", "\t\t", 1),
+            unlockIndented=unlock.replace("\t", "\t\t", 1),
+            lockCaller=lockCaller,
+            unlockCaller=unlockCaller,
+            cursorDeclaration=self.getCursorDeclaration(1),
+            pointerCheck=self.getPointerCheck(),
+            messageStart=self.getBatchFlush(1) + self.getMessageStart(
+                self.getRequestSizeExpression(), self.ID * 2, 1, prefix + "correlation"),
+            statisticsStart=self.getStatisticsStart(),
+            startTimeRegistration="\n\t{prefix}pending_calls[slot].start_time = {prefix}start_time;".format(
+                prefix=prefix) if statisticsRequestID else "",
+            # answered calls are counted by {prefix}parse_answer
+            statisticsCount="""{lock}	{prefix}statistics[{index}].bytes_sent += {size};
+	if (result != RPC_SUCCESS)
+		{prefix}count_call({ID}, result, {prefix}start_time);
+{unlock}""".format(
+                lock=lock,
+                unlock=unlock,
+                prefix=prefix,
+                index=self.ID,
+                size=self.getSentSizeExpression(self.getRequestSizeExpression()),
+                ID=self.ID * 2,
+            ) if statisticsRequestID else "",
         )
-        return result;
 
+    @cachedFragment
     def getDeclaration(self):
         return "RPC_RESULT {}({});".format(
             # prefix,
@@ -975,76 +2561,205 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
             self.getParameterDeclaration(),
         )
 
+    @cachedFragment
     def getRequestParseCase(self, buffer):
+        return """
+		case {ID}: /* {declaration} */
+		{{{handling}
+		}}
+		break;""".format(
+            ID=self.ID * 2,
+            declaration=self.getDeclaration(),
+            handling=self.getRequestHandling(buffer),
+        )
+
+    @cachedFragment
+    def getRequestHandler(self, buffer):
+        # returns the static function handling the request for the dispatch
+        # table, the handling is indented one level less than in the switch
+        return getRequestHandler(
+            self.getRequestHandlerName(), self.getDeclaration(),
+            self.getRequestHandling(buffer), buffer)
+
+    def getRequestHandlerName(self):
+        return "{}handle_{}".format(
+            prefix, self.name[len(prefix):] if self.generated else self.name)
+
+    def getRequestHandling(self, buffer):
+        # returns the code that reads the request from buffer, calls the
+        # function and sends the answer
         if self.name in functionNoAnswerList:
             return """
-		case {ID}: /* {declaration} */
-		{{
 		/* Declarations */
 {parameterdeclarations}
 		/* Read input parameters */
 {inputParameterDeserialization}
 		/* Call function */
 			{functioncall}
-		/* This function has been set to receive no answer */
-		}}
-		break;""".format(
-                ID=self.ID * 2,
-                declaration=self.getDeclaration(),
-                parameterdeclarations="".join(
-                    "\t\t\t" +
-                    p["parameter"].declaration(
-                        p["parametername"]) +
-                    ";\n" for p in self.parameterlist),
-                inputParameterDeserialization="".join(
-                    p["parameter"].unstringify(
-                        buffer,
-                        p["parametername"],
-                        3) for p in self.parameterlist if p["parameter"].isInput()),
+		/* This function has been set to receive no answer */""".format(
+                parameterdeclarations=self.getRequestParameterDeclarations(),
+                inputParameterDeserialization=self.getRequestParameterUnstringification(
+                    buffer),
                 functioncall=self.getCall(),
             )
         return """
-		case {ID}: /* {declaration} */
-		{{
 		/***Declarations***/
 {parameterdeclarations}
 		/***Read input parameters***/
 {inputParameterDeserialization}
 		/***Call function***/
-			{prefix}reply_cancelled = 0;
+			{replyCancelled} = 0;
 			{functioncall}
-			if ({prefix}reply_cancelled == 0){{
-				/***send return value and output parameters***/
-				{prefix}message_start({messagesize});
-				{prefix}message_push_byte({ID_plus_1});
+			if ({replyCancelled} == 0){{
+{cursorDeclaration}				/***send return value and output parameters***/
+{messageStart}
 					{outputParameterSerialization}
-				{prefix}message_commit();
-			}}
-		}}
-		break;""".format(
-            ID=self.ID * 2,
-            declaration=self.getDeclaration(),
-            parameterdeclarations="".join(
-                "\t\t\t" +
-                p["parameter"].declaration(
-                    p["parametername"]) +
-                ";\n" for p in self.parameterlist),
-            inputParameterDeserialization="".join(
-                p["parameter"].unstringify(
-                    buffer,
-                    p["parametername"],
-                    3) for p in self.parameterlist if p["parameter"].isInput()),
+				{commit}
+			}}""".format(
+            commit="{prefix}count_answer({ID}, {commit}, {size});".format(
+                prefix=prefix,
+                ID=self.ID * 2,
+                commit=getMessageCall("commit"),
+                size=self.getSentSizeExpression(self.getAnswerSizeExpression()),
+            ) if statisticsRequestID else getMessageCall("commit") + ";",
+            replyCancelled="context->reply_cancelled" if messageContext else prefix + "reply_cancelled",
+            parameterdeclarations=self.getRequestParameterDeclarations(),
+            inputParameterDeserialization=self.getRequestParameterUnstringification(
+                buffer),
             functioncall=self.getCall(),
-            outputParameterSerialization="".join(
-                p["parameter"].stringify(
-                    p["parametername"],
-                    4) for p in self.parameterlist if p["parameter"].isOutput()),
-            ID_plus_1=self.ID * 2 + 1,
+            outputParameterSerialization=self.getSerialization(
+                self.getOutputParameters(), 4, False),
             prefix=prefix,
-            messagesize=sum(p["parameter"].getSize() for p in self.parameterlist if p[
-                            "parameter"].isOutput()) + 1,
+            cursorDeclaration=self.getCursorDeclaration(4),
+            messageStart=self.getMessageStart(
+                self.getAnswerSizeExpression(), self.ID * 2 + 1, 4, prefix + "correlation"),
         )
 
+    def getRequestSize(self):
+        # returns the size of the request in bytes, a float if the size is variable
+        return getHeaderSize() + sum(p["parameter"].getRequestSize()
+                                     for p in self.parameterlist if p["parameter"].isInput())
+
+    def getAnswerSize(self):
+        # returns the size of the answer in bytes, a float if the size is variable
+        return getHeaderSize() + sum(p["parameter"].getSize()
+                                     for p in self.parameterlist if p["parameter"].isOutput())
+
+    def getSizeExpression(self, size, pointers):
+        # returns the size of a message as C expression, the elements of the
+        # pointers are added to the fixed size
+        return str(int(size)) + "".join(
+            " + {} * {}".format(p.numberOfElementsIdentifier, int(p.datatype.getSize()))
+            for p in pointers)
+
+    def getRequestPointers(self):
+        # returns the pointers whose elements are sent in the request
+        return [p["parameter"] for p in self.parameterlist if p["parameter"].isInput() and
+                isinstance(p["parameter"], PointerDatatype) and p["parameter"].In]
+
+    def getAnswerPointers(self):
+        # returns the pointers whose elements are sent in the answer
+        return [p["parameter"] for p in self.getOutputParameters()
+                if isinstance(p["parameter"], PointerDatatype)]
+
+    def getRequestSizeExpression(self):
+        return self.getSizeExpression(
+            self.getRequestSize(), self.getRequestPointers())
+
+    def getAnswerSizeExpression(self):
+        return self.getSizeExpression(
+            self.getAnswerSize(), self.getAnswerPointers())
+
+    def getMaximumSize(self, size, pointers):
+        # returns the maximum size of a message in bytes or None if it has
+        # pointers and #pragma RPC max_pointer_elements is not set
+        if pointers and maxPointerElements is None:
+            return None
+        return int(size) + sum(maxPointerElements * int(p.datatype.getSize())
+                               for p in pointers)
+
+    @cachedFragment
+    def getSizeDefinitions(self):
+        # returns #defines for the request and answer sizes, the sizes of
+        # messages with pointers are macros of the numbers of elements
+        name = self.name if self.generated else prefix + self.name
+
+        def getSizeDefinition(macro, size, pointers):
+            if not pointers:
+                return "#define {macro} {size}\n".format(
+                    macro=macro, size=int(size))
+            return "#define {macro}({parameters}) ({size})\n".format(
+                macro=macro,
+                parameters=", ".join(
+                    p.numberOfElementsIdentifier for p in pointers),
+                size=str(int(size)) + "".join(" + ({}) * {}".format(
+                    p.numberOfElementsIdentifier, int(p.datatype.getSize())) for p in pointers))
+        definitions = getSizeDefinition(
+            name + "_REQUEST_SIZE", self.getRequestSize(), self.getRequestPointers())
+        if self.name not in functionNoAnswerList:
+            definitions += getSizeDefinition(
+                name + "_ANSWER_SIZE", self.getAnswerSize(), self.getAnswerPointers())
+        return definitions
+
+    def getVariableSizeComputation(self, buffer, parameters):
+        # returns code that computes the size of a message from the number of
+        # elements of its pointers and its varints. parameters is a list of
+        # datatypes and whether their elements are sent. The size is only
+        # extended as far as the received bytes allow to read the next number
+        # of elements.
+        code = []
+        size = getHeaderSize()
+        assignment = "="
+        for parameter, withElements in parameters:
+            if not isinstance(parameter, PointerDatatype):
+                if not isinstance(parameter.getSize(), float):
+                    size += parameter.getSize()
+                    continue
+                if size > 0 or assignment == "=":
+                    code.append("\t\t\t\treturnvalue.size {assignment} {size};".format(
+                        assignment=assignment, size=size))
+                code.append(parameter.getSkipCode(buffer, 4))
+                assignment = "+="
+                size = 0
+                continue
+            countSize = parameter.sizeDatatype.getSize()
+            code.append("""				returnvalue.size {assignment} {size};
+				if (size_bytes < returnvalue.size) /* number of elements of {name} not received yet */
+					break;""".format(
+                assignment=assignment,
+                size=size + countSize,
+                name=parameter.parametername,
+            ))
+            assignment = "+="
+            size = 0
+            numberOfElements = parameter.getNumberOfElements(
+                "{buffer} + returnvalue.size - {countSize}".format(
+                    buffer=buffer, countSize=countSize))
+            if not withElements:
+                continue
+            if isinstance(parameter.datatype.getSize(), float):
+                code.append("""				{{
+					size_t {prefix}elements = (size_t){numberOfElements};
+					size_t {prefix}COUNTER_VAR4;
+					for ({prefix}COUNTER_VAR4 = 0; {prefix}COUNTER_VAR4 < {prefix}elements; {prefix}COUNTER_VAR4++){{
+{skipCode}
+					}}
+				}}""".format(
+                    numberOfElements=numberOfElements,
+                    skipCode=parameter.datatype.getSkipCode(buffer, 6),
+                    prefix=prefix,
+                ))
+            else:
+                code.append("\t\t\t\treturnvalue.size += (size_t){numberOfElements} * {elementSize};".format(
+                    numberOfElements=numberOfElements,
+                    elementSize=parameter.datatype.getSize(),
+                ))
+        if size > 0:
+            code.append("\t\t\t\treturnvalue.size {assignment} {size};".format(
+                assignment=assignment, size=size))
+        return "\n".join(code)
+
+    @cachedFragment
     def getAnswerSizeCase(self, buffer):
         if self.name in functionNoAnswerList:
             return """\t\t/* case {ID}: {declaration}
@@ -1053,72 +2768,112 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
                 declaration=self.getDeclaration(),
                 ID=self.ID * 2 + 1,
             )
-        size = 1 + sum(p["parameter"].getSize()
-                       for p in self.parameterlist if p["parameter"].isOutput())
+        size = self.getAnswerSize()
         retvalsetcode = ""
         if isinstance(size, float):  # variable length
-            retvalsetcode += """			if (size_bytes >= 3)
-				returnvalue.size = {buffer}[1] + {buffer}[2] << 8;
-			else{{
-				returnvalue.size = 3;
-				returnvalue.result = RPC_COMMAND_INCOMPLETE;
-			}}""".format(buffer=buffer, prefix=prefix)
+            retvalsetcode += self.getVariableSizeComputation(
+                buffer, [(p["parameter"], True) for p in self.getOutputParameters()])
         else:
-            retvalsetcode += "\t\t\treturnvalue.size = " + str(size) + ";"
-        return """\t\tcase {ID}: /* {declaration} */
+            retvalsetcode += "\t\t\t\treturnvalue.size = " + str(size) + ";"
+        return """
+\t\t\tcase {ID}: /* {declaration} */
 {retvalsetcode}
-\t\t\tbreak;
+\t\t\t\tbreak;
 """.format(
             declaration=self.getDeclaration(),
             ID=self.ID * 2 + 1,
             retvalsetcode=retvalsetcode,
         )
 
-    def getAnswerParseCase(self, buffer):
+    @cachedFragment
+    def getAnswerParseCase(self, buffer, outputs):
         if self.name in functionNoAnswerList:
             return ""
-        return """\t\tcase {ID}: /* {declaration} */
-\t\t\tbreak; /*TODO*/
-""".format(
+        # the output parameters registered by the caller in the array outputs
+        # are accessed through pointers to the parameter types, so the
+        # identifiers are dereferenced
+        return """
+		case {ID}: /* {declaration} */
+		{{
+		/***Declarations***/
+{parameterdeclarations}
+		/***Read output parameters***/
+{outputParameterDeserialization}
+		}}
+		break;""".format(
             ID=self.ID * 2 + 1,
             declaration=self.getDeclaration(),
+            parameterdeclarations="".join(
+                "\t\t\t{declaration} = ({cast}){outputs}[{index}];\n".format(
+                    declaration=p["parameter"].declaration(
+                        "(*" + p["parametername"] + ")"),
+                    cast=p["parameter"].declaration("(*)"),
+                    outputs=outputs,
+                    index=index,
+                ) for index, p in enumerate(self.getOutputParameters())),
+            outputParameterDeserialization="".join(
+                p["parameter"].unstringify(
+                    buffer,
+                    "(*" + p["parametername"] + ")",
+                    3) for p in self.getOutputParameters()),
         )
 
+    @cachedFragment
     def getRequestSizeCase(self, buffer):
-        size = 1 + sum(p["parameter"].getSize()
-                       for p in self.parameterlist if p["parameter"].isInput())
+        size = self.getRequestSize()
         retvalsetcode = ""
         if isinstance(size, float):  # variable length
-            retvalsetcode += """			if (size_bytes >= 3)
-				returnvalue.size = {buffer}[1] + {buffer}[2] << 8;
-			else{{
-				returnvalue.size = 3;
-				returnvalue.result = RPC_COMMAND_INCOMPLETE;
-			}}""".format(buffer=buffer, prefix=prefix)
+            retvalsetcode += self.getVariableSizeComputation(
+                buffer, [(p["parameter"], getattr(p["parameter"], "In", True))
+                         for p in self.parameterlist if p["parameter"].isInput()])
         else:
-            retvalsetcode += "\t\t\treturnvalue.size = " + str(size) + ";"
+            retvalsetcode += "\t\t\t\treturnvalue.size = " + str(size) + ";"
         return """
-\t\tcase {answerID}: /* {functiondeclaration} */
+\t\t\tcase {answerID}: /* {functiondeclaration} */
 {retvalsetcode}
-\t\t\tbreak;
+\t\t\t\tbreak;
 """.format(
             answerID=self.ID * 2,
             retvalsetcode=retvalsetcode,
             functiondeclaration=self.getDeclaration(),
         )
 
+    @cachedFragment
     def getDocumentation(self):
         class BytePositionCounter:
 
             def __init__(self, start=0):
                 self.position = start
-
-            def getBytes(self, length):
+                self.runStart = start  # start of the last run of bitfields
+
+            def getBytes(self, length, parameter=None):
+                if isinstance(parameter, BitfieldDatatype):
+                    if parameter.run:  # the first field takes the whole run
+                        self.runStart = self.position
+                        self.getBytes(length)
+                    if self.runStart is None:
+                        return "variable"
+                    start = self.runStart * 8 + parameter.offset
+                    form = "bit {start}" if parameter.bits == 1 else "bits {start}-{end}"
+                    return form.format(start=start, end=start + parameter.bits - 1)
+                if self.position is None:  # behind variable sized data
+                    return "variable"
+                if isinstance(length, float):  # the end is only known at runtime
+                    start = self.position
+                    self.position = None
+                    return "{start}-".format(start=start)
                 form = "{start}" if length == 1 else "{start}-{end}"
                 self.position += length
                 return form.format(start=self.position -
                                    length, end=self.position - 1)
-        pos = BytePositionCounter(start=1)
+        pos = BytePositionCounter(start=getHeaderSize())
+
+        def getLength(length, parameter):
+            if isinstance(parameter, BitfieldDatatype):
+                return "{} bits".format(parameter.bits)
+            if isinstance(length, float):
+                return parameter.getSizeDescription()
+            return length
 
         def stripOneDimensionalArray(vartype):
             if vartype.endswith(" [1]"):
@@ -1130,17 +2885,20 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
             <td class="content">{length}</td>
             <td class="content">{varname}</td>"""
         inputvariables = "</tr><tr>".join(tableformat.format(
-            length=p["parameter"].getSize(),
+            length=getLength(p["parameter"].getRequestSize(), p["parameter"]),
             varname=p["parametername"],
-            bytes=pos.getBytes(p["parameter"].getSize()),
+            bytes=pos.getBytes(
+                p["parameter"].getRequestSize(), p["parameter"]),
             type=stripOneDimensionalArray(p["parameter"].declaration("")),
         )
-            for p in self.parameterlist if p["parameter"].isInput())
+            for p in self.parameterlist if p["parameter"].isInput() and
+            not isinstance(p["parameter"], PointerSizeDatatype))
+        correlation = '</tr><tr><td class="content">1</td><td class="content">uint8_t</td><td class="content">1</td><td class="content">correlation</td>' if pendingCalls else ""
         ID = '<td class="content">0</td><td class="content">uint8_t</td><td class="content">1</td><td class="content">ID = {ID}</td>'.format(
-            ID=self.ID * 2)
+            ID=self.ID * 2) + correlation
         inputvariables = ID + "</tr><tr>" + \
             inputvariables if len(inputvariables) > 0 else ID
-        pos = BytePositionCounter(start=1)
+        pos = BytePositionCounter(start=getHeaderSize())
 
         def getPredefinedData(name):
             if name == "hash_out":
@@ -1151,15 +2909,16 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
                 return str(version_number)
             assert False, "Internal error: invalid name for predefined variable value: " + name
         outputvariables = "</tr><tr>".join(tableformat.format(
-            length=p["parameter"].getSize(),
+            length=getLength(p["parameter"].getSize(), p["parameter"]),
             varname=p["parametername"] if self.ID != 0 else p[
                 "parametername"] + ' = ' + getPredefinedData(p["parametername"]),
-            bytes=pos.getBytes(p["parameter"].getSize()),
+            bytes=pos.getBytes(p["parameter"].getSize(), p["parameter"]),
             type=stripOneDimensionalArray(p["parameter"].declaration("")),
         )
-            for p in self.parameterlist if p["parameter"].isOutput())
+            for p in self.parameterlist if p["parameter"].isOutput() and
+            not isinstance(p["parameter"], PointerSizeDatatype))
         ID = '<td class="content">0</td><td class="content">uint8_t</td><td class="content">1</td><td class="content">ID = {ID}</td>'.format(
-            ID=self.ID * 2 + 1)
+            ID=self.ID * 2 + 1) + correlation
         outputvariables = ID + "</tr><tr>" + \
             outputvariables if len(outputvariables) > 0 else ID
 
@@ -1170,7 +2929,7 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
                 structSet.add(parameter)
                 for m in parameter.memberList:
                     addToStructSet(structSet, m)
-            elif isinstance(parameter, ArrayDatatype):
+            elif isinstance(parameter, (ArrayDatatype, PointerDatatype)):
                 addToStructSet(structSet, parameter.datatype)
         for p in self.parameterlist:
             addToStructSet(structSet, p["parameter"])
@@ -1180,7 +2939,7 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
             if isinstance(parameter, StructDatatype):
                 for m in parameter.memberList:
                     addToEnumSet(structSet, m)
-            elif isinstance(parameter, ArrayDatatype):
+            elif isinstance(parameter, (ArrayDatatype, PointerDatatype)):
                 addToEnumSet(enumSet, parameter.datatype)
             elif isinstance(parameter, EnumDatatype):
                 enumSet.add(parameter)
@@ -1204,11 +2963,11 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
             pos = BytePositionCounter()
             structcontent += contentformat.format(name=s.signature, content="</tr><tr>".join(
                 tableformat.format(
-                    length=m[
-                        "datatype"].getSize(),
+                    length=getLength(
+                        m["datatype"].getSize(), m["datatype"]),
                     varname=m["name"],
                     bytes=pos.getBytes(
-                        m["datatype"].getSize()),
+                        m["datatype"].getSize(), m["datatype"]),
                     type=stripOneDimensionalArray(
                         m["datatype"].declaration("")),
                 ) for m in s.memberList)
@@ -1264,8 +3023,8 @@ RPC_RESULT {functionname}({parameterdeclaration}){{
         )
 
 
-def setIntegralDataType(signature, size_bytes):
-    datatypes[signature] = IntegralDatatype(signature, size_bytes)
+def setIntegralDataType(signature, size_bytes, bits=None):
+    datatypes[signature] = IntegralDatatype(signature, size_bytes, bits)
 
 
 def setBasicDataType(signature, size_bytes):
@@ -1273,9 +3032,9 @@ def setBasicDataType(signature, size_bytes):
 
 
 def setEnumDataType(signature, size_bytes, transfertype,
-                    values, name, typedef):
+                    values, name, typedef, bits=None):
     datatypes[signature] = EnumDatatype(
-        signature, size_bytes, transfertype, values, name, typedef)
+        signature, size_bytes, transfertype, values, name, typedef, bits)
 
 
 def setPredefinedDataTypes():
@@ -1297,6 +3056,10 @@ def setPredefinedDataTypes():
     )
     for t in typeslist:
         setIntegralDataType(t[0], t[1])
+    # sent as one byte unless they are packed, see getNonstandardTypedefs
+    for bits in range(1, 8):
+        setIntegralDataType("int{}_t".format(bits), 1, bits)
+        setIntegralDataType("uint{}_t".format(bits), 1, bits)
 
 
 def setEnumTypes(enums):
@@ -1339,13 +3102,18 @@ def setEnumTypes(enums):
                 requiredBytes) + "bytes and does not fit in a 32 bit integer"
         if minimum >= 0:
             cast = "u" + cast
+            packedBits = max(1, maximum.bit_length())
+        else:
+            packedBits = max(maximum.bit_length(),
+                             (-minimum - 1).bit_length()) + 1
         setEnumDataType(
             name,
             requiredBytes,
             cast,
             e["values"],
             e["name"],
-            e["typedef"])
+            e["typedef"],
+            packedBits)
         datatypeDeclarations.append(datatypes[name].getTypeDeclaration())
 
 
@@ -1444,10 +3212,23 @@ def getFunctionParameter(parameter):
         assert parameter["name"].endswith("_in") or parameter["name"].endswith("_out") or parameter["name"].endswith("_inout"),\
             'In {1}:{2}: Pointer parameter "{0}" must either have a suffix "_in", "_out", "_inout" or be a fixed size array.'.format(
                 parameter["name"], currentFile, parameter["line_number"])
+        elementtype = parameter["type"][:-2]
+        if elementtype.startswith("const "):  # the elements are only read
+            assert parameter["name"].endswith("_in"), \
+                'In {1}:{2}: Pointer parameter "{0}" points to const elements and must have the suffix "_in".'.format(
+                    parameter["name"], currentFile, parameter["line_number"])
+            elementtype = elementtype[len("const "):]
         return {"isPointerRequiringSize": True, "parameter": PointerDatatype(parameter["type"], getDatatype(
-            parameter["type"][:-2], currentFile, parameter["line_number"]), parameter["name"])}
+            elementtype, currentFile, parameter["line_number"]), parameter["name"])}
+    basetype = parameter["type"]
+    const = parameter["array"] and basetype.startswith("const ")
+    if const:  # the elements are only read
+        assert parameter["name"].endswith("_in"), \
+            'In {1}:{2}: Array parameter "{0}" has const elements and must have the suffix "_in".'.format(
+                parameter["name"], currentFile, parameter["line_number"])
+        basetype = basetype[len("const "):]
     basetype = getDatatype(
-        parameter["type"],
+        basetype,
         currentFile,
         parameter["line_number"])
     if parameter["array"]:  # array
@@ -1460,6 +3241,7 @@ def getFunctionParameter(parameter):
         arraySizes = arraySizes[1:]
         for arraySize in arraySizes:
             current = ArrayDatatype(arraySize, current, parameter["name"])
+        current.const = const
         return {"isPointerRequiringSize": False, "parameter": current}
     else:  # base type
         return {"isPointerRequiringSize": False, "parameter": basetype}
@@ -1480,8 +3262,9 @@ def getFunctionParameterList(parameters):
                 "isPointerRequiringSize"]
             parameter = functionparameter["parameter"]
             assert not isPointerRequiringSize, sizeParameterErrorText
+            parameter = PointerSizeDatatype(parameter, paramlist[-1]["parameter"])
             paramlist[-1]["parameter"].setNumberOfElementsIdentifier(
-                pointersizename)
+                pointersizename, parameter.datatype)
             paramlist.append(
                 {"parameter": parameter, "parametername": p["name"]})
         else:
@@ -1512,10 +3295,14 @@ def getFunction(function):
             getFunction.functionID += 1
         except AttributeError:
             getFunction.functionID = start_command_id
-        while getFunction.functionID in functionPredefinedIDs.values():
+        while getFunction.functionID in functionPredefinedIDs.values() or getFunction.functionID * 2 in (batchRequestID, statisticsRequestID):
             getFunction.functionID += 1
         assert getFunction.functionID < 127, "Too many functions, require changes to allow bigger function ID variable"
         ID = getFunction.functionID
+    assert ID * 2 != batchRequestID, "ID {ID} cannot be used for both function '{f}' and batch_id".format(
+        ID=ID * 2, f=name)
+    assert ID * 2 != statisticsRequestID, "ID {ID} cannot be used for both function '{f}' and statistics_id".format(
+        ID=ID * 2, f=name)
     returntype = getFunctionReturnType(function)
     parameterlist = getFunctionParameterList(function["parameters"])
     return Function(ID, returntype, name, parameterlist)
@@ -1611,10 +3398,11 @@ def getSizeFunction(functions, clientHeader,
 
 #include <string.h>
 #include <stdint.h>
+#include <assert.h>
 
-uint8_t {prefix}reply_cancelled = 0;
+{replyState}
 {hash}
-
+{layoutChecks}
 /* auto-generated implementation */
 void {prefix}get_hash_impl(unsigned char hash_out[16], unsigned char start_command_id_out[1], uint16_t version_out[1]){{
 	memcpy(hash_out, {prefix}HASH, 16);
@@ -1624,9 +3412,10 @@ void {prefix}get_hash_impl(unsigned char hash_out[16], unsigned char start_comma
 
 /* auto-generated implementation */
 void {prefix}cancel_reply(){{
-	{prefix}reply_cancelled = 1;
+	{replyCancelled} = 1;
 }}
 
+{sizetable}
 /* Receives a pointer to a (partly) received message and it's size.
    Returns a result and a size. If size equals RPC_SUCCESS then size is the
    size that the message is supposed to have. If result equals RPC_COMMAND_INCOMPLETE
@@ -1642,120 +3431,911 @@ RPC_SIZE_RESULT {prefix}get_request_size(const void *buffer, size_t size_bytes){
 		return returnvalue;
 	}}
 
-	switch (*current){{ /* switch by message ID */{cases}
-		default:
-			returnvalue.size = 0;
-			returnvalue.result = RPC_COMMAND_UNKNOWN;
-			return returnvalue;
+	returnvalue.size = {prefix}request_size_table[*current];
+	if (returnvalue.size == 0){{ /* unknown or variable size request */{sizecode}
+	}}
+	returnvalue.result = returnvalue.size > size_bytes ? RPC_COMMAND_INCOMPLETE : RPC_SUCCESS;
+	return returnvalue;
+}}
+""".format(
+        hash=getHash(),
+        layoutChecks=getLayoutChecks(functions),
+        sizetable=getSizeTable(
+            prefix + "request_size_table",
+            dict((f.ID * 2, f.getRequestSize()) for f in functions)),
+        sizecode=getVariableSizeCode(
+            "".join(f.getRequestSizeCase("current") for f in functions
+                    if isinstance(f.getRequestSize(), float)) +
+            (getBatchRequestSizeCase() if batchRequestID else ""),
+            "\n\t\t\treturnvalue.size = 0;"),
+        prefix=prefix,
+        network_include=join(parser_to_generic_path, prefix + "network.h"),
+        parser_include=join(parser_to_generic_path, prefix + "parser.h"),
+        parser_to_server_header_path=parser_to_server_header_path,
+        replyState="""#ifndef RPC_THREAD_LOCAL
+#define RPC_THREAD_LOCAL _Thread_local /* define it yourself for compilers without C11, for example as __thread */
+#endif
+
+/* context of the request the current thread parses */
+static RPC_THREAD_LOCAL RPC_CONTEXT *{prefix}current_context;""".format(prefix=prefix) if serverReentrant else
+        "uint8_t {prefix}reply_cancelled = 0;".format(prefix=prefix),
+        replyCancelled=prefix + ("current_context->reply_cancelled" if serverReentrant else "reply_cancelled"),
+    )
+
+
+def getLayoutChecks(functions):
+    # the structs the server uses in place in received messages must have the
+    # layout of the messages
+    structs = []
+
+    def addStructs(datatype):
+        if isinstance(datatype, (ArrayDatatype, PointerDatatype)):
+            addStructs(datatype.datatype)
+        elif isinstance(datatype, StructDatatype) and datatype.signature not in (struct.signature for struct in structs):
+            # compared by signature since encodings copy the datatypes of
+            # every parameter
+            for m in datatype.memberList:
+                addStructs(m["datatype"])
+            structs.append(datatype)
+    for f in functions:
+        for p in f.getZerocopyParameters():
+            addStructs(p["parameter"])
+    if not structs:
+        return ""
+    return """
+/* Structs of zerocopy parameters must be packed and have the layout of the
+   messages, otherwise compiling fails here. Remove #pragma RPC zerocopy for
+   the function or pack the struct. */
+#if RPC_LITTLE_ENDIAN
+{checks}#endif
+""".format(checks="".join(s.getLayoutCheck() for s in structs))
+
+
+def getRequestParseCases(functions, buffername):
+    cases = "".join(f.getRequestParseCase(buffername) for f in functions)
+    if batchRequestID:
+        cases += getBatchRequestParseCase()
+    return cases
+
+
+def getRequestParser(functions):
+    buffername = "current"
+    if statisticsRequestID:
+        statisticsStart = "\tconst uint32_t {prefix}start_time = {prefix}clock();\n".format(prefix=prefix)
+        statisticsCount = "\t{prefix}count_request(buffer, size_bytes, {prefix}start_time);\n".format(prefix=prefix)
+    else:
+        statisticsStart = "\t(void)size_bytes;\n"
+        statisticsCount = ""
+    # the context is kept for {prefix}cancel_reply
+    contextStart = "\t{prefix}current_context = context;\n".format(
+        prefix=prefix) if serverReentrant else ""
+    if dispatchTable:
+        if pendingCalls:
+            call = "handler((const unsigned char *)buffer + 2, ((const unsigned char *)buffer)[1]{context}); /* skip ID and correlation byte */"
+        else:
+            call = "handler((const unsigned char *)buffer + 1{context});"
+        call = call.format(context=", context" if serverReentrant else "")
+        return getRequestDispatchTable(functions, buffername) + """
+/* This function parses RPC requests, calls the original function and sends an
+   answer. The request is passed to the handler of its ID. */
+void {prefix}parse_request(const void *buffer, size_t size_bytes{contextParameter}){{
+{statisticsStart}{contextStart}	void (*handler)({parameters}) = {prefix}request_handlers[*(const unsigned char *)buffer];
+	if (handler)
+		{call}
+{statisticsCount}}}""".format(
+            prefix=prefix,
+            parameters=getRequestHandlerParameters(buffername),
+            call=call,
+            statisticsStart=statisticsStart,
+            statisticsCount=statisticsCount,
+            contextParameter=getContextParameter(),
+            contextStart=contextStart,
+        )
+    if pendingCalls:
+        return """
+/* This function parses RPC requests, calls the original function and sends an
+   answer that carries the correlation byte of the request. */
+void {prefix}parse_request(const void *buffer, size_t size_bytes{contextParameter}){{
+{statisticsStart}{contextStart}	const unsigned char *{buffername} = (const unsigned char *)buffer + 2; /* skip ID and correlation byte */
+	const unsigned char {prefix}correlation = ((const unsigned char *)buffer)[1];
+	switch (*(const unsigned char *)buffer){{ /* switch (request ID) */ {cases}
+	}}
+{statisticsCount}}}""".format(
+            cases=getRequestParseCases(functions, buffername),
+            buffername=buffername,
+            prefix=prefix,
+            statisticsStart=statisticsStart,
+            statisticsCount=statisticsCount,
+            contextParameter=getContextParameter(),
+            contextStart=contextStart,
+        )
+    return """
+/* This function parses RPC requests, calls the original function and sends an
+   answer. */
+void {prefix}parse_request(const void *buffer, size_t size_bytes{contextParameter}){{
+{statisticsStart}{contextStart}	const unsigned char *{buffername} = (const unsigned char *)buffer;
+	switch (*current++){{ /* switch (request ID) */ {cases}
+	}}
+{statisticsCount}}}""".format(
+        cases=getRequestParseCases(functions, buffername),
+        buffername=buffername,
+        prefix=prefix,
+        statisticsStart=statisticsStart,
+        statisticsCount=statisticsCount,
+            contextParameter=getContextParameter(),
+            contextStart=contextStart,
+    )
+
+
+def getAnswerState(functions):
+    if pendingCalls:
+        return """/* Calls waiting for their answers. An answer belongs to the call with the
+   answer ID and the correlation byte the server copied from the request. */
+static struct {{
+	int expected_answer; /* ID of the answer, -1 if the slot is free */
+	char answered; /* {prefix}parse_answer has written the output parameters */
+	unsigned char correlation;
+	void *outputs[{size}]; /* output parameters of the waiting caller */{asyncMembers}
+}} {prefix}pending_calls[{pendingCalls}] = {{{slots}}};
+static unsigned char {prefix}next_correlation;
+
+/* Returns a free slot in {prefix}pending_calls for a call waiting for the answer
+   answer_id or -1 if all slots are in use. The caller waits on the mutex
+   RPC_mutex_answer + slot. Requires RPC_mutex_in_caller to be locked. */
+static int {prefix}reserve_pending_call(int answer_id){{
+	int slot;
+	for (slot = 0; slot < {pendingCalls}; slot++){{
+		if ({prefix}pending_calls[slot].expected_answer == -1){{
+			{prefix}pending_calls[slot].expected_answer = answer_id;
+			{prefix}pending_calls[slot].answered = 0;
+			{prefix}pending_calls[slot].correlation = {prefix}next_correlation++;{asyncReset}
+			return slot;
+		}}
+	}}
+	return -1;
+}}
+""".format(
+            prefix=prefix,
+            size=max([1] + [len(f.getOutputParameters()) for f in functions]),
+            pendingCalls=pendingCalls,
+            # every member is initialized to avoid -Wmissing-field-initializers
+            slots=", ".join(["{-1, 0, 0, {0}" + (", NULL, NULL, NULL" + (", 0" if statisticsRequestID else "")
+                                                if asyncFunctions else "") + "}"] * pendingCalls),
+            asyncMembers="""
+	/* asynchronous calls have no waiting caller, the answer is passed to complete */
+	void (*complete)(const unsigned char *answer, void (*callback)(void), void *user_ctx);
+	void (*callback)(void);
+	void *user_ctx;""" + ("""
+	uint32_t start_time; /* {prefix}clock() when the asynchronous call started */""".format(
+                prefix=prefix) if statisticsRequestID else "") if asyncFunctions else "",
+            asyncReset="\n\t\t\t{prefix}pending_calls[slot].complete = NULL;".format(
+                prefix=prefix) if asyncFunctions else "",
+        )
+    return """static int {prefix}expected_answer = -1; /* ID of the answer the caller is waiting for, -1 if none */
+static void *{prefix}answer_outputs[{size}]; /* output parameters of the waiting caller */
+""".format(
+        prefix=prefix,
+        size=max([1] + [len(f.getOutputParameters()) for f in functions]),
+    )
+
+
+def getStatisticsCount(functions):
+    # the statistics are indexed by request ID / 2
+    return max(f.ID for f in functions) + 1
+
+
+def getClientStatistics(functions):
+    return """
+RPC_STATISTICS {prefix}statistics[{count}];
+
+/* Adds a call that started at start_time to the statistics of its function.
+   Requires RPC_mutex_in_caller to be locked. */
+static void {prefix}count_call(unsigned char request_id, RPC_RESULT result, uint32_t start_time){{
+	RPC_STATISTICS *statistics = &{prefix}statistics[request_id / 2];
+	uint32_t time = {prefix}clock() - start_time;
+	statistics->calls++;
+	if (result != RPC_SUCCESS){{ /* failed to send the request or timed out */
+		statistics->failures++;
+		return;
+	}}
+	statistics->time_total += time;
+	if (time > statistics->time_max)
+		statistics->time_max = time;
+}}
+""".format(prefix=prefix, count=getStatisticsCount(functions))
+
+
+def getServerStatistics(functions):
+    return """
+RPC_STATISTICS {prefix}statistics[{count}];
+
+/* Adds a request that has been handled since start_time to the statistics of
+   its function. */
+static void {prefix}count_request(const void *buffer, size_t size_bytes, uint32_t start_time){{
+	const unsigned char request_id = *(const unsigned char *)buffer;
+	RPC_SIZE_RESULT size = {prefix}get_request_size(buffer, size_bytes);
+	uint32_t time = {prefix}clock() - start_time;
+	RPC_STATISTICS *statistics;
+	if (size.result != RPC_SUCCESS{batchCheck}) /* not a request of a function */
+		return;
+	statistics = &{prefix}statistics[request_id / 2];
+	statistics->calls++;
+	statistics->bytes_received += size.size;
+	statistics->time_total += time;
+	if (time > statistics->time_max)
+		statistics->time_max = time;
+}}
+
+/* Adds an answer of size bytes that has been sent with the result to the
+   statistics of the function with the request ID. */
+static void {prefix}count_answer(unsigned char request_id, RPC_RESULT result, size_t size){{
+	{prefix}statistics[request_id / 2].bytes_sent += size;
+	if (result != RPC_SUCCESS)
+		{prefix}statistics[request_id / 2].failures++;
+}}
+
+/* auto-generated implementation */
+void {prefix}get_statistics_impl(uint8_t request_id, uint32_t statistics_out[6]){{
+	const RPC_STATISTICS *statistics;
+	if (request_id / 2 >= {count}){{ /* no function has this request ID */
+		memset(statistics_out, 0, 6 * sizeof *statistics_out);
+		return;
+	}}
+	statistics = &{prefix}statistics[request_id / 2];
+	statistics_out[0] = statistics->calls;
+	statistics_out[1] = statistics->failures;
+	statistics_out[2] = statistics->bytes_sent;
+	statistics_out[3] = statistics->bytes_received;
+	statistics_out[4] = statistics->time_total;
+	statistics_out[5] = statistics->time_max;
+}}
+""".format(
+        prefix=prefix,
+        count=getStatisticsCount(functions),
+        batchCheck=" || request_id == {}".format(batchRequestID) if batchRequestID else "",
+    )
+
+
+def getStatisticsType():
+    return """/* Statistics of the calls of a function, see {prefix}statistics in
+   {prefix}network.h. Times are measured with {prefix}clock. */
+typedef struct {{
+	uint32_t calls;
+	uint32_t failures; /* requests that could not be sent, timed out or whose answers could not be sent */
+	uint32_t bytes_sent;
+	uint32_t bytes_received;
+	uint32_t time_total; /* of successful calls, round trip on the client, function call on the server */
+	uint32_t time_max;
+}} RPC_STATISTICS;
+
+""".format(prefix=prefix)
+
+
+def getStatisticsDeclarations(functions):
+    return """
+
+#define {prefix}STATISTICS_COUNT {count}
+extern RPC_STATISTICS {prefix}statistics[{prefix}STATISTICS_COUNT];
+/* Statistics of the calls of every function indexed by request ID / 2. The
+   client counts the calls of the {prefix}* functions, the server counts the
+   requests it has handled. {prefix}get_statistics reads the statistics of the
+   server. */""".format(prefix=prefix, count=getStatisticsCount(functions))
+
+
+def getBatchFunctions():
+    if (multiThreadArchicture):
+        lock = """	{prefix}mutex_lock(RPC_mutex_caller);
+	{prefix}mutex_lock(RPC_mutex_in_caller);
+""".format(prefix=prefix)
+        unlock = """	{prefix}mutex_unlock(RPC_mutex_in_caller);
+	{prefix}mutex_unlock(RPC_mutex_caller);
+""".format(prefix=prefix)
+    else:
+        lock = unlock = ""
+    if messageReserve:
+        bodySerialization = """	memcpy({prefix}cursor, {prefix}batch_buffer, {prefix}batch_length);""".format(prefix=prefix)
+    else:
+        bodySerialization = """	{{
+		size_t i;
+		for (i = 0; i < {prefix}batch_length; i++)
+			{prefix}message_push_byte({prefix}batch_buffer[i]);
+	}}""".format(prefix=prefix)
+    return """
+static unsigned char {prefix}batch_buffer[{prefix}BATCH_SIZE];
+static size_t {prefix}batch_length;
+static char {prefix}batch_open;
+static RPC_RESULT {prefix}batch_result;
+
+/* Sends the requests collected in the batch as one message. */
+static void {prefix}batch_send(void){{
+{cursorDeclaration}	if ({prefix}batch_length == 0)
+		return;
+{messageStart}
+	{pushLengthLow}
+	{pushLengthHigh}
+{bodySerialization}
+	if ({prefix}message_commit() != RPC_SUCCESS)
+		{prefix}batch_result = RPC_FAILURE;
+	{prefix}batch_length = 0;
+}}
+
+/* Returns a pointer to size bytes at the end of the batch. The batch is sent
+   first if the bytes do not fit. */
+static unsigned char *{prefix}batch_reserve(size_t size){{
+	unsigned char *result;
+	if ({prefix}batch_length + size > {prefix}BATCH_SIZE)
+		{prefix}batch_send();
+	result = {prefix}batch_buffer + {prefix}batch_length;
+	{prefix}batch_length += size;
+	return result;
+}}
+
+void {prefix}batch_begin(void){{
+{lock}	{prefix}batch_open = 1;
+	{prefix}batch_result = RPC_SUCCESS;
+{unlock}}}
+
+RPC_RESULT {prefix}batch_commit(void){{
+	RPC_RESULT result;
+{lock}	{prefix}batch_send();
+	{prefix}batch_open = 0;
+	result = {prefix}batch_result;
+{unlock}	return result;
+}}
+""".format(
+        prefix=prefix,
+        lock=lock,
+        unlock=unlock,
+        cursorDeclaration=getCursorDeclaration(1),
+        messageStart=getMessageStart(
+            "{prefix}batch_length + {size}".format(prefix=prefix, size=getHeaderSize() + 2),
+            batchRequestID, 1),
+        pushLengthLow=getPushByte(prefix + "batch_length"),
+        pushLengthHigh=getPushByte(prefix + "batch_length >> 8"),
+        bodySerialization=bodySerialization,
+    )
+
+
+def getMessageSizes(functions):
+    # returns #defines for the sizes of all messages and the maximum sizes of
+    # requests and answers
+    def getMaximum(sizes):
+        if None in sizes:
+            return None
+        return max(sizes)
+    maxRequestSize = getMaximum([f.getMaximumSize(
+        f.getRequestSize(), f.getRequestPointers()) for f in functions])
+    maxAnswerSize = getMaximum([f.getMaximumSize(
+        f.getAnswerSize(), f.getAnswerPointers()) for f in functions
+        if f.name not in functionNoAnswerList])
+    result = """
+/* Sizes of messages in bytes, for example to allocate message buffers
+   statically. The sizes of messages with pointers depend on the numbers of
+   elements. Messages with varints may be shorter. */
+""" + "".join(f.getSizeDefinitions() for f in functions)
+    if batchRequestID:
+        result += """
+#ifndef {prefix}BATCH_SIZE
+#define {prefix}BATCH_SIZE 256 /* number of bytes of requests sent in one batch */
+#endif
+#if {prefix}BATCH_SIZE > 65535
+#error "{prefix}BATCH_SIZE must be less than 65536"
+#endif
+#define {prefix}BATCH_REQUEST_SIZE ({prefix}BATCH_SIZE + {size})
+""".format(prefix=prefix, size=getHeaderSize() + 2)
+    if maxRequestSize is None:
+        return result + """
+/* {prefix}MAX_REQUEST_SIZE and {prefix}MAX_ANSWER_SIZE require
+   #pragma RPC max_pointer_elements in the server header */
+""".format(prefix=prefix)
+    if batchRequestID:
+        maxRequestSize = "({size} > {prefix}BATCH_REQUEST_SIZE ? {size} : {prefix}BATCH_REQUEST_SIZE)".format(
+            prefix=prefix, size=maxRequestSize)
+    return result + """
+#define {prefix}MAX_REQUEST_SIZE {maxRequestSize}
+#define {prefix}MAX_ANSWER_SIZE {maxAnswerSize}
+""".format(
+        prefix=prefix,
+        maxRequestSize=maxRequestSize,
+        maxAnswerSize=maxAnswerSize,
+    )
+
+
+def getStaticBuffers(useMessageReserve, transmitSize, receiveSize, name):
+    # returns the message_* functions using a buffer of the maximum message
+    # size and {prefix}receive which frames received data in a static buffer
+    if useMessageReserve:
+        pushDefinition = """unsigned char *{prefix}message_reserve(size_t size){{
+	unsigned char *reserved = {prefix}transmit_buffer + {prefix}transmit_size;
+	assert(size <= sizeof {prefix}transmit_buffer); /* messages are bounded by #pragma RPC max_pointer_elements */
+	if ({prefix}transmit_size > sizeof {prefix}transmit_buffer - size){{ /* does not fit, let {prefix}message_commit fail */
+		{prefix}transmit_size = sizeof {prefix}transmit_buffer + 1;
+		return {prefix}transmit_buffer; /* the message is written but never sent */
+	}}
+	{prefix}transmit_size += size;
+	return reserved;
+}}"""
+    else:
+        pushDefinition = """void {prefix}message_push_byte(unsigned char byte){{
+	if ({prefix}transmit_size < sizeof {prefix}transmit_buffer)
+		{prefix}transmit_buffer[{prefix}transmit_size] = byte;
+	{prefix}transmit_size++;
+}}"""
+    return ("""
+/* Buffers of the maximum message sizes, generated since STATIC_MESSAGE_BUFFERS
+   is set in the config. */
+static unsigned char {prefix}transmit_buffer[{transmitSize}];
+static size_t {prefix}transmit_size;
+static unsigned char {prefix}receive_buffer[{receiveSize}];
+static RPC_FRAMER {prefix}receive_framer = {{{prefix}receive_buffer, sizeof {prefix}receive_buffer, 0, 1, 0}};
+
+void {prefix}message_start(size_t size){{
+	assert(size <= sizeof {prefix}transmit_buffer);
+	(void)size;
+	{prefix}transmit_size = 0;
+}}
+
+""" + pushDefinition + """
+
+RPC_RESULT {prefix}message_commit(void){{
+	if ({prefix}transmit_size > sizeof {prefix}transmit_buffer) /* the message did not fit */
+		return RPC_FAILURE;
+	return {prefix}send({prefix}transmit_buffer, {prefix}transmit_size);
+}}
+
+RPC_RESULT {prefix}receive(const void *data, size_t size_bytes){{
+	return {prefix}feed_{name}s(&{prefix}receive_framer, data, size_bytes);
+}}
+""").format(
+        prefix=prefix,
+        transmitSize=transmitSize,
+        receiveSize=receiveSize,
+        name=name,
+    )
+
+
+def getRequestHandlerParameters(buffername):
+    if pendingCalls:
+        parameters = "const unsigned char *{}, const unsigned char {}correlation".format(
+            buffername, prefix)
+    else:
+        parameters = "const unsigned char *{}".format(buffername)
+    return parameters + getContextParameter()
+
+
+def getContextParameter():
+    # the reentrant server parser passes the context of a request along
+    return ", RPC_CONTEXT *context" if serverReentrant else ""
+
+
+def getRequestHandler(name, description, handling, buffername):
+    # returns a static function for the dispatch table that runs the handling
+    # code of a parse case, the handling is indented one level less than in
+    # the switch
+    unused = "".join("\n\t(void){};".format(p) for p in (buffername, prefix + "correlation", "context")
+                     if p in getRequestHandlerParameters(buffername) and p not in handling)
+    return """
+/* {description} */
+static void {name}({parameters}){{{unused}{handling}
+}}
+""".format(
+        description=description,
+        name=name,
+        parameters=getRequestHandlerParameters(buffername),
+        unused=unused,
+        handling=handling.replace("\n\t", "\n"),
+    )
+
+
+def getRequestDispatchTable(functions, buffername):
+    # returns the handlers of all requests and the table of them indexed by
+    # request ID, unknown IDs are NULL
+    handlers = "".join(f.getRequestHandler(buffername) for f in functions)
+    entries = ["\t[{}] = {},".format(f.ID * 2, f.getRequestHandlerName()) for f in functions]
+    if batchRequestID:
+        handlers += getRequestHandler(prefix + "handle_batch", "batch of requests",
+                                      getBatchRequestHandling(), buffername)
+        entries.append("\t[{}] = {}handle_batch,".format(batchRequestID, prefix))
+    return """{handlers}
+/* request handlers indexed by request ID, NULL for unknown requests */
+static void (*const {prefix}request_handlers[256])({parameters}) = {{
+{entries}
+}};
+""".format(
+        handlers=handlers,
+        prefix=prefix,
+        parameters=getRequestHandlerParameters(buffername),
+        entries="\n".join(entries),
+    )
+
+
+def getBatchRequestParseCase():
+    return """
+		case {ID}: /* batch of requests */
+		{{{handling}
+		}}
+		break;""".format(ID=batchRequestID, handling=getBatchRequestHandling())
+
+
+def getBatchRequestHandling():
+    return """
+			const unsigned char *end = current + 2 + (current[0] | current[1] << 8);
+			current += 2;
+			while (current < end){{
+				RPC_SIZE_RESULT size = {prefix}get_request_size(current, end - current);
+				if (size.result != RPC_SUCCESS)
+					break; /* the rest of the batch is invalid */
+				{prefix}parse_request(current, size.size{context});
+				current += size.size;
+			}}""".format(prefix=prefix, context=", context" if serverReentrant else "")
+
+
+def getBatchRequestSizeCase():
+    return """
+			case {ID}: /* batch of requests */
+				returnvalue.size = {size};
+				if (size_bytes >= {size})
+					returnvalue.size += current[{low}] | current[{high}] << 8;
+				break;
+""".format(
+        ID=batchRequestID,
+        size=getHeaderSize() + 2,
+        low=getHeaderSize(),
+        high=getHeaderSize() + 1,
+    )
+
+
+def getAnswerParser(functions):
+    buffername = "current"
+    if(multiThreadArchicture):
+        lock = "\t{prefix}mutex_lock(RPC_mutex_in_caller);\n".format(prefix=prefix)
+        unlock = "\t{prefix}mutex_unlock(RPC_mutex_in_caller);\n".format(prefix=prefix)
+    else:
+        lock = unlock = ""
+    if pendingCalls:
+        return """
+/* This function writes the answer to the output parameters of the call it
+   belongs to and wakes that call up. Answers nobody is waiting for are dropped. */
+void {prefix}parse_answer(const void *buffer, size_t size_bytes){{
+	const unsigned char *{buffername} = (const unsigned char *)buffer;
+	int slot;{asyncDeclarations}
+	assert({prefix}get_answer_length(buffer, size_bytes).result == RPC_SUCCESS);
+	assert({prefix}get_answer_length(buffer, size_bytes).size <= size_bytes);
+{lock}	for (slot = 0; slot < {pendingCalls}; slot++){{
+		if ({prefix}pending_calls[slot].expected_answer == {buffername}[0] &&
+			{prefix}pending_calls[slot].correlation == {buffername}[1] &&
+			!{prefix}pending_calls[slot].answered)
+			break;
+	}}
+{statisticsCount}{asyncBranch}if (slot < {pendingCalls}){{
+		{buffername} += 2; /* skip ID and correlation byte */
+		switch ({prefix}pending_calls[slot].expected_answer){{ /* switch (answer ID) */ {cases}
+		}}
+		{prefix}pending_calls[slot].answered = 1;
+{wakeUp}	}}
+{unlock}{asyncCall}}}
+{cancelAsyncCalls}""".format(
+            cases="".join(f.getAnswerParseCase(
+                buffername, prefix + "pending_calls[slot].outputs") for f in functions).replace(
+                "\n\t\t", "\n\t\t\t"),
+            buffername=buffername,
+            lock=lock,
+            unlock=unlock,
+            prefix=prefix,
+            pendingCalls=pendingCalls,
+            asyncDeclarations="""
+	void (*complete)(const unsigned char *answer, void (*callback)(void), void *user_ctx) = NULL;
+	void (*callback)(void) = NULL;
+	void *user_ctx = NULL;""" if asyncFunctions else "",
+            asyncBranch="""	if (slot < {pendingCalls} && {prefix}pending_calls[slot].complete != NULL){{ /* asynchronous call */
+		complete = {prefix}pending_calls[slot].complete;
+		callback = {prefix}pending_calls[slot].callback;
+		user_ctx = {prefix}pending_calls[slot].user_ctx;
+		{prefix}pending_calls[slot].expected_answer = -1;{countCall}
+	}}
+	else """.format(
+                prefix=prefix,
+                pendingCalls=pendingCalls,
+                countCall="""
+		{prefix}count_call({buffername}[0] - 1, RPC_SUCCESS, {prefix}pending_calls[slot].start_time);""".format(
+                    prefix=prefix, buffername=buffername) if statisticsRequestID else "",
+            ) if asyncFunctions else "\t",
+            statisticsCount="""	if (slot < {pendingCalls})
+		{prefix}statistics[{buffername}[0] / 2].bytes_received += {prefix}get_answer_length(buffer, size_bytes).size;
+""".format(prefix=prefix, pendingCalls=pendingCalls, buffername=buffername) if statisticsRequestID else "",
+            asyncCall="""	if (complete != NULL) /* the callback may call {prefix}* functions */
+		complete({buffername} + 2, callback, user_ctx);
+""".format(prefix=prefix, buffername=buffername) if asyncFunctions else "",
+            cancelAsyncCalls=getCancelAsyncCalls() if asyncFunctions else "",
+            wakeUp="" if pollAnswers else
+            "\t\t{prefix}mutex_unlock((RPC_mutex_id)(RPC_mutex_answer + slot)); /* wake up the caller */\n".format(prefix=prefix),
+        )
+    return """
+/* This function writes the answer to the output parameters of the waiting
+   caller and wakes it up. Answers nobody is waiting for are dropped. */
+void {prefix}parse_answer(const void *buffer, size_t size_bytes){{
+	const unsigned char *{buffername} = (const unsigned char *)buffer;
+	assert({prefix}get_answer_length(buffer, size_bytes).result == RPC_SUCCESS);
+	assert({prefix}get_answer_length(buffer, size_bytes).size <= size_bytes);
+{lock}	if (*{buffername} == {prefix}expected_answer){{{statisticsCount}
+		switch (*{buffername}++){{ /* switch (answer ID) */ {cases}
+		}}
+		{prefix}expected_answer = -1;
+{wakeUp}	}}
+{unlock}}}
+""".format(
+        cases="".join(f.getAnswerParseCase(
+            buffername, prefix + "answer_outputs") for f in functions).replace(
+            "\n\t\t", "\n\t\t\t"),
+        buffername=buffername,
+        lock=lock,
+        unlock=unlock,
+        prefix=prefix,
+        statisticsCount="""
+		{prefix}statistics[*{buffername} / 2].bytes_received += {prefix}get_answer_length(buffer, size_bytes).size;""".format(
+            prefix=prefix, buffername=buffername) if statisticsRequestID else "",
+        wakeUp="" if pollAnswers else
+        "\t\t{prefix}mutex_unlock(RPC_mutex_answer); /* wake up the caller */\n".format(prefix=prefix),
+    )
+
+
+def getFramer(name, sizeFunction, parseFunction, contextParameter=""):
+    return """
+/* Collects the bytes of {name}s and parses every complete {name}. Complete
+   {name}s are parsed directly from {{data}}, only the bytes of an incomplete
+   {name} are copied to the buffer of the framer. */
+RPC_RESULT {prefix}feed_{name}s(RPC_FRAMER *framer, const void *data, size_t size_bytes{contextParameter}){{
+	const unsigned char *current = (const unsigned char *)data;
+	const unsigned char *end = current + size_bytes;
+	RPC_RESULT result = RPC_SUCCESS;
+	while (current < end){{
+		RPC_SIZE_RESULT size;
+		size_t count;
+		if (framer->skip > 0){{ /* drop the rest of a {name} that did not fit */
+			count = framer->skip < (size_t)(end - current) ? framer->skip : (size_t)(end - current);
+			framer->skip -= count;
+			current += count;
+			continue;
+		}}
+		if (framer->size == 0){{
+			size = {sizeFunction}(current, end - current);
+			if (size.result == RPC_SUCCESS){{
+				{parseFunction}(current, size.size{context});
+				current += size.size;
+				continue;
+			}}
+			if (size.result == RPC_COMMAND_UNKNOWN){{ /* look for the next {name} */
+				result = RPC_COMMAND_UNKNOWN;
+				current++;
+				continue;
+			}}
+			framer->required = size.size;
+		}}
+		if (framer->required > framer->buffer_size){{
+			result = RPC_FAILURE;
+			framer->skip = framer->required - framer->size;
+			framer->size = 0;
+			continue;
+		}}
+		count = framer->required - framer->size;
+		if (count > (size_t)(end - current))
+			count = end - current;
+		memcpy(framer->buffer + framer->size, current, count);
+		framer->size += count;
+		current += count;
+		if (framer->size < framer->required)
+			break;
+		size = {sizeFunction}(framer->buffer, framer->size);
+		if (size.result == RPC_COMMAND_INCOMPLETE){{
+			framer->required = size.size;
+			continue;
+		}}
+		if (size.result == RPC_SUCCESS)
+			{parseFunction}(framer->buffer, size.size{context});
+		else
+			result = RPC_COMMAND_UNKNOWN;
+		framer->size = 0;
 	}}
-	returnvalue.result = returnvalue.size > size_bytes ? RPC_COMMAND_INCOMPLETE : RPC_SUCCESS;
-	return returnvalue;
+	return result;
 }}
 """.format(
-        hash=getHash(),
-        cases="".join(f.getRequestSizeCase("current") for f in functions),
+        name=name,
         prefix=prefix,
-        network_include=join(parser_to_generic_path, prefix + "network.h"),
-        parser_include=join(parser_to_generic_path, prefix + "parser.h"),
-        parser_to_server_header_path=parser_to_server_header_path,
+        sizeFunction=sizeFunction,
+        parseFunction=parseFunction,
+        contextParameter=contextParameter,
+        context=", context" if contextParameter else "",
     )
 
 
-def getRequestParser(functions):
-    buffername = "current"
-    return """
-/* This function parses RPC requests, calls the original function and sends an
-   answer. */
-void {prefix}parse_request(const void *buffer, size_t size_bytes){{
-	(void)size_bytes;
-	const unsigned char *{buffername} = (const unsigned char *)buffer;
-	switch (*current++){{ /* switch (request ID) */ {cases}
-	}}
-}}""".format(
-        cases="".join(f.getRequestParseCase(buffername) for f in functions),
-        buffername=buffername,
+def getFramerDeclaration(name, parseFunction, contextParameter=""):
+    return """RPC_RESULT {prefix}feed_{name}s(RPC_FRAMER *framer, const void *data, size_t size_bytes{contextParameter});
+/* Feeds received bytes to a framer that has been initialized with
+   RPC_framer_init. The bytes may be any part of the stream, for example
+   everything a single read from the network returned. The framer keeps
+   incomplete {name}s until the rest arrives and calls {parseFunction}
+   for every complete {name}. A framer must only be fed by one thread.
+   Returns RPC_SUCCESS, RPC_COMMAND_UNKNOWN if bytes that do not start a known
+   {name} have been skipped or RPC_FAILURE if a {name} did not fit into the
+   buffer of the framer and has been dropped. */""".format(
+        name=name,
         prefix=prefix,
+        parseFunction=parseFunction,
+        contextParameter=contextParameter,
     )
 
 
-def getAnswerParser(functions):
-    result = """
-/* This function pushes the answers to the caller, doing all the necessary synchronization. */
-void {prefix}parse_answer(const void *buffer, size_t size_bytes){{
-	{prefix}buffer = (const unsigned char *)buffer;
-	assert({prefix}get_answer_length(buffer, size_bytes).result == RPC_SUCCESS);
-	assert({prefix}get_answer_length(buffer, size_bytes).size <= size_bytes);
-""".format(prefix=prefix)
-    if(multiThreadArchicture):
-        result += """
-	{prefix}mutex_unlock(RPC_mutex_answer);
-	{prefix}mutex_lock(RPC_mutex_in_caller);
-	{prefix}mutex_unlock(RPC_mutex_parsing_complete);
-	{prefix}mutex_lock(RPC_mutex_answer);
-	{prefix}mutex_lock(RPC_mutex_parsing_complete);
-	{prefix}mutex_unlock(RPC_mutex_in_caller);
+def getAnswerWait(mutex, answered):
+    # returns code of a single task client that waits for the answer and sets
+    # result to RPC_SUCCESS if it arrived, answered is the condition that is
+    # true once {prefix}parse_answer has written the output parameters
+    if pollAnswers:
+        return """		do{{ /* poll until {prefix}parse_answer has written the output parameters */
+			if ({answered}){{
+				result = RPC_SUCCESS;
+				break;
+			}}
+		}} while ({prefix}poll_answers() == RPC_SUCCESS);""".format(prefix=prefix, answered=answered)
+    return """		if ({prefix}mutex_lock_timeout({mutex})){{ /* Wait for answer to arrive */
+			/* {prefix}parse_answer has written the output parameters */
+			result = RPC_SUCCESS;
+		}}""".format(prefix=prefix, mutex=mutex)
+
+
+def getPollAnswers(useStaticBuffers):
+    # returns {prefix}poll_answers which feeds the bytes of {prefix}poll_receive
+    # to an answer framer, the framer of the static buffers if there is one
+    if useStaticBuffers:
+        framer = ""
+        feed = "{prefix}receive(received, polled.size)"
+    else:
+        framer = """
+/* Buffer of the answers {prefix}poll_answers collects, generated since
+   POLL_ANSWERS is set in the config. */
+static unsigned char {prefix}poll_buffer[{prefix}POLL_BUFFER_SIZE];
+static RPC_FRAMER {prefix}poll_framer = {{{prefix}poll_buffer, sizeof {prefix}poll_buffer, 0, 1, 0}};
+"""
+        feed = "{prefix}feed_answers(&{prefix}poll_framer, received, polled.size)"
+    return (framer + """
+RPC_RESULT {prefix}poll_answers(void){{
+	unsigned char received[{prefix}POLL_SIZE];
+	RPC_SIZE_RESULT polled = {prefix}poll_receive(received, sizeof received);
+	if (polled.result == RPC_SUCCESS && polled.size > 0)
+		""" + feed + """;
+	return polled.result;
 }}
-        """.format(prefix=prefix)
+""").format(prefix=prefix)
+
+
+def getAnswerMutexCode(operation):
+    # returns code that locks or unlocks the answer mutexes of all pending calls
+    if pollAnswers:
+        return ""
+    if pendingCalls:
+        return """	{{
+		int slot;
+		for (slot = 0; slot < {pendingCalls}; slot++)
+			{prefix}mutex_{operation}((RPC_mutex_id)(RPC_mutex_answer + slot));
+	}}""".format(prefix=prefix, operation=operation, pendingCalls=pendingCalls)
+    return "\t{prefix}mutex_{operation}(RPC_mutex_answer);".format(
+        prefix=prefix, operation=operation)
+
+
+def getCancelAsyncCalls():
+    if (multiThreadArchicture):
+        lock = "\t\t{prefix}mutex_lock(RPC_mutex_in_caller);\n".format(prefix=prefix)
+        unlock = "\t\t{prefix}mutex_unlock(RPC_mutex_in_caller);\n".format(prefix=prefix)
     else:
-        result += """
-	{prefix}mutex_unlock(RPC_mutex_answer);
+        lock = unlock = ""
+    return """
+void {prefix}cancel_async_calls(void){{
+	int slot;
+	for (slot = 0; slot < {pendingCalls}; slot++){{
+		void (*complete)(const unsigned char *answer, void (*callback)(void), void *user_ctx) = NULL;
+		void (*callback)(void) = NULL;
+		void *user_ctx = NULL;
+{lock}		if ({prefix}pending_calls[slot].expected_answer != -1 && {prefix}pending_calls[slot].complete != NULL){{
+			complete = {prefix}pending_calls[slot].complete;
+			callback = {prefix}pending_calls[slot].callback;
+			user_ctx = {prefix}pending_calls[slot].user_ctx;{countCall}
+			{prefix}pending_calls[slot].expected_answer = -1;
+		}}
+{unlock}		if (complete != NULL)
+			complete(NULL, callback, user_ctx);
+	}}
 }}
-        """.format(prefix=prefix)
-    return result
+""".format(
+        prefix=prefix,
+        pendingCalls=pendingCalls,
+        lock=lock,
+        unlock=unlock,
+        countCall="""
+			{prefix}count_call({prefix}pending_calls[slot].expected_answer - 1, RPC_FAILURE, {prefix}pending_calls[slot].start_time);""".format(
+            prefix=prefix) if statisticsRequestID else "",
+    )
 
 
 def getRPC_Parser_init():
-    if(multiThreadArchicture):
-        result = """
-    
-void {prefix}Parser_init(){{
-	if ({prefix}initialized)
-		return;
-	{prefix}initialized = 1;
-	{prefix}mutex_lock(RPC_mutex_parsing_complete);
-	{prefix}mutex_lock(RPC_mutex_answer);
-}}
-""" 
-    else:
-        result = """
+    result = """
 void {prefix}Parser_init(){{
 	if ({prefix}initialized)
 		return;
 	{prefix}initialized = 1;
-	{prefix}mutex_lock(RPC_mutex_answer);
+{lockAnswers}
 }}
-"""         
-    result = result.format(prefix=prefix)
+"""
+    result = result.format(
+        prefix=prefix,
+        lockAnswers=getAnswerMutexCode("lock"))
     return result;
 
 
 def getRPC_Parser_exit():
-    if(multiThreadArchicture):
-        result = """
+    result = """
 void {prefix}Parser_exit(){{
 	if (!{prefix}initialized)
 		return;
 	{prefix}initialized = 0;
-	{prefix}mutex_unlock(RPC_mutex_parsing_complete);
-	{prefix}mutex_unlock(RPC_mutex_answer);
+{unlockAnswers}
 }}
 """
-    else:
-        result = """
-void {prefix}Parser_exit(){{
-	if (!{prefix}initialized)
-		return;
-	{prefix}initialized = 0;
-	{prefix}mutex_unlock(RPC_mutex_answer);
-}}
-"""         
-    result = result.format(prefix=prefix)
+    result = result.format(
+        prefix=prefix,
+        unlockAnswers=getAnswerMutexCode("unlock"))
     return result;
 
 
 
+def getSizeTable(name, sizes):
+    # returns a table of the message sizes indexed by message ID, variable
+    # sized and unknown messages have the size 0
+    fixedSizes = dict((ID, size) for ID, size in sizes.items()
+                      if not isinstance(size, float))
+    maximum = max(fixedSizes.values()) if fixedSizes else 0
+    if maximum < 2**8:
+        tabletype = "uint8_t"
+    elif maximum < 2**16:
+        tabletype = "uint16_t"
+    else:
+        tabletype = "uint32_t"
+    rows = []
+    for rowstart in range(0, 256, 16):
+        rows.append("\t/* {start:3} */ {sizes},".format(
+            start=rowstart,
+            sizes=", ".join(str(fixedSizes.get(ID, 0))
+                            for ID in range(rowstart, rowstart + 16)),
+        ))
+    return """
+/* Sizes of the messages indexed by message ID. Unknown messages and messages
+   with a variable size have the size 0. */
+static const {tabletype} {name}[256] = {{
+{rows}
+}};
+""".format(
+        tabletype=tabletype,
+        name=name,
+        rows="\n".join(rows),
+    )
+
+
+def getVariableSizeCode(cases, unknownsizecode):
+    # returns the code that determines the size of messages that are not in
+    # the size table, cases are the switch cases of variable size messages
+    if cases == "":
+        return """
+{indention}returnvalue.result = RPC_COMMAND_UNKNOWN;
+{indention}return returnvalue;""".format(indention=2 * '\t')
+    return """
+		switch (*current){{ /* switch by message ID */{cases}
+			default:{unknownsizecode}
+				returnvalue.result = RPC_COMMAND_UNKNOWN;
+				return returnvalue;
+		}}""".format(cases=cases, unknownsizecode=unknownsizecode.replace("\n", "\n\t"))
+
+
 def getAnswerSizeChecker(functions):
-    return """/* Get (expected) size of (partial) answer. */
+    return """{sizetable}
+/* Get (expected) size of (partial) answer. */
 RPC_SIZE_RESULT {prefix}get_answer_length(const void *buffer, size_t size_bytes){{
 	RPC_SIZE_RESULT returnvalue = {{RPC_SUCCESS, 0}};
 	const unsigned char *current = (const unsigned char *)buffer;
@@ -1764,17 +4344,22 @@ RPC_SIZE_RESULT {prefix}get_answer_length(const void *buffer, size_t size_bytes)
 		returnvalue.size = 1;
 		return returnvalue;
 	}}
-	switch (*current){{
-{answercases}		default:
-			returnvalue.result = RPC_COMMAND_UNKNOWN;
-			return returnvalue;
+	returnvalue.size = {prefix}answer_size_table[*current];
+	if (returnvalue.size == 0){{ /* unknown or variable size answer */{sizecode}
 	}}
-	if (returnvalue.result != RPC_COMMAND_UNKNOWN)
-		returnvalue.result = returnvalue.size > size_bytes ? RPC_COMMAND_INCOMPLETE : RPC_SUCCESS;
+	returnvalue.result = returnvalue.size > size_bytes ? RPC_COMMAND_INCOMPLETE : RPC_SUCCESS;
 	return returnvalue;
 }}
 """.format(
-        answercases="".join(f.getAnswerSizeCase("current") for f in functions),
+        sizetable=getSizeTable(
+            prefix + "answer_size_table",
+            dict((f.ID * 2 + 1, f.getAnswerSize()) for f in functions
+                 if f.name not in functionNoAnswerList)),
+        sizecode=getVariableSizeCode(
+            "".join(f.getAnswerSizeCase("current") for f in functions
+                    if f.name not in functionNoAnswerList and
+                    isinstance(f.getAnswerSize(), float)),
+            ""),
         prefix=prefix,
     )
 
@@ -1791,13 +4376,21 @@ def getHashFunction():
                                     "start_command_id_out",
                                     Out=True),
             'parametername': "start_command_id_out"},
-        {'parameter': ArrayDatatype("1", getDatatype("uint16_t"), "version_out", Out=True), 'parametername': "version_out"}])
+        {'parameter': ArrayDatatype("1", getDatatype("uint16_t"), "version_out", Out=True), 'parametername': "version_out"}],
+        generated=True)
+
+
+def getStatisticsFunction():
+    return Function(statisticsRequestID // 2, getDatatype("void"), prefix + "get_statistics", [
+        {'parameter': getDatatype("uint8_t"), 'parametername': "request_id"},
+        {'parameter': ArrayDatatype("6", getDatatype("uint32_t"), "statistics_out", Out=True),
+            'parametername': "statistics_out"}],
+        generated=True)
 
 
-def generateCode(file, xml, parser_to_network_path,
+def generateCode(file, ast, xmlFunctions, parser_to_network_path,
                  parser_to_server_header_path):
     #ast = CppHeaderParser.CppHeader("""typedef enum EnumTest{Test} EnumTest;""",  argType='string')
-    ast = CppHeaderParser.CppHeader(file)
     # return None
     # checkDefines(ast.defines)
     setPredefinedDataTypes()
@@ -1807,7 +4400,7 @@ def generateCode(file, xml, parser_to_network_path,
         path = getIncludeFilePath(i)
         currentFile = path
         try:
-            iast = CppHeaderParser.CppHeader(path)
+            iast = parseHeader(path)
             setTypes(iast)
         except FileNotFoundError:
             print('Warning: #include file "{}" not found, skipping'.format(path))
@@ -1834,24 +4427,85 @@ def generateCode(file, xml, parser_to_network_path,
     for f in ast.functions:
         if not f["name"] in functionIgnoreList:
             functionlist.append(getFunction(f))
+    if statisticsRequestID:
+        functionlist.append(getStatisticsFunction())
+    assert maxPointerElements is not None or not any(
+        f.getRequestPointers() or f.getAnswerPointers() for f in functionlist), \
+        "Functions with pointers require #pragma RPC max_pointer_elements in the server header to bound the elements received"
+    global messageReserve
     rpcHeader = "\n".join(f.getDeclaration() for f in functionlist)
-    rpcImplementation = "\n".join(f.getDefinition() for f in functionlist)
+    messageReserve = clientMessageReserve
+    rpcImplementation = getAnswerState(functionlist)
+    if statisticsRequestID:
+        rpcImplementation += getClientStatistics(functionlist)
+    if batchRequestID:
+        rpcImplementation += getBatchFunctions()
+        rpcHeader += """
+
+void {prefix}batch_begin(void);
+/* Starts a batch. Until {prefix}batch_commit is called the requests of
+   functions that have been set to receive no answer are collected and sent
+   together in one message when {prefix}BATCH_SIZE bytes are used up or the
+   batch is committed. Any other request sends the collected requests first,
+   so the server receives all requests in the order of the calls.
+   The batch is shared by all threads: while it is open, requests of
+   functions without answer called by other threads are collected as well
+   and only sent when the batch fills up, another request is sent or the
+   thread that started the batch commits it. */
+
+RPC_RESULT {prefix}batch_commit(void);
+/* Sends the rest of the batch and ends it. Returns RPC_FAILURE if sending any
+   part of the batch failed. */
+""".format(prefix=prefix)
+    rpcImplementation += "\n".join(f.getDefinition() for f in functionlist)
+    if asyncFunctions:
+        rpcHeader += """
+
+/* Asynchronous variants of the functions above. They return as soon as the
+   request has been sent. The callback is called by {prefix}parse_answer with
+   the output parameters when the answer arrives and with RPC_FAILURE and NULL
+   output parameters when the call is cancelled by {prefix}cancel_async_calls.
+   The output parameters are only valid during the callback. If the request
+   cannot be sent RPC_FAILURE is returned and the callback is not called. */
+""".format(prefix=prefix) + "\n".join(
+            f.getAsyncDeclaration() for f in functionlist if f.name not in functionNoAnswerList) + """
+
+void {prefix}cancel_async_calls(void);
+/* Calls the callbacks of all asynchronous calls still waiting for their answers
+   with RPC_FAILURE. Use it after a timeout or when the connection is lost. */""".format(prefix=prefix)
+        rpcImplementation += "".join(f.getAsyncDefinition() for f in functionlist)
+    messageReserve = serverMessageReserve
     documentation = ""
     for f in functionlist:
         if f.name in functionIgnoreList:
             continue
-        entry = ET.SubElement(xml, "function")
-        f.getXml(entry)
+        xmlFunctions.append(f.getXmlFragment())
         documentation += "\n<hr>\n" + f.getDocumentation()
     from os.path import basename
+    messageSizes = getMessageSizes(functionlist)
+    statisticsDeclarations = getStatisticsDeclarations(
+        functionlist) if statisticsRequestID else ""
+    assert not (serverReentrant and serverStaticBuffers), \
+        "REENTRANT_PARSER cannot be combined with STATIC_MESSAGE_BUFFERS since the static buffers are shared by all requests"
+    assert not (serverReentrant and statisticsRequestID), \
+        "REENTRANT_PARSER cannot be combined with #pragma RPC statistics_id since the statistics of the server are not synchronized"
+    global messageContext
+    messageContext = "context" if serverReentrant else ""
     requestParserImplementation = externC_intro + '\n' + getSizeFunction(
         functionlist,
         basename(file),
         parser_to_network_path,
-        parser_to_server_header_path) + getRequestParser(functionlist) + externC_outro
+        parser_to_server_header_path) + (
+        getServerStatistics(functionlist) if statisticsRequestID else "") + getRequestParser(functionlist) + getFramer(
+            "request", prefix + "get_request_size", prefix + "parse_request", getContextParameter()) + (
+        getStaticBuffers(serverMessageReserve, prefix + "MAX_ANSWER_SIZE",
+                         prefix + "MAX_REQUEST_SIZE", "request") if serverStaticBuffers else "") + externC_outro
+    messageContext = ""
     answerSizeChecker = getAnswerSizeChecker(functionlist)
     answerParser = getAnswerParser(functionlist)
-    return rpcHeader, rpcImplementation, requestParserImplementation, answerParser, answerSizeChecker, documentation
+    if parseCacheDir is not None:
+        saveFragments(functionlist)
+    return rpcHeader, rpcImplementation, requestParserImplementation, answerParser, answerSizeChecker, messageSizes, statisticsDeclarations, documentation
 
 doNotModifyHeader = """/* This file has been automatically generated by RPC-Generator
    https://github.com/Crystal-Photonics/RPC-Generator
@@ -1918,60 +4572,85 @@ def getRPC_serviceHeader(
         ),)
 
 
-def getNetworkHeader():
-    return """
-/* ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-   IMPORTANT: The following functions must be implemented by YOU.
-   They are required for the RPC to work.
-   ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++*/
-
-{doNotModifyHeader}
-#ifndef {prefix}NETWORK_H
-#define {prefix}NETWORK_H
-
-#include "RPC_types.h"
-
-{externC_intro}
-void {prefix}message_start(size_t size);
+def getNetworkHeader(useMessageReserve, useStaticBuffers, useContext, usePolling, messageSizes, statisticsDeclarations, name):
+    contextParameter = "RPC_CONTEXT *context, " if useContext else ""
+    if useMessageReserve:
+        pushDeclaration = """unsigned char *{prefix}message_reserve({contextParameter}size_t size);
+/* Returns a pointer to {{size}} consecutive bytes of the message that has been
+   started with {prefix}message_start. The generated code writes the message
+   through this pointer instead of calling a function for every byte, so the
+   returned memory must stay valid until {prefix}message_commit is called.
+   {{size}} is always the size that has been passed to {prefix}message_start. */""".format(
+            prefix=prefix, contextParameter=contextParameter)
+    else:
+        pushDeclaration = """void {prefix}message_push_byte({contextParameter}unsigned char byte);
+/* Pushes a byte to be sent via network. You should put all the pushed bytes
+   into a buffer and send the buffer when {prefix}message_commit is called. If you run
+   out of buffer space you can send multiple partial messages as long as the
+   other side puts them back together. */""".format(
+            prefix=prefix, contextParameter=contextParameter)
+    messageDeclarations = """void {prefix}message_start({contextParameter}size_t size);
 /*  This function is called when a new message starts. {{size}} is the number of
     bytes the message will require. In the implementation you can allocate  a
     buffer or write a preamble. The implementation can be empty if you do not
     need to do that. */
 
-void {prefix}message_push_byte(unsigned char byte);
-/* Pushes a byte to be sent via network. You should put all the pushed bytes
-   into a buffer and send the buffer when {prefix}message_commit is called. If you run
-   out of buffer space you can send multiple partial messages as long as the
-   other side puts them back together. */
+{pushDeclaration}
 
-RPC_RESULT {prefix}message_commit(void);
+RPC_RESULT {prefix}message_commit({commitParameter});
 /* This function is called when a complete message has been pushed using
-   {prefix}message_push_byte. Now is a good time to send the buffer over the network,
+   {prefix}message_push_byte or written through {prefix}message_reserve.
+   Now is a good time to send the buffer over the network,
    even if the buffer is not full yet. You may also want to free the buffer that
    you may have allocated in the {prefix}message_start function.
    {prefix}message_commit should return RPC_SUCCESS if the buffer has been successfully
-   sent and RPC_FAILURE otherwise. */
-
+   sent and RPC_FAILURE otherwise. */{contextDescription}""".format(
+        prefix=prefix,
+        pushDeclaration=pushDeclaration,
+        contextParameter=contextParameter,
+        commitParameter="RPC_CONTEXT *context" if useContext else "void",
+        contextDescription="""
+
+/* {{context}} is the context that has been passed to {prefix}parse_request. Since
+   requests may be parsed by several threads at the same time, the answer of
+   each context must be collected separately and sent as a whole by
+   {prefix}message_commit. */""".format(prefix=prefix) if useContext else "",
+    )
+    if useStaticBuffers:
+        transmitDeclarations = """RPC_RESULT {prefix}send(const void *data, size_t size);
+/* Sends a complete message of {{size}} bytes over the network. The generated
+   {prefix}message_* functions collect messages in a buffer of the maximum
+   message size and call this function. It should return RPC_SUCCESS if the
+   message has been successfully sent and RPC_FAILURE otherwise. */""".format(prefix=prefix)
+        staticBufferDeclarations = """
+
+{messageDeclarations}
+
+RPC_RESULT {prefix}receive(const void *data, size_t size);
+/* Feeds received bytes to {prefix}feed_{name}s with a framer that uses a
+   buffer of the maximum message size. */""".format(
+            prefix=prefix,
+            messageDeclarations=messageDeclarations,
+            name=name,
+        )
+    else:
+        transmitDeclarations = messageDeclarations
+        staticBufferDeclarations = ""
+    return """
 /* ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-   You need to define 4 mutexes to implement the {prefix}mutex_* functions below.
-   See RPC_types.h for a definition of RPC_mutex_id.
+   IMPORTANT: The following functions must be implemented by YOU.
+   They are required for the RPC to work.
    ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++*/
 
-void {prefix}mutex_init(void);
-/* Initializes all rpc mutexes. */
-
-void {prefix}mutex_lock(RPC_mutex_id mutex_id);
-/* Locks the mutex. If it is already locked it yields until it can lock the mutex. */
-
-void {prefix}mutex_unlock(RPC_mutex_id mutex_id);
-/* Unlocks the mutex. The mutex is locked when the function is called. */
+{doNotModifyHeader}
+#ifndef {prefix}NETWORK_H
+#define {prefix}NETWORK_H
 
-char {prefix}mutex_lock_timeout(RPC_mutex_id mutex_id);
-/* Tries to lock a mutex. Returns 1 if the mutex was locked and 0 if a timeout
-   occured. The timeout length should be the time you want to wait for an answer
-   before giving up. If the time is infinite a lost answer will get the calling
-   thread stuck indefinitely. */
+#include "RPC_types.h"
 
+{externC_intro}{messageSizes}
+{transmitDeclarations}{clockDeclaration}
+{waitDeclarations}
 
 /* ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
    The following functions's implementations are automatically generated.
@@ -1997,11 +4676,15 @@ RPC_SIZE_RESULT {prefix}get_answer_length(const void *buffer, size_t size);
 void {prefix}parse_answer(const void *buffer, size_t size);
 /* This function parses answer received from the network. {{buffer}} points to the
    buffer that contains the received data and {{size}} contains the number of bytes
-   that have been received (NOT the size of the buffer!). This function will wake
-   up {prefix}*-functions below that are waiting for an answer.
+   that have been received (NOT the size of the buffer!). This function writes the
+   answer directly to the output parameters of the {prefix}*-function that is
+   waiting for it and wakes that function up. Answers no function is waiting for
+   are dropped. The buffer can be reused as soon as this function returns.
    Do not call this function with an incomplete message. Use {prefix}get_answer_length
    to make sure it is a complete message. */
 
+{framerDeclaration}{pollDeclaration}{staticBufferDeclarations}{statisticsDeclarations}
+
 
 {externC_outro}
 #endif /* {prefix}NETWORK_H */
@@ -2010,12 +4693,80 @@ void {prefix}parse_answer(const void *buffer, size_t size);
         externC_intro=externC_intro,
         externC_outro=externC_outro,
         prefix=prefix,
+        messageSizes=messageSizes,
+        transmitDeclarations=transmitDeclarations,
+        staticBufferDeclarations=staticBufferDeclarations,
+        statisticsDeclarations=statisticsDeclarations,
+        clockDeclaration="""
+
+uint32_t {prefix}clock(void);
+/* Returns the current time for the statistics of the calls, for example in
+   microseconds. The clock may wrap around at 2^32. */""".format(prefix=prefix) if statisticsRequestID else "",
+        framerDeclaration=getFramerDeclaration(
+            "answer", prefix + "parse_answer"),
+        waitDeclarations=("""
+/* ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   POLL_ANSWERS is set in the config, so the {prefix}* functions poll for
+   their answers with {prefix}poll_receive instead of waiting on mutexes.
+   ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++*/
+
+#ifndef {prefix}POLL_SIZE
+#define {prefix}POLL_SIZE 32 /* maximum number of bytes received by one {prefix}poll_receive */
+#endif
+#ifndef {prefix}POLL_BUFFER_SIZE
+#ifdef {prefix}MAX_ANSWER_SIZE
+#define {prefix}POLL_BUFFER_SIZE {prefix}MAX_ANSWER_SIZE /* size of the buffer of incomplete answers */
+#else
+#error "Define {prefix}POLL_BUFFER_SIZE, answers that do not fit are dropped"
+#endif
+#endif
+
+RPC_SIZE_RESULT {prefix}poll_receive(void *buffer, size_t size);
+/* Called in a loop by the {prefix}* functions while they wait for their answer.
+   Copies at most {{size}} received bytes to {{buffer}} and returns RPC_SUCCESS
+   with the number of copied bytes, which is 0 if nothing has arrived yet.
+   Return any other result, for example RPC_FAILURE after a timeout, to stop
+   waiting for the answer. The implementation should return as soon as it has
+   checked the receiver. */
+""" if usePolling else """
+/* ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   You need to define RPC_number_of_mutexes mutexes to implement the
+   {prefix}mutex_* functions below. See RPC_types.h for a definition of RPC_mutex_id.
+   ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++*/
+
+void {prefix}mutex_init(void);
+/* Initializes all rpc mutexes. */
+
+void {prefix}mutex_lock(RPC_mutex_id mutex_id);
+/* Locks the mutex. If it is already locked it yields until it can lock the mutex. */
+
+void {prefix}mutex_unlock(RPC_mutex_id mutex_id);
+/* Unlocks the mutex. The mutex is locked when the function is called. */
+
+char {prefix}mutex_lock_timeout(RPC_mutex_id mutex_id);
+/* Tries to lock a mutex. Returns 1 if the mutex was locked and 0 if a timeout
+   occured. The timeout length should be the time you want to wait for an answer
+   before giving up. If the time is infinite a lost answer will get the calling
+   thread stuck indefinitely. Late answers of earlier calls are dropped by
+   {prefix}parse_answer without unlocking the mutex, the caller keeps waiting
+   for its own answer for the rest of the timeout and never sends its
+   request again. Without #pragma RPC pending_calls a late answer of an
+   earlier call of the same function cannot be told apart from the expected
+   answer. */
+""").format(prefix=prefix),
+        pollDeclaration="""
+
+RPC_RESULT {prefix}poll_answers(void);
+/* Receives bytes with {prefix}poll_receive once and parses the complete answers
+   among them. The {prefix}* functions call it while they wait for their answer.
+   Call it from your main loop to receive the answers of asynchronous calls.
+   Returns the result of {prefix}poll_receive. */""".format(prefix=prefix) if usePolling else "",
     )
 
 
 def generateDocumentation(documentation, filename, headerpath):
-    import datetime
-    now = datetime.datetime.now()
+    # the documentation only depends on the inputs, the hash identifies them,
+    # so unchanged documentation is not written again
     return """
     <html>
         <head>
@@ -2034,9 +4785,6 @@ def generateDocumentation(documentation, filename, headerpath):
                 <tr>
                     <td class="static">Server Header File:</td><td><a href="../{headerpath}">{headerpath}</a></td>
                 </tr>
-                <tr>
-                    <td class="static">Date of Generation:</td><td>{date}</td>
-                </tr>
                 <tr>
                     <td class="static">Hash:</td><td>{hash}</td>
                 </tr>
@@ -2055,7 +4803,6 @@ def generateDocumentation(documentation, filename, headerpath):
 </html>""".format(
         documentation=documentation,
         filename=filename,
-        date=now.strftime("%Y-%m-%d %H:%M"),
         prefix=prefix,
         hash=rawhash,
         cmdidstart=start_command_id,
@@ -2161,6 +4908,92 @@ div.content table.declarations{
 """
 
 
+def getLoadStoreFunctions():
+    result = """/* Load and store integers in little endian byte order from and to
+   possibly unaligned message buffers. */"""
+    for bits in (16, 32, 64):
+        result += """
+static inline uint{bits}_t RPC_load_le{bits}(const unsigned char *source){{
+#if RPC_LITTLE_ENDIAN
+	uint{bits}_t value;
+	memcpy(&value, source, sizeof value);
+	return value;
+#else
+	return {load};
+#endif
+}}
+
+static inline void RPC_store_le{bits}(unsigned char *destination, uint{bits}_t value){{
+#if RPC_LITTLE_ENDIAN
+	memcpy(destination, &value, sizeof value);
+#else
+{store}
+#endif
+}}
+""".format(
+            bits=bits,
+            load=" |\n\t\t".join(
+                "(uint{bits}_t)source[{i}] << {shift}".format(
+                    bits=bits, i=i, shift=8 * i) if i else "(uint{bits}_t)source[0]".format(bits=bits)
+                for i in range(bits // 8)),
+            store="\n".join(
+                "\tdestination[{i}] = (unsigned char)(value >> {shift});".format(
+                    i=i, shift=8 * i) if i else "\tdestination[0] = (unsigned char)value;"
+                for i in range(bits // 8)),
+        )
+    return result
+
+
+def getVarintFunctions():
+    if not isVarintEncodingUsed():
+        return ""
+    result = """/* Store and load LEB128 varints with 7 bits per byte, least significant
+   bits first. The highest bit of a byte is set if more bytes follow. Signed
+   integers are zigzag encoded so small negative numbers stay short. */
+static inline size_t RPC_skip_varint(const unsigned char *buffer, size_t position, size_t size_bytes){
+	while (position < size_bytes){
+		if (!(buffer[position++] & 0x80))
+			return position;
+	}
+	return size_bytes + 1; /* more bytes are required */
+}
+"""
+    for bits in (16, 32, 64):
+        result += """
+static inline unsigned char *RPC_store_varint{bits}(unsigned char *destination, uint{bits}_t value){{
+	while (value >= 0x80){{
+		*destination++ = (unsigned char)(value | 0x80);
+		value >>= 7;
+	}}
+	*destination++ = (unsigned char)value;
+	return destination;
+}}
+
+static inline uint{bits}_t RPC_load_varint{bits}(const unsigned char **source){{
+	uint{bits}_t value = 0;
+	unsigned char shift = 0;
+	unsigned char byte;
+	do{{
+		byte = *(*source)++;
+		if (shift < {bits}){{
+			value |= (uint{bits}_t)(byte & 0x7F) << shift;
+			shift += 7;
+		}}
+	}}while (byte & 0x80);
+	return value;
+}}
+
+static inline uint{bits}_t RPC_zigzag_encode{bits}(int{bits}_t value){{
+	return (uint{bits}_t)(value < 0 ? ~((uint{bits}_t)value << 1) : (uint{bits}_t)value << 1);
+}}
+
+static inline int{bits}_t RPC_zigzag_decode{bits}(uint{bits}_t value){{
+	return (int{bits}_t)((int{bits}_t)(value >> 1) ^ -(int{bits}_t)(value & 1));
+}}
+""".format(bits=bits)
+    return result
+
+
 def getRpcTypesHeader():
     files = getFilePaths()
     return """{doNotModifyHeader}
@@ -2168,6 +5001,8 @@ def getRpcTypesHeader():
 #define RPC_TYPES_H
 
 #include <stddef.h>
+#include <stdint.h>
+#include <string.h>
 
 {extrainclude}
 
@@ -2177,21 +5012,65 @@ typedef struct {{
 	size_t size;
 }} RPC_SIZE_RESULT;
 
-typedef enum {{
+/* Integers and integer arrays are copied as they are instead of byte by byte
+   if the machine is little endian. Define RPC_LITTLE_ENDIAN to 1 or 0 yourself if
+   your compiler does not provide __BYTE_ORDER__. */
+#ifndef RPC_LITTLE_ENDIAN
+#if defined(__BYTE_ORDER__) && defined(__ORDER_LITTLE_ENDIAN__) && __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+#define RPC_LITTLE_ENDIAN 1
+#else
+#define RPC_LITTLE_ENDIAN 0
+#endif
+#endif
+
+{load_store}{varint}
+/* Collects received bytes of arbitrary size until they form complete messages,
+   see {prefix}feed_requests and {prefix}feed_answers. */
+typedef struct {{
+	unsigned char *buffer; /* bytes of the message that is not complete yet */
+	size_t buffer_size;
+	size_t size; /* number of bytes in buffer */
+	size_t required; /* number of bytes to collect before checking the message again */
+	size_t skip; /* number of bytes of a dropped message that are still to come */
+}} RPC_FRAMER;
+
+static inline void RPC_framer_init(RPC_FRAMER *framer, unsigned char *buffer, size_t buffer_size){{
+	framer->buffer = buffer;
+	framer->buffer_size = buffer_size;
+	framer->size = 0;
+	framer->required = 1;
+	framer->skip = 0;
+}}
+
+{statistics}{context}typedef enum {{
     RPC_mutex_parsing_complete,
     RPC_mutex_caller,
     RPC_mutex_in_caller,
-    RPC_mutex_answer,
+    RPC_mutex_answer,{pendingAnswerMutexes}
     RPC_MUTEX_COUNT
 }} RPC_mutex_id;
-#define RPC_number_of_mutexes 4
+#define RPC_number_of_mutexes {numberOfMutexes}
 
 #endif /* RPC_TYPES_H */
 """.format(
         doNotModifyHeader=doNotModifyHeader,
         rpc_enum=get_rpc_enum(),
         prefix=prefix,
-        extrainclude=files["EXTRA_INCLUDE_INTO_CLIENT_TYPES_H"]
+        extrainclude=files["EXTRA_INCLUDE_INTO_CLIENT_TYPES_H"],
+        load_store=getLoadStoreFunctions(),
+        varint=getVarintFunctions(),
+        statistics=getStatisticsType() if statisticsRequestID else "",
+        context="""/* Context of a request parsed by {prefix}parse_request of a server with
+   REENTRANT_PARSER=true in its config, see {prefix}parser.h. */
+typedef struct {{
+	void *user; /* for example the connection or the answer buffer of the request */
+	unsigned char reply_cancelled; /* set by {prefix}cancel_reply */
+}} RPC_CONTEXT;
+
+""".format(prefix=prefix) if serverReentrant else "",
+        pendingAnswerMutexes="".join(
+            "\n    RPC_mutex_answer_{},".format(slot) for slot in range(1, pendingCalls)),
+        numberOfMutexes=4 + max(0, pendingCalls - 1),
     )
 
 
@@ -2207,9 +5086,9 @@ def getRequestParserHeader():
    size is the expected number of bytes required to determine the correct size.*/
 RPC_SIZE_RESULT {prefix}get_request_size(const void *buffer, size_t size_bytes);
 
-/* This function parses RPC requests, calls the original function and sends an
-   answer. */
-void {prefix}parse_request(const void *buffer, size_t size_bytes);
+{parseRequestDeclaration}
+
+{framerDeclaration}
 
 /* If the requested function calls {prefix}cancel_reply() the reply is suppressed
 and the client will probably timeout*/
@@ -2221,250 +5100,363 @@ void {prefix}cancel_reply(void);
         externC_intro=externC_intro,
         externC_outro=externC_outro,
         prefix=prefix,
+        framerDeclaration=getFramerDeclaration(
+            "request", prefix + "parse_request", getContextParameter()),
+        parseRequestDeclaration="""/* This function parses RPC requests, calls the original function and sends an
+   answer. Several threads may parse requests at the same time, each with its
+   own context. The context is passed to the {prefix}message_* functions that
+   send the answer, so they can collect the answer of each request separately
+   and send it as a whole. */
+void {prefix}parse_request(const void *buffer, size_t size_bytes, RPC_CONTEXT *context);""".format(prefix=prefix) if serverReentrant else
+        """/* This function parses RPC requests, calls the original function and sends an
+   answer. */
+void {prefix}parse_request(const void *buffer, size_t size_bytes);""".format(prefix=prefix),
     )
 
-try:
-    root = ET.Element("RPC")
-    files = getFilePaths()
-    from os.path import join, split, relpath
-
-    root.set("prefix", prefix)
-    root.set("projectname", projectname)
-    root.set("version_number", str(version_number))
-    root.set("command_id_start", str(start_command_id))
-    root.set("hash", rawhash)
-
-    rpcHeader, rpcImplementation, requestParserImplementation, answerParser, answerSizeChecker, documentation = \
-        generateCode(
-            files["ServerHeader"], root, relpath(
-                files["SERVER_GENINCDIR"], files["SERVER_SRCDIR"]), relpath(
-                files["ServerHeader"], files["SERVER_SRCDIR"]))
-
-    for function in functionPredefinedIDs:
-        print(
-            "Warning: #pragma ID {function} {ID} was ignored since no function named {function} was declared".format(
-                function=function,
-                ID=functionPredefinedIDs[function] *
-                2))
-
-    requestParserImplementation = doNotModifyHeader + \
-        '\n' + requestParserImplementation
 
-    rpcImplementation = '''{doNotModify}
+def saveState():
+    # remembers the globals of this module before any protocol has been
+    # generated, see restoreState
+    from copy import deepcopy
+    from types import FunctionType, ModuleType
+    saveState.state = deepcopy({name: value for name, value in globals().items()
+                                if not name.startswith("__") and
+                                not isinstance(value, (FunctionType, ModuleType, type))})
+
+
+def restoreState():
+    # returns the globals and the results remembered by functions to the state
+    # before any protocol has been generated, so one process can generate
+    # several protocols one after another
+    from copy import deepcopy
+    from types import FunctionType
+    globals().update(deepcopy(saveState.state))
+    # the hash of the generator and the saved globals stay valid for every
+    # protocol
+    keep = {(loadFragments, "generator"), (saveState, "state")}
+    for function in list(globals().values()):
+        if isinstance(function, FunctionType):
+            for result in [name for name in vars(function) if not name.startswith("__")]:
+                if (function, result) not in keep:
+                    delattr(function, result)
+
+
+def generate(clientConfig, serverConfig):
+    # generates the client and the server of one protocol, returns the exit
+    # code
+    restoreState()
+    try:
+        root = ET.Element("RPC")
+        xmlFunctions = []
+        files = getFilePaths(clientConfig, serverConfig)
+        if files.get("Unchanged"):
+            print("Inputs unchanged since " + files["STAMP_FILE"] + " has been written, nothing to generate")
+            return 0
+
+        root.set("prefix", prefix)
+        root.set("projectname", projectname)
+        root.set("version_number", str(version_number))
+        root.set("command_id_start", str(start_command_id))
+        root.set("hash", rawhash)
+        root.set("correlation_byte", str(int(pendingCalls > 0)))
+        if batchRequestID:
+            root.set("batch_id", str(batchRequestID))
+
+        rpcHeader, rpcImplementation, requestParserImplementation, answerParser, answerSizeChecker, messageSizes, statisticsDeclarations, documentation = \
+            generateCode(
+                files["ServerHeader"], files["ServerAST"], xmlFunctions, relpath(
+                    files["SERVER_GENINCDIR"], files["SERVER_SRCDIR"]), relpath(
+                    files["ServerHeader"], files["SERVER_SRCDIR"]))
+
+        for function in functionPredefinedIDs:
+            print(
+                "Warning: #pragma ID {function} {ID} was ignored since no function named {function} was declared".format(
+                    function=function,
+                    ID=functionPredefinedIDs[function] *
+                    2))
+
+        requestParserImplementation = doNotModifyHeader + \
+            '\n' + requestParserImplementation
+
+        rpcImplementation = '''{doNotModify}
     {externC_intro}
 
 #include <stdint.h>
+#include <string.h>
 #include <assert.h>
 #include "{rpc_client_header}"
 #include "{network_include}"
 
-static const unsigned char *{prefix}buffer;
 static char {prefix}initialized;
 
 {implementation}{externC_outro}
     '''.format(
-        doNotModify=doNotModifyHeader,
-        rpc_client_header=join(
-            relpath(
-                files["CLIENT_SPCINCDIR"],
-                files["CLIENT_SRCDIR"]),
-            prefix +
-            files["ServerHeaderName"] +
-            '.h'),
-        implementation=rpcImplementation,
-        externC_outro=externC_outro,
-        externC_intro=externC_intro,
-        prefix=prefix,
-        network_include=join(
-            relpath(
-                files["CLIENT_GENINCDIR"],
-                files["CLIENT_SRCDIR"]),
-            prefix + 'network.h')
-    )
+            doNotModify=doNotModifyHeader,
+            rpc_client_header=join(
+                relpath(
+                    files["CLIENT_SPCINCDIR"],
+                    files["CLIENT_SRCDIR"]),
+                prefix +
+                files["ServerHeaderName"] +
+                '.h'),
+            implementation=rpcImplementation,
+            externC_outro=externC_outro,
+            externC_intro=externC_intro,
+            prefix=prefix,
+            network_include=join(
+                relpath(
+                    files["CLIENT_GENINCDIR"],
+                    files["CLIENT_SRCDIR"]),
+                prefix + 'network.h')
+        )
 
-    xml = ET.ElementTree()
-    xml._setroot(root)
-
-    dir_name_content = []
-    dir_name_content.append(("CLIENT_SPCINCDIR",
-                             files["ServerHeaderName"] + ".h",
-                             getRPC_serviceHeader(rpcHeader, prefix + files["ServerHeaderName"] + '_H',
-                                                  getTypeDeclarations(),
-                                                  join(relpath(files["CLIENT_GENINCDIR"],
-                                                               files["CLIENT_SPCINCDIR"]),
-                                                       "RPC_types.h"))))
-    dir_name_content.append(
-        ("CLIENT_GENINCDIR", "RPC_types.h", getRpcTypesHeader()))
-    dir_name_content.append(
-        ("CLIENT_GENINCDIR", "network.h", getNetworkHeader()))
-    clientcode = "".join((
-        rpcImplementation,
-        answerSizeChecker,
-        answerParser,
-        getRPC_Parser_init(),
-        getRPC_Parser_exit(),
-        externC_outro),
-    )
-    dir_name_content.append(
-        ("CLIENT_SRCDIR",
-         files["ServerHeaderName"] + ".c",
-         clientcode))
-    """
+        xmlContent = getXmlContent(root, xmlFunctions)
+
+        dir_name_content = []
+        dir_name_content.append(("CLIENT_SPCINCDIR",
+                                 files["ServerHeaderName"] + ".h",
+                                 getRPC_serviceHeader(rpcHeader, prefix + files["ServerHeaderName"] + '_H',
+                                                      getTypeDeclarations(),
+                                                      join(relpath(files["CLIENT_GENINCDIR"],
+                                                                   files["CLIENT_SPCINCDIR"]),
+                                                           "RPC_types.h"))))
+        dir_name_content.append(
+            ("CLIENT_GENINCDIR", "RPC_types.h", getRpcTypesHeader()))
+        dir_name_content.append(
+            ("CLIENT_GENINCDIR", "network.h", getNetworkHeader(
+                clientMessageReserve, clientStaticBuffers, False, pollAnswers, messageSizes, statisticsDeclarations, "answer")))
+        clientcode = "".join((
+            rpcImplementation,
+            answerSizeChecker,
+            answerParser,
+            getFramer("answer", prefix + "get_answer_length",
+                      prefix + "parse_answer"),
+            getStaticBuffers(clientMessageReserve, prefix + "MAX_REQUEST_SIZE",
+                             prefix + "MAX_ANSWER_SIZE", "answer") if clientStaticBuffers else "",
+            getPollAnswers(clientStaticBuffers) if pollAnswers else "",
+            getRPC_Parser_init(),
+            getRPC_Parser_exit(),
+            externC_outro),
+        )
+        dir_name_content.append(
+            ("CLIENT_SRCDIR",
+             files["ServerHeaderName"] + ".c",
+             clientcode))
+        """
         ("documentation", generateDocumentation(documentation, files["ServerHeaderFileName"])),
         ("style", getCss()),
     ]
     """
-    print("Writing client files relative to " +
-          files["CLIENT_CONFIG_PATH"] + ":")
-    for dir, name, content in dir_name_content:
-        filename = name if name.startswith("RPC_") else prefix + name
-        print(
-            "\t" +
-            relpath(
-                join(
-                    files[dir],
-                    filename),
-                files["CLIENT_CONFIG_PATH"]))
-        with open(join(files[dir], filename), "w") as f:
-            f.write(content)
-    if "CLIENT_DOCDIR" in files:
-        print(
-            "\t" +
-            relpath(
-                join(
-                    files["CLIENT_DOCDIR"],
-                    prefix +
-                    files["ServerHeaderName"] +
-                    ".html"),
-                files["CLIENT_CONFIG_PATH"]))
-        with open(join(files["CLIENT_DOCDIR"], prefix + files["ServerHeaderName"] + ".html"), "w") as f:
-            f.write(
+        print("Writing client files relative to " +
+              files["CLIENT_CONFIG_PATH"] + ":")
+        for dir, name, content in dir_name_content:
+            filename = name if name.startswith("RPC_") else prefix + name
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files[dir],
+                        filename),
+                    files["CLIENT_CONFIG_PATH"]))
+            writeFile(join(files[dir], filename), content)
+        if "CLIENT_DOCDIR" in files:
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files["CLIENT_DOCDIR"],
+                        prefix +
+                        files["ServerHeaderName"] +
+                        ".html"),
+                    files["CLIENT_CONFIG_PATH"]))
+            writeFile(
+                join(files["CLIENT_DOCDIR"], prefix + files["ServerHeaderName"] + ".html"),
                 generateDocumentation(
                     documentation,
                     files["ServerHeaderName"],
                     relpath(files["ServerHeader"], files["SERVER_CONFIG_PATH"])))
-        print(
-            "\t" +
-            relpath(
-                join(
-                    files["CLIENT_DOCDIR"],
-                    prefix +
-                    files["ServerHeaderName"] +
-                    ".css"),
-                files["CLIENT_CONFIG_PATH"]))
-        with open(join(files["CLIENT_DOCDIR"], prefix + files["ServerHeaderName"] + ".css"), "w") as f:
-            f.write(getCss())
-        print(
-            "\t" +
-            relpath(
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files["CLIENT_DOCDIR"],
+                        prefix +
+                        files["ServerHeaderName"] +
+                        ".css"),
+                    files["CLIENT_CONFIG_PATH"]))
+            writeFile(join(files["CLIENT_DOCDIR"], prefix + files["ServerHeaderName"] + ".css"), getCss())
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files["CLIENT_DOCDIR"],
+                        prefix +
+                        files["ServerHeaderName"] +
+                        ".xml"),
+                    files["CLIENT_CONFIG_PATH"]))
+            writeFile(
                 join(
                     files["CLIENT_DOCDIR"],
                     prefix +
                     files["ServerHeaderName"] +
                     ".xml"),
-                files["CLIENT_CONFIG_PATH"]))
-        xml.write(
-            join(
-                files["CLIENT_DOCDIR"],
-                prefix +
-                files["ServerHeaderName"] +
-                ".xml"),
-            encoding="UTF-8",
-            xml_declaration=True)
-        try:
-            makedirs(join(files["CLIENT_DOCDIR"], projectname, prefix))
-        except:
-            pass
-        xml.write(
-            join(
-                files["CLIENT_DOCDIR"],
-                projectname,
-                prefix,
-                rawhash + ".xml"),
-            encoding="UTF-8",
-            xml_declaration=True)
-
-    dir_name_content = []
-    dir_name_content.append(
-        ("SERVER_GENINCDIR", "RPC_types.h", getRpcTypesHeader()))
-    dir_name_content.append(
-        ("SERVER_GENINCDIR", "network.h", getNetworkHeader()))
-    dir_name_content.append(
-        ("SERVER_GENINCDIR",
-         "parser.h",
-         getRequestParserHeader()))
-    dir_name_content.append(
-        ("SERVER_SRCDIR", "parser.c", requestParserImplementation))
-    print("Writing server files relative to " +
-          files["SERVER_CONFIG_PATH"] + ":")
-    for dir, name, content in dir_name_content:
-        filename = name if name.startswith("RPC_") else prefix + name
-        print(
-            "\t" +
-            relpath(
-                join(
-                    files[dir],
-                    filename),
-                files["SERVER_CONFIG_PATH"]))
-        with open(join(files[dir], filename), "w") as f:
-            f.write(content)
-    if "SERVER_DOCDIR" in files:
-        print(
-            "\t" +
-            relpath(
+                xmlContent)
+            try:
+                makedirs(join(files["CLIENT_DOCDIR"], projectname, prefix))
+            except:
+                pass
+            writeFile(
                 join(
-                    files["SERVER_DOCDIR"],
-                    prefix +
-                    files["ServerHeaderName"] +
-                    ".html"),
-                files["SERVER_CONFIG_PATH"]))
-        with open(join(files["SERVER_DOCDIR"], prefix + files["ServerHeaderName"] + ".html"), "w") as f:
-            f.write(
+                    files["CLIENT_DOCDIR"],
+                    projectname,
+                    prefix,
+                    rawhash + ".xml"),
+                xmlContent)
+
+        dir_name_content = []
+        dir_name_content.append(
+            ("SERVER_GENINCDIR", "RPC_types.h", getRpcTypesHeader()))
+        dir_name_content.append(
+            ("SERVER_GENINCDIR", "network.h", getNetworkHeader(
+                serverMessageReserve, serverStaticBuffers, serverReentrant, False, messageSizes, statisticsDeclarations, "request")))
+        dir_name_content.append(
+            ("SERVER_GENINCDIR",
+             "parser.h",
+             getRequestParserHeader()))
+        dir_name_content.append(
+            ("SERVER_SRCDIR", "parser.c", requestParserImplementation))
+        print("Writing server files relative to " +
+              files["SERVER_CONFIG_PATH"] + ":")
+        for dir, name, content in dir_name_content:
+            filename = name if name.startswith("RPC_") else prefix + name
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files[dir],
+                        filename),
+                    files["SERVER_CONFIG_PATH"]))
+            writeFile(join(files[dir], filename), content)
+        if "SERVER_DOCDIR" in files:
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files["SERVER_DOCDIR"],
+                        prefix +
+                        files["ServerHeaderName"] +
+                        ".html"),
+                    files["SERVER_CONFIG_PATH"]))
+            writeFile(
+                join(files["SERVER_DOCDIR"], prefix + files["ServerHeaderName"] + ".html"),
                 generateDocumentation(
                     documentation,
                     files["ServerHeaderName"],
                     relpath(files["ServerHeader"], files["SERVER_CONFIG_PATH"])))
-        print(
-            "\t" +
-            relpath(
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files["SERVER_DOCDIR"],
+                        prefix +
+                        files["ServerHeaderName"] +
+                        ".css"),
+                    files["SERVER_CONFIG_PATH"]))
+            writeFile(join(files["SERVER_DOCDIR"], prefix + files["ServerHeaderName"] + ".css"), getCss())
+            print(
+                "\t" +
+                relpath(
+                    join(
+                        files["SERVER_DOCDIR"],
+                        prefix +
+                        files["ServerHeaderName"] +
+                        ".xml"),
+                    files["SERVER_CONFIG_PATH"]))
+            writeFile(
                 join(
                     files["SERVER_DOCDIR"],
                     prefix +
                     files["ServerHeaderName"] +
-                    ".css"),
-                files["SERVER_CONFIG_PATH"]))
-        with open(join(files["SERVER_DOCDIR"], prefix + files["ServerHeaderName"] + ".css"), "w") as f:
-            f.write(getCss())
-        print(
-            "\t" +
-            relpath(
+                    ".xml"),
+                xmlContent)
+            try:
+                makedirs(join(files["SERVER_DOCDIR"], projectname, prefix))
+            except:
+                pass
+            writeFile(
                 join(
                     files["SERVER_DOCDIR"],
-                    prefix +
-                    files["ServerHeaderName"] +
-                    ".xml"),
-                files["SERVER_CONFIG_PATH"]))
-        xml.write(
-            join(
-                files["SERVER_DOCDIR"],
-                prefix +
-                files["ServerHeaderName"] +
-                ".xml"),
-            encoding="UTF-8",
-            xml_declaration=True)
-        try:
-            makedirs(join(files["SERVER_DOCDIR"], projectname, prefix))
-        except:
-            pass
-        xml.write(
-            join(
-                files["SERVER_DOCDIR"],
-                projectname,
-                prefix,
-                rawhash + ".xml"),
-            encoding="UTF-8",
-            xml_declaration=True)
-except:
-    import traceback
-    traceback.print_exc(0)
-    exit(-1)
+                    projectname,
+                    prefix,
+                    rawhash + ".xml"),
+                xmlContent)
+        if "STAMP_FILE" in files:
+            writeStamp(files["STAMP_FILE"], files["Inputs"], generatedFiles)
+    except:
+        import traceback
+        traceback.print_exc(0)
+        return -1
+    return 0
+
+
+def getConfigPairs(args):
+    # returns the pairs of client and server config files given on the command
+    # line and in the manifests
+    from shlex import split as splitLine
+    from os.path import abspath, dirname, join
+    pairs = list(zip(args.Configs[0::2], args.Configs[1::2]))
+    for manifest in args.manifest:
+        with open(manifest, "r") as f:
+            for line in f:
+                configs = splitLine(line, comments=True)
+                if not configs:
+                    continue
+                assert len(configs) == 2, "Error in \"" + manifest + \
+                    "\": Expected a client and a server config file per line, got " + line
+                pairs.append(tuple(join(dirname(manifest), c) for c in configs))
+    # generating a protocol changes the working directory
+    return [tuple(abspath(c) for c in pair) for pair in pairs]
+
+
+def main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument(
+        "Configs",
+        help="Configuration files for the client and the server, several protocols are generated by repeating the pair",
+        nargs="*",
+        type=str)
+    parser.add_argument(
+        "--manifest",
+        help="File that lists the configuration files for the client and the server of a protocol per line, relative to the file",
+        action="append",
+        default=[],
+        type=str)
+    parser.add_argument(
+        "--jobs",
+        help="Number of protocols to generate at the same time, the number of CPUs by default",
+        type=int)
+    args = parser.parse_args()
+    if len(args.Configs) % 2:
+        parser.error("the configuration files must be given in pairs of client and server config")
+    pairs = getConfigPairs(args)
+    if not pairs:
+        parser.error("no configuration files given")
+    if len(pairs) == 1 or args.jobs == 1:
+        exit(-1 if any([generate(*pair) for pair in pairs]) else 0)
+    # each worker generates several protocols, generate restores the globals
+    # of this module before each of them. Workers that are spawned instead of
+    # forked, such as on Windows, start a new interpreter and import
+    # CppHeaderParser, which takes about half as long as generating a small
+    # protocol, so that is only done once per worker
+    from multiprocessing import get_context, get_all_start_methods
+    context = get_context(
+        "fork" if "fork" in get_all_start_methods() else "spawn")
+    with context.Pool(args.jobs) as pool:
+        results = pool.starmap(generate, pairs, chunksize=1)
+    exit(-1 if any(results) else 0)
+
+
+saveState()
+if __name__ == "__main__":
+    main()
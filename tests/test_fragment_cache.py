@@ -0,0 +1,78 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+generator = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RPC-gen.py")
+
+header = """#include <stdint.h>
+
+typedef struct {{
+	uint8_t ia[{size}];
+	int32_t n;
+}} S;
+
+void structTest(S s_in[1]);
+void simpleTest(int32_t {name});
+"""
+
+serverConfig = """[configuration]
+SOURCEHEADER=./Server.h
+SRCDIR=./RPC/src
+GENINCDIR=./RPC/include
+PARSE_CACHE_DIR=./cache
+"""
+
+clientConfig = """[configuration]
+SRCDIR=./RPC/src
+GENINCDIR=./RPC/generic_include
+SPCINCDIR=./RPC/specific_include
+"""
+
+
+class FragmentCacheTest(unittest.TestCase):
+    # edits to the header between runs with PARSE_CACHE_DIR must give the
+    # same code as a run without cached fragments
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for d, name, content in (("Server", "rpc.cfg", serverConfig), ("Client", "rpc.cfg", clientConfig)):
+            os.makedirs(os.path.join(self.directory, d))
+            with open(os.path.join(self.directory, d, name), "w") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def generate(self, size, name):
+        with open(os.path.join(self.directory, "Server", "Server.h"), "w") as f:
+            f.write(header.format(size=size, name=name))
+        subprocess.check_call(
+            [sys.executable, generator,
+             os.path.join(self.directory, "Client", "rpc.cfg"),
+             os.path.join(self.directory, "Server", "rpc.cfg")],
+            stdout=subprocess.DEVNULL)
+        output = {}
+        for d in ("Client", "Server"):
+            for root, dirs, files in os.walk(os.path.join(self.directory, d, "RPC")):
+                for fn in files:
+                    with open(os.path.join(root, fn)) as f:
+                        output[os.path.join(root, fn)] = f.read()
+        return output
+
+    def test_edited_struct_member_and_parameter_name(self):
+        self.generate(42, "i")
+        cached = self.generate(40, "k")
+        shutil.rmtree(os.path.join(self.directory, "Server", "cache"))
+        uncached = self.generate(40, "k")
+        self.assertEqual(cached, uncached)
+        client = "".join(cached.values())
+        self.assertIn("simpleTest(int32_t k)", client)
+        self.assertIn("uint8_t ia[40]", client)
+        self.assertNotIn("uint8_t ia[42]", client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+generator = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RPC-gen.py")
+
+header = """#include <stdint.h>
+
+#pragma RPC encoding packed
+#pragma RPC max_pointer_elements 8
+
+#pragma pack(push, 1)
+typedef struct {
+	uint16_t id;
+	int32_t value;
+	uint8_t tags[3];
+} PackedRecord;
+#pragma pack(pop)
+
+#pragma RPC zerocopy zerocopyTest
+int32_t zerocopyTest(const PackedRecord records_in[4], const PackedRecord *more_in, uint16_t more_in_size);
+"""
+
+serverConfig = """[configuration]
+SOURCEHEADER=./Server.h
+SRCDIR=./RPC/src
+GENINCDIR=./RPC/include
+"""
+
+clientConfig = """[configuration]
+SRCDIR=./RPC/src
+GENINCDIR=./RPC/generic_include
+SPCINCDIR=./RPC/specific_include
+"""
+
+
+@unittest.skipIf(shutil.which("gcc") is None, "requires gcc")
+class ZerocopyLayoutTest(unittest.TestCase):
+    # the layout of a struct used by several zerocopy parameters must only be
+    # checked once, also when an encoding copies the datatypes
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for d, name, content in (("Server", "rpc.cfg", serverConfig), ("Client", "rpc.cfg", clientConfig),
+                                 ("Server", "Server.h", header)):
+            os.makedirs(os.path.join(self.directory, d), exist_ok=True)
+            with open(os.path.join(self.directory, d, name), "w") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_packed_encoding_with_struct_in_two_parameters(self):
+        subprocess.check_call(
+            [sys.executable, generator,
+             os.path.join(self.directory, "Client", "rpc.cfg"),
+             os.path.join(self.directory, "Server", "rpc.cfg")],
+            stdout=subprocess.DEVNULL)
+        source = os.path.join(self.directory, "Server", "RPC", "src", "RPC_parser.c")
+        with open(source) as f:
+            self.assertEqual(f.read().count("} RPC_PackedRecord_alignment;"), 1)
+        subprocess.check_call(["gcc", "-std=c11", "-Wno-unknown-pragmas", "-fsyntax-only", source])
+
+
+if __name__ == "__main__":
+    unittest.main()